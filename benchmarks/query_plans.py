@@ -0,0 +1,463 @@
+"""Query-plan regression benchmark for the canned SQL in Database and the
+UI's ad-hoc queries.
+
+Seeds a scratch database (never the configured one) with synthetic
+experiments at several sizes, runs EXPLAIN (ANALYZE, BUFFERS) on every
+Database.COMMAND_* and UI query, and reports latency, buffer usage and
+sequential scans. Results are compared with a stored baseline, flagging
+queries that got slower; the exit status is 1 if any did.
+
+    python -m benchmarks.query_plans --sizes 1000 10000 100000
+    python -m benchmarks.query_plans --save-baseline
+
+The scratch database is created on the configured server if need be, and
+brought up to the latest schema version with the migrations, so the plans
+reflect the indexes a migrated database has.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+from collections import namedtuple
+
+from psycopg2 import connect, Error as PsycopgError
+
+from mldb.config import CONFIG
+from mldb.database import Database
+from mldb.database.migrations import migrate
+from mldb.database.mirror import COMMAND_GET_DELETIONS, MIRROR_TABLES
+from mldb.database.search import search_query
+from mldb.database.partitions import partition
+from mldb.database.schema import TABLES
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "query_plans_baseline.json")
+
+# sample experiment read by the lookups; writes go to an experiment that
+# doesn't exist yet, so they don't trip over unique constraints
+EXPID = "bench_{:07d}"
+NEW_EXPID = "bench_new"
+
+LOSS_KINDS = ["train", "valid"]
+METRIC_KINDS = [
+    "metrics.valid.MSE",
+    "metrics.valid.R2",
+    "metrics.test.MSE",
+    "metrics.test.R2",
+]
+PLOTIDS = ["plot0", "plot1"]
+N_GROUPS = 100
+
+# The sample experiment with the integer keys the fact tables refer to it by
+# (see Sample.resolve); `keys` maps kinds and plot ids to theirs.
+Sample = namedtuple("Sample", "expid expids exp_key exp_keys new_key keys")
+
+# Example arguments for each command, as a function of the Sample.
+# Commands missing from here (and from SKIPPED) are reported, so new ones get added.
+ARGS = dict(
+    COMMAND_SET_STATUS=lambda s: (NEW_EXPID, "TRAINING"),
+    COMMAND_GET_STATUS=lambda s: (s.expid,),
+    COMMAND_ADD_LOSS=lambda s: (s.new_key, s.keys["train"], 0, 0.5),
+    COMMAND_GET_LOSSES=lambda s: (s.exp_key,),
+    COMMAND_ADD_HYPERPARAM=lambda s: (NEW_EXPID, "lr", "0.01"),
+    COMMAND_GET_HYPERPARAMS=lambda s: (s.expid,),
+    COMMAND_ADD_METRICS=lambda s: (s.new_key, s.keys[METRIC_KINDS[0]], 0, 0.5),
+    COMMAND_GET_LATEST_METRICS=lambda s: (s.exp_key,),
+    COMMAND_SET_CONFIG=lambda s: (NEW_EXPID, "{}"),
+    COMMAND_ADD_STATE=lambda s: (s.new_key, 0, "state.pth"),
+    COMMAND_GET_STATE=lambda s: (s.exp_key, 0),
+    COMMAND_GET_EXPERIMENT_DETAILS=lambda s: (s.expid,),
+    COMMAND_ADD_LR=lambda s: (s.new_key, 0, 0.01),
+    COMMAND_GET_LRS=lambda s: (s.exp_key,),
+    COMMAND_ADD_QUALRESMETA=lambda s: (NEW_EXPID, "plot0", "{}"),
+    COMMAND_ADD_QUALRES=lambda s: (s.new_key, 0, s.keys["plot0"], "{}"),
+    COMMAND_GET_QUALRES=lambda s: (s.exp_key, s.keys["plot0"]),
+    COMMAND_ADD_QUALRES_ARRAYS=lambda s: (s.new_key, 0, s.keys["plot0"], b"\x00"),
+    COMMAND_GET_QUALRES_ARRAYS=lambda s: (s.exp_key, s.keys["plot0"]),
+    COMMAND_GET_QUALRES_PLOTIDS=lambda s: (s.exp_key, s.exp_key),
+    COMMAND_GET_QUALRESMETA=lambda s: (s.expid, "plot0"),
+    COMMAND_ADD_TO_GROUP=lambda s: (NEW_EXPID, "group_0"),
+    COMMAND_REMOVE_FROM_GROUP=lambda s: (s.expid, "group_0"),
+    COMMAND_GET_GROUP=lambda s: ("group_0",),
+    COMMAND_GET_GROUPS_OF_EXP=lambda s: (s.expid,),
+    COMMAND_GET_COLD_PATH=lambda s: (s.exp_key,),
+    COMMAND_GET_COLD_PATHS_MANY=lambda s: (s.exp_keys,),
+    COMMAND_SET_COLD_PATH=lambda s: (s.new_key, "cold/path"),
+    COMMAND_GET_COLD_CANDIDATES=lambda s: (30,),
+    COMMAND_DELETE_EXPERIMENTS=lambda s: (s.expids,),
+    COMMAND_DELETE_EXPERIMENTS_BY_KEY=lambda s: (s.exp_keys,),
+    COMMAND_LOG_DELETIONS=lambda s: ([NEW_EXPID],),
+    COMMAND_GET_STATUS_MANY=lambda s: (s.expids,),
+    COMMAND_GET_LOSSES_MANY=lambda s: (s.exp_keys,),
+    COMMAND_GET_LRS_MANY=lambda s: (s.exp_keys,),
+    COMMAND_GET_HYPERPARAMS_MANY=lambda s: (s.expids,),
+    COMMAND_GET_LATEST_METRICS_MANY=lambda s: (s.exp_keys,),
+    COMMAND_GET_GROUPS_MANY=lambda s: (s.expids,),
+    COMMAND_GET_GROUPS_OF_MANY_EXPS=lambda s: (s.expids,),
+    COMMAND_ADD_STEP=lambda s: (
+        s.new_key,
+        s.keys["train"],
+        0,
+        0.5,
+        "2024-01-01T00:00:00Z",
+    ),
+    COMMAND_GET_STEPS=lambda s: (s.exp_key,),
+    COMMAND_GET_STEPS_OF_KIND=lambda s: (s.exp_key, s.keys["train"]),
+    COMMAND_GET_LOSS_COLUMNS=lambda s: (s.exp_key,),
+    COMMAND_GET_METRIC_HISTORY=lambda s: (s.exp_key,),
+    COMMAND_GET_METRIC_HISTORY_OF_KIND=lambda s: (
+        s.exp_key,
+        s.keys[METRIC_KINDS[0]],
+    ),
+)
+
+# templates and multi-row inserts, which can't be explained as they stand
+SKIPPED = {
+    "COMMAND_ADD_LOSS_MANY",
+    "COMMAND_ADD_HYPERPARAM_MANY",
+    "COMMAND_ADD_METRICS_MANY",
+    "COMMAND_ADD_LR_MANY",
+    "COMMAND_ADD_STEP_MANY",
+    "COMMAND_CREATE_BULK_STAGING",
+    "COMMAND_COPY_CSV",
+    "COMMAND_INSERT_FROM_STAGING",
+    "COMMAND_GET_STATUS_PAGE",
+    "COMMAND_GET_STATUS_PAGE_OF",
+}
+
+# The UI's own queries, as (name, query, args, expect_full_scan). Listing every
+# experiment or group reads the whole table, so a sequential scan is expected.
+UI_QUERIES = [
+    (
+        "exp_list.latest",
+        "SELECT * FROM STATUS ORDER BY EXPID DESC LIMIT 100;",
+        (),
+        False,
+    ),
+    ("exp_list.all", "SELECT * FROM STATUS ORDER BY EXPID DESC;", (), True),
+    (
+        "exp_list.training",
+        "SELECT * FROM STATUS WHERE STATUS='TRAINING' ORDER BY EXPID DESC;",
+        (),
+        False,
+    ),
+    ("exp_list.search", *search_query("group_1 !lost"), True),
+    ("web.api_page", *Database.status_page_query(after="{expid}"), False),
+    (
+        "web.api_page_of_statuses",
+        *Database.status_page_query(["TRAINING", "ERROR"], after="{expid}"),
+        False,
+    ),
+    ("exp_list.groups", "SELECT EXPID, GROUPNAME FROM EXPGROUPS;", (), True),
+    (
+        "exp_list.group_members",
+        "SELECT STATUS.EXPID, STATUS.STATUS FROM STATUS INNER JOIN EXPGROUPS ON STATUS.EXPID = EXPGROUPS.EXPID WHERE GROUPNAME=%s;",
+        ("group_0",),
+        False,
+    ),
+    ("model_list.all", "SELECT * FROM STATUS;", (), True),
+    (
+        "model_list.model",
+        "SELECT * FROM STATUS WHERE EXPID LIKE %s;",
+        ("%bench_00001%",),
+        False,
+    ),
+    ("config_view", "SELECT * FROM CONFIG WHERE EXPID=%s;", ("{expid}",), False),
+    # a mirror's sync, with nothing new since its watermark
+    ("mirror.deletions", COMMAND_GET_DELETIONS, (str(2**62),), False),
+] + [
+    (
+        f"mirror.{table}",
+        f"SELECT {columns} FROM {source} WHERE SEQ > %s;",
+        (str(2**62),),
+        False,
+    )
+    for table, (_, columns, source) in MIRROR_TABLES.items()
+]
+
+# Synthetic data for n experiments, each with `epochs` epochs: the key
+# registries first, then one statement per table.
+SEED = [
+    "INSERT INTO STATUS (EXPID, STATUS) SELECT format('bench_%%s', lpad(i::text, 7, '0')), "
+    "CASE WHEN i %% 50 = 0 THEN 'TRAINING' ELSE 'COMPLETE' END FROM generate_series(0, %(n)s - 1) i;",
+    "INSERT INTO EXPERIMENTS (EXPID) SELECT EXPID FROM STATUS ORDER BY EXPID;",
+    "INSERT INTO EXPERIMENTS (EXPID) VALUES (%(new_expid)s);",
+    "INSERT INTO KINDS (KIND) SELECT unnest(%(loss_kinds)s || %(metric_kinds)s);",
+    "INSERT INTO PLOTS (PLOTID) SELECT unnest(%(plotids)s || ARRAY['arrays']);",
+    "INSERT INTO CONFIG (EXPID, CONFIG) SELECT EXPID, '{}' FROM STATUS;",
+    "INSERT INTO HYPERPARAMS (EXPID, NAME, VALUE) SELECT EXPID, name, (random() * 10)::text "
+    "FROM STATUS, unnest(ARRAY['lr', 'batch_size', 'n_epochs', 'dropout', 'seed']) name;",
+    "INSERT INTO LOSS (EXPKEY, EPOCH, KINDKEY, VALUE) SELECT EXPKEY, epoch, KINDKEY, random() "
+    "FROM STATUS JOIN EXPERIMENTS USING (EXPID), generate_series(0, %(epochs)s - 1) epoch, KINDS "
+    "WHERE KIND = ANY(%(loss_kinds)s);",
+    "INSERT INTO METRICS (EXPKEY, EPOCH, KINDKEY, VALUE) SELECT EXPKEY, epoch, KINDKEY, random() "
+    "FROM STATUS JOIN EXPERIMENTS USING (EXPID), generate_series(0, %(epochs)s - 1, 5) epoch, KINDS "
+    "WHERE KIND = ANY(%(metric_kinds)s);",
+    "INSERT INTO LEARNINGRATE (EXPKEY, EPOCH, VALUE) SELECT EXPKEY, epoch, 0.01 * 0.9 ^ epoch "
+    "FROM STATUS JOIN EXPERIMENTS USING (EXPID), generate_series(0, %(epochs)s - 1) epoch;",
+    "INSERT INTO STATE (EXPKEY, EPOCH, PATH) SELECT EXPKEY, %(epochs)s - 1, EXPID || '/state.pth' "
+    "FROM STATUS JOIN EXPERIMENTS USING (EXPID);",
+    "INSERT INTO QUALITATIVERESULTSMETA (EXPID, PLOTID, VALUE) SELECT EXPID, plotid, '{}' "
+    "FROM STATUS, unnest(%(plotids)s) plotid;",
+    "INSERT INTO QUALITATIVERESULTS (EXPKEY, EPOCH, PLOTKEY, VALUE) SELECT EXPKEY, %(epochs)s - 1, PLOTKEY, "
+    "repeat('[0.5, 0.5], ', 50) FROM STATUS JOIN EXPERIMENTS USING (EXPID), PLOTS "
+    "WHERE PLOTID = ANY(%(plotids)s);",
+    "INSERT INTO QUALITATIVEARRAYS (EXPKEY, EPOCH, PLOTKEY, VALUE) SELECT EXPKEY, %(epochs)s - 1, PLOTKEY, "
+    "decode(repeat('00', 800), 'hex') FROM STATUS JOIN EXPERIMENTS USING (EXPID), PLOTS "
+    "WHERE PLOTID = 'arrays';",
+    "INSERT INTO EXPGROUPS (EXPID, GROUPNAME) SELECT EXPID, 'group_' || (row_number() OVER () %% %(n_groups)s) FROM STATUS;",
+    "INSERT INTO STEPS (EXPKEY, KINDKEY, STEP, VALUE) SELECT EXPKEY, KINDKEY, step, random() "
+    "FROM STATUS JOIN EXPERIMENTS USING (EXPID), generate_series(0, %(epochs)s * 5 - 1) step, KINDS "
+    "WHERE KIND = 'train';",
+]
+
+
+def sample_expids(expid: str, n: int = 50) -> list:
+    i = int(expid.rsplit("_", 1)[1])
+    return [EXPID.format(i + j) for j in range(n)]
+
+
+def resolve_sample(conn, expid: str) -> Sample:
+    """The sample experiment and its neighbours, with their integer keys."""
+    expids = sample_expids(expid)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXPID, EXPKEY FROM EXPERIMENTS WHERE EXPID = ANY(%s);",
+            (expids + [NEW_EXPID],),
+        )
+        exp_keys = dict(cursor.fetchall())
+        cursor.execute(
+            "SELECT KIND, KINDKEY FROM KINDS UNION ALL SELECT PLOTID, PLOTKEY FROM PLOTS;"
+        )
+        keys = dict(cursor.fetchall())
+    conn.rollback()
+    return Sample(
+        expid=expid,
+        expids=expids,
+        exp_key=exp_keys[expid],
+        exp_keys=[exp_keys[e] for e in expids if e in exp_keys],
+        new_key=exp_keys[NEW_EXPID],
+        keys=keys,
+    )
+
+
+def bench_connection(database: str, partitions: int = None):
+    dsn = CONFIG.as_dict()
+    if database == dsn["database"]:
+        sys.exit(
+            f"Refusing to seed the configured database ({database}): pick another."
+        )
+
+    # not `with connect(...)`, which opens a transaction CREATE DATABASE can't run in
+    admin = connect(**dsn)
+    admin.autocommit = True
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname=%s;", (database,))
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{database}";')
+    finally:
+        admin.close()
+
+    dsn["database"] = database
+    conn = connect(**dsn)
+    migrate(conn, log=lambda msg: None)
+    if partitions:
+        partition(conn, partitions, log=lambda msg: None)
+    return conn
+
+
+def seed(conn, n: int, epochs: int):
+    with conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY;")
+        params = dict(
+            n=n,
+            new_expid=NEW_EXPID,
+            epochs=epochs,
+            loss_kinds=LOSS_KINDS,
+            metric_kinds=METRIC_KINDS,
+            plotids=PLOTIDS,
+            n_groups=N_GROUPS,
+        )
+        for command in SEED:
+            cursor.execute(command, params)
+    conn.commit()
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE;")
+    finally:
+        conn.autocommit = False
+
+
+def queries(sample: Sample):
+    """(name, query, args, expect_full_scan) for every command and UI query."""
+    commands = sorted(k for k in vars(Database) if k.startswith("COMMAND_"))
+    missing = [k for k in commands if k not in ARGS and k not in SKIPPED]
+    if missing:
+        print(f"No example arguments for {', '.join(missing)}: add them to ARGS.")
+
+    for name in commands:
+        if name in ARGS:
+            query = getattr(Database, name)
+            if "{}" in query:
+                query = query.format("LOSS" if "EXPKEY" in query else "STATUS")
+            yield name, query, ARGS[name](sample), False
+
+    for name, query, args, expect_full_scan in UI_QUERIES:
+        args = tuple(
+            a.format(expid=sample.expid) if isinstance(a, str) else a for a in args
+        )
+        yield name, query, args, expect_full_scan
+
+
+def seq_scans(plan: dict) -> list:
+    """Relations read by sequential scan anywhere in the plan tree."""
+    scans = []
+    if plan.get("Node Type") == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(seq_scans(child))
+    return scans
+
+
+def explain(conn, query: str, args: tuple, repeat: int) -> dict:
+    """Median execution time of `query`, with the buffers and sequential
+    scans of its plan. Each run is rolled back, so writes leave no trace."""
+    times, plan = [], None
+    for _ in range(repeat):
+        with conn.cursor() as cursor:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, args)
+            result = cursor.fetchone()[0][0]
+        conn.rollback()
+        times.append(result["Planning Time"] + result["Execution Time"])
+        plan = result["Plan"]
+    return dict(
+        time_ms=statistics.median(times),
+        shared_hit=plan.get("Shared Hit Blocks", 0),
+        shared_read=plan.get("Shared Read Blocks", 0),
+        seq_scans=sorted(set(seq_scans(plan))),
+    )
+
+
+def compare(result: dict, baseline: dict, tolerance: float, noise_ms: float) -> bool:
+    """Whether `result` is a latency regression on `baseline`."""
+    if not baseline or "time_ms" not in baseline:
+        return False
+    slower = result["time_ms"] - baseline["time_ms"]
+    return slower > noise_ms and result["time_ms"] > baseline["time_ms"] * (
+        1 + tolerance
+    )
+
+
+def run(args) -> dict:
+    conn = bench_connection(args.database, args.partitions)
+    results = dict()
+    try:
+        for n in args.sizes:
+            print(f"Seeding {n} experiments...")
+            seed(conn, n, args.epochs)
+            sample = resolve_sample(conn, EXPID.format(n // 2))
+
+            results[str(n)] = by_query = dict()
+            for name, query, query_args, expect_full_scan in queries(sample):
+                try:
+                    by_query[name] = explain(conn, query, query_args, args.repeat)
+                except PsycopgError as e:
+                    conn.rollback()
+                    by_query[name] = dict(error=str(e).strip().splitlines()[0])
+                    continue
+                by_query[name]["expect_full_scan"] = expect_full_scan
+    finally:
+        conn.close()
+    return results
+
+
+def report(results: dict, baseline: dict, tolerance: float, noise_ms: float) -> int:
+    n_regressions = 0
+    for size, by_query in results.items():
+        print(f"\n{size} experiments")
+        print(f"{'query':<36}{'ms':>10}{'base ms':>10}{'hit':>8}{'read':>8}  flags")
+        for name, r in by_query.items():
+            if "error" in r:
+                print(f"{name:<36}  ERROR: {r['error']}")
+                continue
+            base = baseline.get(size, {}).get(name, {})
+            flags = []
+            if r["seq_scans"] and not r["expect_full_scan"]:
+                flags.append(f"seq scan on {', '.join(r['seq_scans'])}")
+            if compare(r, base, tolerance, noise_ms):
+                flags.append("REGRESSION")
+                n_regressions += 1
+            base_ms = f"{base['time_ms']:.2f}" if "time_ms" in base else "-"
+            print(
+                f"{name:<36}{r['time_ms']:>10.2f}{base_ms:>10}"
+                f"{r['shared_hit']:>8}{r['shared_read']:>8}  {'; '.join(flags)}"
+            )
+    return n_regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.query_plans")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Numbers of experiments to seed.",
+    )
+    parser.add_argument("--epochs", type=int, default=20, help="Epochs per experiment.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query.")
+    parser.add_argument(
+        "--database",
+        default="mldb_bench",
+        help="Scratch database to seed, on the configured server.",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=None,
+        help="Hash partition the large tables first (a scratch database stays "
+        "partitioned once it has been).",
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Fractional slow-down counted as a regression.",
+    )
+    parser.add_argument(
+        "--noise-ms",
+        type=float,
+        default=1.0,
+        help="Slow-downs smaller than this are ignored.",
+    )
+    args = parser.parse_args()
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    n_regressions = report(results, baseline, args.tolerance, args.noise_ms)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif n_regressions:
+        print(f"\n{n_regressions} queries slower than the baseline.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
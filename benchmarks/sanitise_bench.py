@@ -0,0 +1,69 @@
+"""Compare the array fast path of Database.sanitise_value with the generic,
+element-by-element path on some realistic shapes.
+
+    python -m benchmarks.sanitise_bench
+"""
+
+from timeit import timeit
+
+import numpy as np
+
+from mldb.database import Database
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def sanitise_value_generic(v):
+    """Element-by-element sanitisation, as Database.sanitise_value did before
+    its array fast path."""
+    if isinstance(v, (str, int, float)):
+        return v
+    elif hasattr(v, "detach") and hasattr(v, "cpu") and hasattr(v, "numpy"):
+        return sanitise_value_generic(v.detach().cpu().numpy())
+    elif isinstance(v, (np.float16, np.float32, np.float64)):
+        return float(v)
+    elif isinstance(
+        v,
+        (
+            np.int8,
+            np.int16,
+            np.int32,
+            np.int64,
+            np.uint8,
+            np.uint16,
+            np.uint32,
+            np.uint64,
+        ),
+    ):
+        return int(v)
+    elif hasattr(v, "__iter__"):
+        return [sanitise_value_generic(vi) for vi in v]
+    else:
+        raise ValueError(f"Unexpected type encountered: {type(v)}.")
+
+
+def cases():
+    yield "scalar float32", np.float32(0.5)
+    yield "100-point distribution", np.random.rand(100)
+    yield "batch of 64x100 float32", np.random.rand(64, 100).astype(np.float32)
+    yield "512x512 float32 image", np.random.rand(512, 512).astype(np.float32)
+    yield "512x512 float16 image", np.random.rand(512, 512).astype(np.float16)
+    yield "256x256 uint8 mask", np.random.randint(0, 255, (256, 256), dtype=np.uint8)
+    if torch is not None:
+        yield "512x512 float32 tensor", torch.rand(512, 512)
+
+
+def main():
+    print(f"{'case':<28}{'generic (ms)':>14}{'fast (ms)':>12}{'speedup':>10}")
+    for name, value in cases():
+        n = 3 if np.prod(np.shape(value)) > 10_000 else 1000
+        generic = timeit(lambda: sanitise_value_generic(value), number=n) / n
+        fast = timeit(lambda: Database.sanitise_value(value), number=n) / n
+        print(f"{name:<28}{generic*1e3:>14.3f}{fast*1e3:>12.3f}{generic/fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
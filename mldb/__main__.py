@@ -1,5 +1,132 @@
+import argparse
+
+
 def main():
-    pass
+    parser = argparse.ArgumentParser(prog="mldb")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Load journalled writes into the database."
+    )
+    replay_parser.add_argument(
+        "spool_dir", nargs="?", default=None, help="Defaults to <root_dir>/.mldb_spool"
+    )
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Upgrade the database schema to the latest version."
+    )
+    migrate_parser.add_argument(
+        "--target", type=int, default=None, help="Stop at this schema version."
+    )
+
+    partition_parser = subparsers.add_parser(
+        "partition",
+        help="Hash partition the large per-experiment tables by experiment.",
+    )
+    partition_parser.add_argument(
+        "--partitions", type=int, default=16, help="Partitions per table."
+    )
+
+    subparsers.add_parser(
+        "vacuum", help="Vacuum and analyse the large tables, a partition at a time."
+    )
+
+    tier_parser = subparsers.add_parser(
+        "tier",
+        help="Move the qualitative results of long-finished experiments to cold storage.",
+    )
+    tier_parser.add_argument(
+        "--days",
+        type=float,
+        default=None,
+        help="Days since completion (default: the config's cold_after_days).",
+    )
+
+    sync_parser = subparsers.add_parser(
+        "sync", help="Bring the local mirror of the database up to date."
+    )
+    sync_parser.add_argument(
+        "path", nargs="?", default=None, help="Defaults to the config's mirror_path."
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Print changes to experiments as they are committed."
+    )
+    watch_parser.add_argument(
+        "expids", nargs="*", help="Only these experiments (default: all)."
+    )
+
+    serve_parser = subparsers.add_parser("serve", help="Run the web dashboard.")
+    serve_parser.add_argument("--host", default="localhost")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        help='Requests handled at once (default: config "server_workers", '
+        'or else "pool_max").',
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        from .database import replay
+
+        n = replay(args.spool_dir)
+        print(f"Replayed {n} calls.")
+    elif args.command == "migrate":
+        import psycopg2
+
+        from .config import CONFIG
+        from .database.migrations import migrate
+
+        # not through Database, which refuses to open too old a schema
+        conn = psycopg2.connect(**CONFIG.as_dict())
+        try:
+            applied = migrate(conn, args.target)
+        finally:
+            conn.close()
+        print(f"Applied migrations: {applied or 'none'}.")
+    elif args.command == "tier":
+        from .database import Database
+
+        with Database(pooled=False) as db:
+            moved = db.tier_qualitative_results(args.days)
+        print(f"Moved {len(moved)} experiments to cold storage.")
+    elif args.command == "sync":
+        from .database import Database, Mirror
+
+        with Database(cached=False) as db, Mirror(args.path) as mirror:
+            counts = mirror.sync(db.conn)
+        print(f"Synced {sum(counts.values())} rows to {mirror.path}.")
+    elif args.command == "watch":
+        from .database import Database
+
+        with Database(cached=False) as db:
+            try:
+                for change in db.subscribe(args.expids or None):
+                    epoch = "" if change.epoch is None else f" epoch {change.epoch}"
+                    print(f"{change.expid}: {change.table}{epoch}", flush=True)
+            except KeyboardInterrupt:
+                pass
+    elif args.command == "serve":
+        from .server.web_app import run_server
+
+        run_server(args.host, args.port, args.workers)
+    elif args.command in ("partition", "vacuum"):
+        import psycopg2
+
+        from .config import CONFIG
+        from .database.partitions import partition, vacuum
+
+        conn = psycopg2.connect(**CONFIG.as_dict())
+        try:
+            if args.command == "partition":
+                converted = partition(conn, args.partitions)
+                print(f"Partitioned tables: {', '.join(converted) or 'none'}.")
+            else:
+                vacuum(conn)
+        finally:
+            conn.close()
 
 
 if __name__ == "__main__":
@@ -14,6 +14,16 @@ class PostgreSQLConfig:
         user: str,
         database: str,
         port=5432,
+        pool_min=1,
+        pool_max=10,
+        pool_timeout=None,
+        partitions=None,
+        cold_after_days=30,
+        cache_size_mb=64,
+        cache_ttl=10.0,
+        mirror=False,
+        mirror_path=None,
+        server_workers=None,
     ):
         self.root_dir = root_dir
         self.host = host
@@ -21,6 +31,16 @@ class PostgreSQLConfig:
         self.user = user
         self.database = database
         self.port = port
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.pool_timeout = pool_timeout
+        self.partitions = partitions
+        self.cold_after_days = cold_after_days
+        self.cache_size_mb = cache_size_mb
+        self.cache_ttl = cache_ttl
+        self.mirror = mirror
+        self.mirror_path = mirror_path
+        self.server_workers = server_workers
 
     def as_dict(self):
         return dict(
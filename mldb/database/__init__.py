@@ -1 +1,8 @@
 from .database import Database
+from .background import BackgroundLogger
+from .spool import SpoolLogger, replay
+from .pool import pool_stats
+from .cache import cache_stats
+from .async_database import AsyncDatabase
+from .mirror import Mirror
+from .changes import Change, ChangeListener
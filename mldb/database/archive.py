@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from .schema import KEYED_TABLES
+
+# Archives hold one compressed .npz per table, with an array per column, and
+# a manifest. Experiments, kinds and plot ids are stored by name rather than
+# key, so an archive can be restored into any database.
+MANIFEST = "manifest.json"
+
+# the columns archived from each table, with their types: "text" and "bytes"
+# are stored as one uint8 array of the concatenated values plus their offsets,
+# "time" as seconds since the epoch. LATESTMETRICS isn't archived: it is
+# rebuilt from METRICS on restore.
+ARCHIVE_COLUMNS = dict(
+    STATUS=[("EXPID", "text"), ("STATUS", "text")],
+    CONFIG=[("EXPID", "text"), ("CONFIG", "text")],
+    HYPERPARAMS=[("EXPID", "text"), ("NAME", "text"), ("VALUE", "text")],
+    EXPGROUPS=[("EXPID", "text"), ("GROUPNAME", "text")],
+    QUALITATIVERESULTSMETA=[("EXPID", "text"), ("PLOTID", "text"), ("VALUE", "text")],
+    LOSS=[("EXPID", "text"), ("KIND", "text"), ("EPOCH", "int"), ("VALUE", "float")],
+    METRICS=[
+        ("EXPID", "text"),
+        ("KIND", "text"),
+        ("EPOCH", "int"),
+        ("VALUE", "float"),
+    ],
+    LEARNINGRATE=[("EXPID", "text"), ("EPOCH", "int"), ("VALUE", "float")],
+    STATE=[("EXPID", "text"), ("EPOCH", "int"), ("PATH", "text")],
+    QUALITATIVERESULTS=[
+        ("EXPID", "text"),
+        ("EPOCH", "int"),
+        ("PLOTID", "text"),
+        ("VALUE", "text"),
+    ],
+    QUALITATIVEARRAYS=[
+        ("EXPID", "text"),
+        ("EPOCH", "int"),
+        ("PLOTID", "text"),
+        ("VALUE", "bytes"),
+    ],
+    STEPS=[
+        ("EXPID", "text"),
+        ("KIND", "text"),
+        ("STEP", "int"),
+        ("VALUE", "float"),
+        ("WALLTIME", "time"),
+    ],
+)
+
+SQL_TYPES = dict(
+    text="TEXT",
+    bytes="BYTEA",
+    int="INTEGER",
+    float="DOUBLE PRECISION",
+    time="DOUBLE PRECISION",
+)
+
+# name column: (registry, key column)
+NAME_KEYS = dict(
+    EXPID=("EXPERIMENTS", "EXPKEY"),
+    KIND=("KINDS", "KINDKEY"),
+    PLOTID=("PLOTS", "PLOTKEY"),
+)
+
+
+def export_query(table: str) -> str:
+    """Query for the archived columns of `table`, taking the experiments'
+    keys (for keyed tables) or ids as its one parameter."""
+    columns = ARCHIVE_COLUMNS[table]
+    selected = ", ".join(
+        f"EXTRACT(EPOCH FROM {c})" if t == "time" else c for c, t in columns
+    )
+    if table not in KEYED_TABLES:
+        return f"SELECT {selected} FROM {table} WHERE EXPID = ANY(%s);"
+    joins = " ".join(
+        f"JOIN {NAME_KEYS[c][0]} USING ({NAME_KEYS[c][1]})"
+        for c, _ in columns
+        if c in NAME_KEYS
+    )
+    return f"SELECT {selected} FROM {table} {joins} WHERE EXPKEY = ANY(%s);"
+
+
+def present_query(table: str) -> str:
+    """Query for which of the experiments (ids, its one parameter) have rows
+    in `table`."""
+    if table not in KEYED_TABLES:
+        return f"SELECT DISTINCT EXPID FROM {table} WHERE EXPID = ANY(%s);"
+    return (
+        f"SELECT DISTINCT EXPID FROM {table} JOIN EXPERIMENTS USING (EXPKEY) "
+        "WHERE EXPID = ANY(%s);"
+    )
+
+
+def restore_commands(table: str):
+    """(staging table, commands): rows COPYed into the temporary staging
+    table are put into `table` by the commands, registering new names."""
+    columns = ARCHIVE_COLUMNS[table]
+    staging = f"MLDB_RESTORE_{table}"
+    names = ", ".join(c for c, _ in columns)
+    commands = [
+        f"CREATE TEMP TABLE {staging} ("
+        + ", ".join(f"{c} {SQL_TYPES[t]} NOT NULL" for c, t in columns)
+        + ") ON COMMIT DROP;",
+    ]
+    if table not in KEYED_TABLES:
+        commands.append(f"INSERT INTO {table} ({names}) SELECT {names} FROM {staging};")
+        return staging, commands
+
+    targets, selected, joins = [], [], []
+    for c, t in columns:
+        if c in NAME_KEYS:
+            registry, key = NAME_KEYS[c]
+            commands.append(
+                f"INSERT INTO {registry} ({c}) SELECT DISTINCT {c} FROM {staging} "
+                f"ORDER BY {c} ON CONFLICT ({c}) DO NOTHING;"
+            )
+            targets.append(key)
+            selected.append(key)
+            joins.append(f"JOIN {registry} USING ({c})")
+        else:
+            targets.append(c)
+            selected.append(f"to_timestamp({c})" if t == "time" else c)
+    commands.append(
+        f"INSERT INTO {table} ({', '.join(targets)}) SELECT {', '.join(selected)} "
+        f"FROM {staging} {' '.join(joins)};"
+    )
+    return staging, commands
+
+
+def encode_column(kind: str, values: list) -> dict:
+    if kind in ("text", "bytes"):
+        if kind == "text":
+            values = [v.encode() for v in values]
+        else:
+            values = [bytes(v) for v in values]
+        offsets = np.cumsum([0] + [len(v) for v in values], dtype=np.int64)
+        return dict(
+            data=np.frombuffer(b"".join(values), dtype=np.uint8), offsets=offsets
+        )
+    dtype = dict(int=np.int32, float=np.float64, time=np.float64)[kind]
+    return dict(data=np.array(values, dtype=dtype))
+
+
+def decode_column(kind: str, data: np.ndarray, offsets: np.ndarray = None) -> list:
+    if kind in ("text", "bytes"):
+        raw = data.tobytes()
+        values = [raw[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        return [v.decode() for v in values] if kind == "text" else values
+    return data.tolist()
+
+
+def save_table(path: str, table: str, rows: list):
+    """Write `rows` of `table` (as returned by export_query) to path/TABLE.npz."""
+    arrays = dict()
+    columns = list(zip(*rows)) if rows else [()] * len(ARCHIVE_COLUMNS[table])
+    for (name, kind), values in zip(ARCHIVE_COLUMNS[table], columns):
+        encoded = encode_column(kind, list(values))
+        arrays[name] = encoded["data"]
+        if "offsets" in encoded:
+            arrays[f"{name}.offsets"] = encoded["offsets"]
+    np.savez_compressed(os.path.join(path, f"{table}.npz"), **arrays)
+
+
+def load_table(path: str, table: str) -> list:
+    """Rows of `table` saved by save_table."""
+    with np.load(os.path.join(path, f"{table}.npz"), allow_pickle=False) as arrays:
+        columns = [
+            decode_column(kind, arrays[name], arrays.get(f"{name}.offsets"))
+            for name, kind in ARCHIVE_COLUMNS[table]
+        ]
+    return list(zip(*columns))
+
+
+def rows_to_csv(table: str, rows: list) -> io.StringIO:
+    """`rows` as CSV for COPY, with bytes in bytea's hex format."""
+    kinds = [kind for _, kind in ARCHIVE_COLUMNS[table]]
+    data = io.StringIO()
+    # strings are quoted, so COPY reads an empty one as such rather than NULL
+    writer = csv.writer(data, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow(
+            ["\\x" + v.hex() if k == "bytes" else v for k, v in zip(kinds, row)]
+        )
+    data.seek(0)
+    return data
+
+
+def write_manifest(path: str, manifest: dict):
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def archived_tables(manifest: dict) -> List[str]:
+    return [t for t in ARCHIVE_COLUMNS if t in manifest["tables"]]
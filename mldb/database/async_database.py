@@ -0,0 +1,349 @@
+import asyncio
+import os
+from typing import List
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+from ..config import CONFIG
+from .database import Database
+from .exception import NoDataError
+from . import cold
+from .keys import KeyCache, get_keys
+
+
+class AsyncDatabase:
+    """Coroutine counterpart to Database, for running many lookups at once
+    from a single thread, e.g.
+
+        async with AsyncDatabase() as db:
+            details = await asyncio.gather(*[db.get_experiment_details(e) for e in expids])
+
+    Each call borrows its own connection from an async pool (sized by the
+    config's pool_min and pool_max), so concurrent calls run in parallel.
+    Needs the optional psycopg 3 driver: `pip install mldb[asyncio]`.
+    """
+
+    def __init__(self):
+        if AsyncConnectionPool is None:
+            raise ImportError(
+                "AsyncDatabase needs psycopg 3 and psycopg_pool: pip install mldb[asyncio]"
+            )
+        self.root_dir = CONFIG.root_dir
+        self.host = CONFIG.host
+        self.user = CONFIG.user
+        self.port = CONFIG.port
+        self.database = CONFIG.database
+        self.keys = get_keys(CONFIG)
+        self.pool = AsyncConnectionPool(
+            kwargs=dict(
+                host=CONFIG.host,
+                port=CONFIG.port,
+                user=CONFIG.user,
+                password=CONFIG.password,
+                dbname=CONFIG.database,
+                # psycopg 3 returns text as bytes from SQL_ASCII databases otherwise
+                client_encoding="utf8",
+            ),
+            min_size=CONFIG.pool_min,
+            max_size=CONFIG.pool_max,
+            timeout=CONFIG.pool_timeout or 30.0,
+            open=False,
+        )
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __repr__(self):
+        return (
+            f"PostgreSQL://{self.user}@{self.host}:{self.port}/{self.database} (async)"
+        )
+
+    async def open(self):
+        await self.pool.open()
+        try:
+            await self.ensure_schema()
+        except Exception:
+            await self.pool.close()
+            raise
+
+    async def ensure_schema(self):
+        """Create, or check the version of, the schema as Database does (see
+        Database.ensure_schema). Migrations run on psycopg2, so on a thread."""
+        await asyncio.to_thread(self.check_schema)
+
+    @staticmethod
+    def check_schema():
+        with Database(pooled=False):
+            pass
+
+    async def close(self):
+        await self.pool.close()
+
+    def desanitise_path(self, sanitised_path: str) -> str:
+        return os.path.join(self.root_dir, sanitised_path)
+
+    async def fetch(self, command: str, args: tuple = (), conn=None) -> list:
+        if conn is None:
+            async with self.pool.connection() as conn:
+                return await self.fetch(command, args, conn)
+        async with conn.cursor() as cursor:
+            await cursor.execute(command, args)
+            return await cursor.fetchall()
+
+    async def iter_query(self, command: str, args: tuple = (), chunk_size: int = None):
+        """Yield the rows of `command` one at a time, through a server-side
+        cursor fetching `chunk_size` at once (see Database.iter_chunks)."""
+        async with self.pool.connection() as conn:
+            name = f"mldb_iter_{next(Database._cursor_ids)}"
+            async with conn.cursor(name=name) as cursor:
+                cursor.itersize = chunk_size or Database.CHUNK_SIZE
+                await cursor.execute(command, args)
+                async for row in cursor:
+                    yield row
+
+    async def execute(self, command: str, args: tuple = ()):
+        # the pool commits when the connection is returned without error
+        async with self.pool.connection() as conn:
+            await conn.execute(command, args)
+
+    async def execute_many(self, command: str, args_seq):
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(command, args_seq)
+
+    async def lookup_keys(self, cache: KeyCache, names, create: bool = False) -> list:
+        """See Database.lookup_keys; the caches are shared with it."""
+        missing = cache.missing(names)
+        if missing:
+            async with self.pool.connection() as conn:
+                if create:
+                    await conn.execute(cache.command_add, (missing,))
+                cursor = await conn.execute(cache.command_get, (missing,))
+                cache.update(await cursor.fetchall())
+        return [cache[n] for n in names]
+
+    async def experiment_key(self, exp_id: str, create: bool = False):
+        return (await self.lookup_keys(self.keys.experiments, [exp_id], create))[0]
+
+    async def experiment_keys(self, expids: List[str]) -> List[int]:
+        keys = await self.lookup_keys(self.keys.experiments, expids)
+        return [k for k in keys if k is not None]
+
+    async def kind_key(self, kind: str, create: bool = False):
+        return (await self.lookup_keys(self.keys.kinds, [kind], create))[0]
+
+    async def plot_key(self, plot_id: str, create: bool = False):
+        return (await self.lookup_keys(self.keys.plots, [plot_id], create))[0]
+
+    async def set_exp_status(self, exp_id: str, status: str):
+        await self.experiment_key(exp_id, create=True)
+        await self.execute(Database.COMMAND_SET_STATUS, (exp_id, status))
+
+    async def add_loss_value(self, exp_id: str, kind: str, epoch: int, value: float):
+        exp_key = await self.experiment_key(exp_id, True)
+        kind_key = await self.kind_key(kind, True)
+        await self.execute(Database.COMMAND_ADD_LOSS, (exp_key, kind_key, epoch, value))
+
+    async def add_hyperparam(self, exp_id: str, name: str, value: str):
+        await self.execute(Database.COMMAND_ADD_HYPERPARAM, (exp_id, name, value))
+
+    async def add_metric_value(self, exp_id: str, kind: str, epoch: int, value: float):
+        exp_key = await self.experiment_key(exp_id, True)
+        kind_key = await self.kind_key(kind, True)
+        await self.execute(
+            Database.COMMAND_ADD_METRICS, (exp_key, kind_key, epoch, value)
+        )
+
+    async def add_lr_value(self, exp_id: str, epoch: int, value: float):
+        exp_key = await self.experiment_key(exp_id, True)
+        await self.execute(Database.COMMAND_ADD_LR, (exp_key, epoch, value))
+
+    async def get_hyperparams(self, exp_id: str) -> dict:
+        rows = await self.fetch(Database.COMMAND_GET_HYPERPARAMS, (exp_id,))
+        return Database.hyperparams_from_rows(rows)
+
+    async def get_state_file(self, expid: str, epoch: int) -> str:
+        exp_key = await self.experiment_key(expid)
+        rows = await self.fetch(Database.COMMAND_GET_STATE, (exp_key, epoch))
+        if not rows:
+            raise NoDataError(
+                f'No state file found for experiment "{expid}" at epoch {epoch}'
+            )
+        return self.desanitise_path(rows[0][0])
+
+    async def get_status(self, expid: str) -> str:
+        rows = await self.fetch(Database.COMMAND_GET_STATUS, (expid,))
+        if not rows:
+            raise NoDataError(f'No status information found for experiment "{expid}"')
+        return rows[0][1]
+
+    async def get_losses(self, expid: str, as_arrays: bool = False) -> dict:
+        exp_key = await self.experiment_key(expid)
+        if as_arrays:
+            rows = await self.fetch(Database.COMMAND_GET_LOSS_COLUMNS, (exp_key,))
+            return Database.loss_columns_from_rows(expid, rows)
+        rows = await self.fetch(Database.COMMAND_GET_LOSSES, (exp_key,))
+        return Database.losses_from_rows(expid, rows)
+
+    async def get_lr_values(self, exp_id: str):
+        exp_key = await self.experiment_key(exp_id)
+        return await self.fetch(Database.COMMAND_GET_LRS, (exp_key,))
+
+    async def get_lrs(self, expid: str, as_arrays: bool = False) -> dict:
+        rows = await self.get_lr_values(expid)
+        if as_arrays:
+            return Database.lr_columns_from_rows(rows)
+        return Database.lrs_from_rows(rows)
+
+    async def get_metric_history(self, expid: str, kind: str = None) -> dict:
+        exp_key = await self.experiment_key(expid)
+        if kind is None:
+            rows = await self.fetch(Database.COMMAND_GET_METRIC_HISTORY, (exp_key,))
+        else:
+            rows = await self.fetch(
+                Database.COMMAND_GET_METRIC_HISTORY_OF_KIND,
+                (exp_key, await self.kind_key(kind)),
+            )
+        return Database.metric_history_from_rows(expid, rows)
+
+    async def get_step_values(self, expid: str, kind: str = None) -> dict:
+        exp_key = await self.experiment_key(expid)
+        if kind is None:
+            rows = await self.fetch(Database.COMMAND_GET_STEPS, (exp_key,))
+        else:
+            rows = await self.fetch(
+                Database.COMMAND_GET_STEPS_OF_KIND, (exp_key, await self.kind_key(kind))
+            )
+        return Database.step_values_from_rows(expid, rows)
+
+    async def get_experiment_details(self, expid: str) -> dict:
+        status, losses, lrs = await asyncio.gather(
+            self.get_status(expid), self.get_losses(expid), self.get_lrs(expid)
+        )
+        return dict(expid=expid, status=status, losses=losses, lrs=lrs)
+
+    async def get_latest_metrics(self, exp_id) -> dict:
+        exp_key = await self.experiment_key(exp_id)
+        rows = await self.fetch(Database.COMMAND_GET_LATEST_METRICS, (exp_key,))
+        return Database.latest_metrics_from_rows(exp_id, rows)
+
+    async def get_qualitative_result(self, exp_id: str, plot_id: str):
+        keys = (await self.experiment_key(exp_id), await self.plot_key(plot_id))
+
+        async def read(conn, path):
+            meta_enc = await self.fetch(
+                Database.COMMAND_GET_QUALRESMETA, (exp_id, plot_id), conn
+            )
+            data = await self.fetch(Database.COMMAND_GET_QUALRES, keys, conn)
+            array_data = await self.fetch(
+                Database.COMMAND_GET_QUALRES_ARRAYS, keys, conn
+            )
+            if path is not None:
+                cold_data, cold_array_data = await asyncio.gather(
+                    asyncio.to_thread(
+                        cold.load_rows, path, "QUALITATIVERESULTS", plot_id
+                    ),
+                    asyncio.to_thread(
+                        cold.load_rows, path, "QUALITATIVEARRAYS", plot_id
+                    ),
+                )
+                data, array_data = cold_data + data, cold_array_data + array_data
+            return Database.qualitative_result_from_rows(meta_enc, data, array_data)
+
+        return await self.read_cold(keys[0], read)
+
+    async def get_qualitative_plot_ids(self, exp_id: str) -> List[str]:
+        exp_key = await self.experiment_key(exp_id)
+
+        async def read(conn, path):
+            rows = await self.fetch(
+                Database.COMMAND_GET_QUALRES_PLOTIDS, (exp_key, exp_key), conn
+            )
+            plot_ids = [r[0] for r in rows]
+            if path is not None:
+                cold_ids = await asyncio.to_thread(cold.plot_ids, path)
+                plot_ids += [p for p in cold_ids if p not in plot_ids]
+            return plot_ids
+
+        return await self.read_cold(exp_key, read)
+
+    async def read_cold(self, exp_key: int, read):
+        """See Database.read_cold: `await read(conn, path)`, on one connection
+        in a REPEATABLE READ transaction."""
+        while True:
+            async with self.pool.connection() as conn:
+                await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                path = await self.get_cold_path(exp_key, conn)
+                try:
+                    return await read(conn, path)
+                except FileNotFoundError as e:
+                    error = e
+            if await self.get_cold_path(exp_key) == path:
+                raise error
+
+    async def get_cold_path(self, exp_key: int, conn=None):
+        rows = await self.fetch(Database.COMMAND_GET_COLD_PATH, (exp_key,), conn)
+        return self.desanitise_path(rows[0][0]) if rows else None
+
+    async def add_to_group(self, exp_id: str, group: str):
+        await self.execute(Database.COMMAND_ADD_TO_GROUP, (exp_id, group))
+
+    async def add_many_to_group(self, expids_and_groups):
+        await self.execute_many(Database.COMMAND_ADD_TO_GROUP, list(expids_and_groups))
+
+    async def remove_from_group(self, exp_id: str, group: str):
+        await self.execute(Database.COMMAND_REMOVE_FROM_GROUP, (exp_id, group))
+
+    async def remove_many_from_group(self, expids_and_groups):
+        await self.execute_many(
+            Database.COMMAND_REMOVE_FROM_GROUP, list(expids_and_groups)
+        )
+
+    async def get_group(self, group: str):
+        return [r[0] for r in await self.fetch(Database.COMMAND_GET_GROUP, (group,))]
+
+    async def get_groups_of_exp(self, expid: str):
+        rows = await self.fetch(Database.COMMAND_GET_GROUPS_OF_EXP, (expid,))
+        return [r[0] for r in rows]
+
+    async def get_groups_of_many_exps(self, expids: List[str]):
+        rows = await self.fetch(
+            Database.COMMAND_GET_GROUPS_OF_MANY_EXPS, (list(expids),)
+        )
+        return [r[0] for r in rows]
+
+    async def get_experiment_details_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        exp_keys = await self.experiment_keys(expids)
+        status_rows, loss_rows, lr_rows = await asyncio.gather(
+            self.fetch(Database.COMMAND_GET_STATUS_MANY, (expids,)),
+            self.fetch(Database.COMMAND_GET_LOSSES_MANY, (exp_keys,)),
+            self.fetch(Database.COMMAND_GET_LRS_MANY, (exp_keys,)),
+        )
+        return Database.experiment_details_many_from_rows(
+            expids, status_rows, loss_rows, lr_rows
+        )
+
+    async def get_latest_metrics_many(self, expids: List[str]) -> dict:
+        rows = await self.fetch(
+            Database.COMMAND_GET_LATEST_METRICS_MANY,
+            (await self.experiment_keys(expids),),
+        )
+        return Database.latest_metrics_many_from_rows(rows)
+
+    async def get_hyperparams_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        rows = await self.fetch(Database.COMMAND_GET_HYPERPARAMS_MANY, (expids,))
+        return Database.hyperparams_many_from_rows(expids, rows)
+
+    async def get_groups_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        rows = await self.fetch(Database.COMMAND_GET_GROUPS_MANY, (expids,))
+        return Database.groups_many_from_rows(expids, rows)
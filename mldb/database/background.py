@@ -0,0 +1,326 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+
+from psycopg2 import InterfaceError, OperationalError
+
+from ..config import CONFIG
+from .database import Database
+from .spool import Journal
+
+
+def _close_logger(ref):
+    logger = ref()
+    if logger is not None:
+        logger.close()
+
+
+class BackgroundLogger:
+    """Runs Database write methods on a background thread.
+
+    Write calls (`set_exp_status`, `add_loss_value`, ...) are pushed onto a
+    bounded in-memory queue and return immediately; a single writer thread
+    drains the queue and writes each batch it takes in one flush. When the
+    queue is full, `overflow` decides what happens to the new call:
+
+        "block": wait for the writer to make room,
+        "drop_oldest": discard the oldest queued call,
+        "drop_newest": discard the new call,
+        "spill": append calls to a file under `spill_dir` until the writer
+            has caught up. Calls still unwritten at close, because the
+            database is unreachable, are journalled for `python -m mldb replay`.
+
+    Arguments are queued by reference: arrays or tensors passed in should not
+    be modified in place after the call.
+    """
+
+    WRITE_METHODS = Database.WRITE_METHODS
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "spill")
+
+    def __init__(
+        self,
+        max_queue: int = 10_000,
+        overflow: str = "block",
+        spill_dir: str = None,
+        batch_size: int = 1000,
+        retry_interval: float = 5.0,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(
+                f'Unknown overflow policy "{overflow}", expected one of {self.OVERFLOW_POLICIES}.'
+            )
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+
+        if spill_dir is None:
+            spill_dir = os.path.join(CONFIG.root_dir, ".mldb_spill")
+        self.spill_path = os.path.join(spill_dir, f"{os.getpid()}_{id(self):x}.jsonl")
+        self.spilling = False
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.db = None
+
+        self.counters = dict(
+            enqueued=0,
+            written=0,
+            dropped=0,
+            spilled=0,
+            errors=0,
+            flushes=0,
+            max_queue_depth=0,
+        )
+        self.enqueue_time = 0.0
+        self.flush_time = 0.0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        self.thread = threading.Thread(
+            target=self.run, name="mldb-background-logger", daemon=True
+        )
+        self.thread.start()
+        atexit.register(_close_logger, weakref.ref(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, name):
+        if name not in self.WRITE_METHODS:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+
+        def enqueue(*args, **kwargs):
+            self.put((name, args, kwargs))
+
+        return enqueue
+
+    def put(self, call: tuple):
+        t0 = time.perf_counter()
+        with self.cond:
+            if self.stopping:
+                raise RuntimeError("BackgroundLogger has been closed.")
+
+            self.counters["enqueued"] += 1
+            if self.spilling:
+                self.spill(call)
+            elif len(self.queue) >= self.max_queue:
+                if self.overflow == "block":
+                    while len(self.queue) >= self.max_queue:
+                        self.cond.wait()
+                    self.queue.append(call)
+                elif self.overflow == "drop_oldest":
+                    self.queue.popleft()
+                    self.counters["dropped"] += 1
+                    self.queue.append(call)
+                elif self.overflow == "drop_newest":
+                    self.counters["dropped"] += 1
+                else:
+                    self.spilling = True
+                    self.spill(call)
+            else:
+                self.queue.append(call)
+
+            self.counters["max_queue_depth"] = max(
+                self.counters["max_queue_depth"], len(self.queue)
+            )
+            self.cond.notify_all()
+        self.enqueue_time += time.perf_counter() - t0
+
+    def spill(self, call: tuple):
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, "a") as f:
+            f.write(json.dumps(call, default=Database.sanitise_value) + "\n")
+        self.counters["spilled"] += 1
+
+    def take_spilled(self) -> list:
+        """Take the spill file, if any. Calls queued afterwards are newer than
+        everything in it, so order is preserved."""
+        with self.cond:
+            if not self.spilling:
+                return []
+            self.spilling = False
+            draining_path = self.spill_path + ".draining"
+            os.replace(self.spill_path, draining_path)
+
+        with open(draining_path) as f:
+            calls = [tuple(json.loads(line)) for line in f if line.strip()]
+        os.remove(draining_path)
+        return calls
+
+    def take_batch(self) -> list:
+        with self.cond:
+            while not self.queue and not self.spilling and not self.stopping:
+                self.cond.wait()
+            n = min(len(self.queue), self.batch_size)
+            batch = [self.queue.popleft() for _ in range(n)]
+            self.cond.notify_all()
+        return batch
+
+    def run(self):
+        while True:
+            # spilled calls are older than anything still in the queue
+            if self.spilling and not self.queue:
+                batch = self.take_spilled()
+            else:
+                batch = self.take_batch()
+
+            if batch:
+                self.write_batch(batch)
+            elif self.stopping and not self.spilling:
+                break
+
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def ensure_connected(self) -> bool:
+        if self.db is not None:
+            return True
+        try:
+            self.db = Database()
+            return True
+        except OperationalError as e:
+            self.counters["errors"] += 1
+            print(f"mldb: could not connect to database, retrying: {e}")
+            return False
+
+    def write_batch(self, batch: list):
+        while not self.ensure_connected():
+            if self.stopping:
+                if self.overflow == "spill":
+                    # journal what we can't write for a later replay to pick up
+                    journal = Journal()
+                    for call in batch:
+                        journal.append(*call)
+                    journal.seal()
+                    print(
+                        f"mldb: database unreachable, journalled {len(batch)} calls to {journal.spool_dir}"
+                    )
+                else:
+                    self.counters["dropped"] += len(batch)
+                return
+            time.sleep(self.retry_interval)
+
+        t0 = time.perf_counter()
+        written = set()
+        try:
+            self.write_buffered(batch, written)
+            self.counters["written"] += len(batch)
+        except (OperationalError, InterfaceError) as e:
+            # connection lost: reconnect and write what wasn't committed again
+            self.counters["errors"] += 1
+            self.counters["written"] += len(written)
+            print(f"mldb: lost connection to database, retrying: {e}")
+            try:
+                self.db.conn.close()
+                self.db.close()
+            except Exception:
+                pass
+            self.db = None
+            self.write_batch([c for i, c in enumerate(batch) if i not in written])
+            return
+        except Exception:
+            # a bad call spoils the batch: write the rest one at a time to
+            # isolate it
+            self.db.conn.rollback()
+            self.counters["written"] += len(written)
+            self.write_calls_individually(
+                [c for i, c in enumerate(batch) if i not in written]
+            )
+
+        latency = time.perf_counter() - t0
+        self.counters["flushes"] += 1
+        self.flush_time += latency
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def write_buffered(self, batch: list, written: set):
+        """Run the calls in `batch`, buffering the rows of those that can be
+        into one flush, and add the index of each call to `written` once it
+        has been committed: straight away for calls that aren't buffered
+        (status, qualitative results, files, ...), when its rows are flushed
+        for those that are. Rows not flushed if a call fails are dropped, to
+        be written again with the calls that weren't committed."""
+        self.db.start_buffering(len(batch) + 1, math.inf)
+        buffer = self.db.buffer
+        # indices of the calls with rows pending, by insert command
+        pending = defaultdict(list)
+
+        def mark_flushed():
+            for command in list(pending):
+                if not buffer.rows.get(command):
+                    written.update(pending.pop(command))
+
+        try:
+            for i, (name, args, kwargs) in enumerate(batch):
+                before = {c: len(rows) for c, rows in buffer.rows.items()}
+                getattr(self.db, name)(*args, **kwargs)
+                grown = [
+                    c for c, rows in buffer.rows.items() if len(rows) > before.get(c, 0)
+                ]
+                if grown:
+                    pending[grown[0]].append(i)
+                else:
+                    written.add(i)
+                # calls writing in bulk flush the buffer first
+                mark_flushed()
+            buffer.flush()
+        finally:
+            mark_flushed()
+            self.db.stop_buffering(discard=True)
+
+    def write_calls_individually(self, batch: list):
+        for name, args, kwargs in batch:
+            try:
+                getattr(self.db, name)(*args, **kwargs)
+                self.counters["written"] += 1
+            except Exception as e:
+                self.db.conn.rollback()
+                self.counters["errors"] += 1
+                self.counters["dropped"] += 1
+                print(f"mldb: failed to write {name}{args}: {e}")
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued call has been written. Returns False on timeout."""
+        target = self.counters["enqueued"]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (
+            self.counters["written"] + self.counters["dropped"] < target
+            and self.thread.is_alive()
+        ):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        with self.cond:
+            if self.stopping:
+                return
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def stats(self) -> dict:
+        n_enqueued = max(self.counters["enqueued"], 1)
+        n_flushes = max(self.counters["flushes"], 1)
+        return dict(
+            queue_depth=len(self.queue),
+            **self.counters,
+            mean_enqueue_latency=self.enqueue_time / n_enqueued,
+            last_flush_latency=self.last_flush_latency,
+            mean_flush_latency=self.flush_time / n_flushes,
+            max_flush_latency=self.max_flush_latency,
+        )
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+class BaseDatabase:
+    """The parts of Database that don't need a connection."""
+
+    @classmethod
+    def sanitise_value(cls, v):
+        if isinstance(v, (str, int, float)):
+            return v
+        elif hasattr(v, "detach") and hasattr(v, "cpu") and hasattr(v, "numpy"):
+            # tolist converts the whole tensor at once, including dtypes numpy
+            # can't represent (bfloat16)
+            return v.detach().cpu().tolist()
+        elif isinstance(v, np.generic) and v.dtype.kind in "iuf":
+            return v.item()
+        elif isinstance(v, np.ndarray) and v.dtype.kind in "iuf":
+            # whole array at once: floats (half precision included) widen to
+            # float64 first; nan and inf are kept, as in the generic path
+            if v.dtype.kind == "f":
+                v = v.astype(np.float64, copy=False)
+            return v.tolist()
+        elif hasattr(v, "__iter__"):
+            return [cls.sanitise_value(vi) for vi in v]
+        else:
+            raise ValueError(f"Unexpected type encountered: {type(v)}.")
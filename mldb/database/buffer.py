@@ -0,0 +1,158 @@
+import atexit
+import math
+import os
+import signal
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+_LIVE_BUFFERS = weakref.WeakSet()
+_HANDLERS_INSTALLED = False
+
+
+def _flush_all():
+    for buffer in list(_LIVE_BUFFERS):
+        try:
+            # may interrupt the owner mid-transaction (SIGTERM), or find its
+            # connection closed (exit)
+            buffer.flush(apart=True)
+        except Exception as e:
+            print(f"mldb: failed to flush write buffer: {e}")
+
+
+def _flush_periodically(ref, interval: float, stopping: threading.Event):
+    # holds the buffer weakly, so an abandoned buffer can still be collected
+    while not stopping.wait(min(interval, threading.TIMEOUT_MAX)):
+        buffer = ref()
+        if buffer is None:
+            return
+        try:
+            buffer.flush_if_due(apart=True)
+        except Exception as e:
+            print(f"mldb: failed to flush write buffer, will retry: {e}")
+        del buffer
+
+
+def _on_sigterm(previous_handler):
+    def handler(signum, frame):
+        _flush_all()
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+        elif previous_handler != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    return handler
+
+
+def _install_handlers():
+    global _HANDLERS_INSTALLED
+    if _HANDLERS_INSTALLED:
+        return
+    _HANDLERS_INSTALLED = True
+
+    atexit.register(_flush_all)
+
+    # signal handlers can only be set from the main thread
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.getsignal(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, _on_sigterm(previous))
+
+
+class WriteBuffer:
+    """Collects rows per insert command, flushing them in batches.
+
+    Rows are flushed when `max_rows` rows are pending, when `flush_interval`
+    seconds have passed since the last flush (checked on each `add` and by a
+    timer thread, so a quiet writer's rows don't wait for exit), on `flush()`,
+    at interpreter exit and on SIGTERM. The timer only flushes when
+    `flush_apart_fn`, if given, instead of `flush_fn`: the owner may be in
+    the middle of a transaction on the connection `flush_fn` writes with, so
+    flushes from other threads (and signal handlers) need a connection of
+    their own. `on_flush()`, if given, is called once everything pending has
+    been written.
+
+    Rows stay pending until `flush_fn` has written them: if it raises, they
+    are kept for the next flush.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[str, List[tuple]], None],
+        max_rows: int = 1000,
+        flush_interval: float = 5.0,
+        flush_apart_fn: Callable[[str, List[tuple]], None] = None,
+        on_flush: Callable[[], None] = None,
+    ):
+        self.flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.flush_apart_fn = flush_apart_fn or flush_fn
+        self.on_flush = on_flush
+        self.rows: Dict[str, List[tuple]] = defaultdict(list)
+        self.n_pending = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+        _LIVE_BUFFERS.add(self)
+        _install_handlers()
+
+        self.stopping = threading.Event()
+        if 0 < flush_interval < math.inf:
+            threading.Thread(
+                target=_flush_periodically,
+                args=(weakref.ref(self), flush_interval, self.stopping),
+                name="mldb-buffer-timer",
+                daemon=True,
+            ).start()
+
+    def __len__(self):
+        return self.n_pending
+
+    def add(self, command: str, row: tuple):
+        with self.lock:
+            self.rows[command].append(row)
+            self.n_pending += 1
+            due = (self.n_pending >= self.max_rows) or (
+                time.monotonic() - self.last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self, apart: bool = False):
+        """Write the pending rows, with `flush_apart_fn` if `apart`."""
+        flush_fn = self.flush_apart_fn if apart else self.flush_fn
+        with self.lock:
+            self.last_flush = time.monotonic()
+            # a command's rows are dropped only once written
+            for command in list(self.rows):
+                command_rows = self.rows[command]
+                flush_fn(command, command_rows)
+                del self.rows[command]
+                self.n_pending -= len(command_rows)
+            if self.on_flush is not None:
+                self.on_flush()
+
+    def flush_if_due(self, apart: bool = False):
+        with self.lock:
+            due = (
+                self.n_pending
+                and time.monotonic() - self.last_flush >= self.flush_interval
+            )
+            if due:
+                self.flush(apart)
+
+    def close(self):
+        self.stopping.set()
+        self.flush()
+        _LIVE_BUFFERS.discard(self)
+
+    def discard(self):
+        """Stop without writing the pending rows."""
+        self.stopping.set()
+        with self.lock:
+            self.rows = defaultdict(list)
+            self.n_pending = 0
+        _LIVE_BUFFERS.discard(self)
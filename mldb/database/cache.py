@@ -0,0 +1,156 @@
+import copy
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .schema import TERMINAL_STATUSES
+
+_CACHES = dict()
+_CACHES_LOCK = threading.Lock()
+
+
+def sizeof(value) -> int:
+    """Rough size in bytes of a value returned by one of the cached reads."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sizeof(k) + sizeof(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ReadCache:
+    """Thread-safe LRU cache of read results, limited to `max_bytes`.
+
+    Entries are kept until evicted, or for `ttl` seconds if they are put with
+    an expiry. Results are copied on the way out, so callers can't change
+    what is cached.
+    """
+
+    def __init__(self, max_bytes: int, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries = OrderedDict()  # key: (value, size, expires, expid)
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = dict(
+            hits=0, misses=0, evictions=0, expirations=0, invalidations=0
+        )
+
+    def get(self, key):
+        """(True, value) if `key` is cached and current, else (False, None)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+                self.remove(key)
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            value = entry[0]
+        return True, copy.deepcopy(value)
+
+    def put(self, key, expid: str, value, ttl: float = None):
+        """Cache `value`, for `ttl` seconds if given. Values bigger than the
+        whole cache aren't kept."""
+        size = sizeof(value)
+        expires = None if ttl is None else self.clock() + ttl
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if size > self.max_bytes:
+                return
+            while self.n_bytes + size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+            self.entries[key] = (value, size, expires, expid)
+            self.n_bytes += size
+
+    def remove(self, key):
+        _, size, _, _ = self.entries.pop(key)
+        self.n_bytes -= size
+
+    def invalidate(self, expids):
+        """Drop everything cached about `expids`."""
+        expids = set(expids)
+        with self.lock:
+            stale = [k for k, e in self.entries.items() if e[3] in expids]
+            for key in stale:
+                self.remove(key)
+            self.counters["invalidations"] += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                max_bytes=self.max_bytes,
+                bytes=self.n_bytes,
+                entries=len(self.entries),
+                hit_rate=self.counters["hits"] / lookups if lookups else 0.0,
+                **self.counters,
+            )
+
+
+def cached_read(method):
+    """Serve the Database read `method(self, expid, ...)` from the process's
+    read cache, when it has one."""
+
+    @functools.wraps(method)
+    def wrapper(self, expid, *args, **kwargs):
+        if self.cache is None or expid in self.unflushed:
+            # rows still in the buffer would be missing from the result
+            return method(self, expid, *args, **kwargs)
+        key = (method.__name__, expid, args, tuple(sorted(kwargs.items())))
+        found, value = self.cache.get(key)
+        if found:
+            return value
+
+        # the status is read first: if it changes meanwhile, the result is
+        # kept for the short ttl at most
+        status = self.get_status_or_none(expid)
+        value = method(self, expid, *args, **kwargs)
+        ttl = None if status in TERMINAL_STATUSES else self.cache_ttl
+        if ttl is None or ttl > 0:
+            self.cache.put(key, expid, value, ttl)
+            value = copy.deepcopy(value)
+        return value
+
+    return wrapper
+
+
+def get_cache(config) -> ReadCache:
+    """The process-wide read cache for the database described by `config`,
+    or None if it is disabled."""
+    if not config.cache_size_mb:
+        return None
+    key = tuple(sorted(config.as_dict().items()))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(key)
+        if cache is None:
+            cache = _CACHES[key] = ReadCache(int(config.cache_size_mb * 2**20))
+        return cache
+
+
+def cache_stats() -> dict:
+    """Hit/miss statistics of every read cache in this process, by database."""
+    with _CACHES_LOCK:
+        caches = dict(_CACHES)
+    return {
+        "{user}@{host}:{port}/{database}".format(**dict(key)): cache.stats()
+        for key, cache in caches.items()
+    }
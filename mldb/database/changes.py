@@ -0,0 +1,164 @@
+import json
+import select
+import threading
+import time
+from collections import namedtuple
+from typing import List
+
+from psycopg2 import OperationalError, connect
+
+from .cache import get_cache
+
+# Triggers on the tables below (see migration 8) publish a notification on
+# CHANNEL for each experiment a statement writes to, as a JSON object with the
+# experiment's id, the table (in lower case) and the latest epoch written, or
+# null for tables without one. Notifications are only delivered once the
+# transaction commits, and identical ones in a transaction are sent once.
+CHANNEL = "mldb_changes"
+
+# table: the column holding the epoch, if any
+NOTIFYING_TABLES = dict(
+    STATUS=None,
+    HYPERPARAMS=None,
+    EXPGROUPS=None,
+    DELETIONS=None,
+    LOSS="EPOCH",
+    METRICS="EPOCH",
+    LEARNINGRATE="EPOCH",
+    STEPS="STEP",
+    QUALITATIVERESULTS="EPOCH",
+    QUALITATIVEARRAYS="EPOCH",
+)
+
+Change = namedtuple("Change", ["expid", "table", "epoch"])
+
+
+def parse(payload: str) -> Change:
+    data = json.loads(payload)
+    return Change(data["expid"], data["table"].upper(), data["epoch"])
+
+
+def matches(change: Change, expids=None, tables=None) -> bool:
+    """Whether `change` is to one of `expids` and `tables` (None: any)."""
+    return (expids is None or change.expid in expids) and (
+        tables is None or change.table in tables
+    )
+
+
+def open_listener(config):
+    """A new connection (not from the pool: it is kept waiting) listening on
+    CHANNEL."""
+    conn = connect(**config.as_dict())
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {CHANNEL};")
+    return conn
+
+
+def receive(conn, wait: float = None) -> List[Change]:
+    """Changes notified on the listening `conn`, waiting up to `wait` seconds
+    (forever if None) for the first."""
+    if not conn.notifies:
+        select.select([conn], [], [], wait)
+    conn.poll()
+    received = [parse(n.payload) for n in conn.notifies]
+    del conn.notifies[:]
+    return received
+
+
+def iter_changes(config, expids=None, tables=None, timeout: float = None):
+    """Yield the changes to `expids` and `tables` (None: any) as they are
+    committed, until none come for `timeout` seconds (forever if None)."""
+    expids = None if expids is None else set(expids)
+    tables = None if tables is None else {t.upper() for t in tables}
+    conn = open_listener(config)
+    try:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                return
+            for change in receive(conn, wait):
+                if matches(change, expids, tables):
+                    yield change
+                    if deadline is not None:
+                        deadline = time.monotonic() + timeout
+    finally:
+        conn.close()
+
+
+class ChangeListener:
+    """Calls `callback(change)` from a background thread for each change to
+    `expids` and `tables` (None: any), until stopped.
+
+    Whatever the process's read cache holds about a changed experiment is
+    dropped first. If the connection is lost, the listener reconnects; changes
+    committed meanwhile can't be told apart, so on reconnecting it clears the
+    read cache and calls `on_missed()`, if given, for the caller to treat
+    everything as changed.
+    """
+
+    def __init__(
+        self,
+        config,
+        callback,
+        expids=None,
+        tables=None,
+        poll_interval: float = 0.5,
+        retry_interval: float = 5.0,
+        on_missed=None,
+    ):
+        self.config = config
+        self.callback = callback
+        self.expids = None if expids is None else set(expids)
+        self.tables = None if tables is None else {t.upper() for t in tables}
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.on_missed = on_missed
+        self.cache = get_cache(config)
+        # of the current connection, to tell it apart in pg_stat_activity
+        self.backend_pid = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="mldb-change-listener", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def missed_changes(self):
+        if self.cache is not None:
+            self.cache.clear()
+        if self.on_missed is not None:
+            self.on_missed()
+
+    def run(self):
+        conn = None
+        connected = False
+        while not self.stopping.is_set():
+            try:
+                if conn is None:
+                    conn = open_listener(self.config)
+                    self.backend_pid = conn.get_backend_pid()
+                    # listening again: anything before now may have been missed
+                    if connected:
+                        self.missed_changes()
+                    connected = True
+                for change in receive(conn, self.poll_interval):
+                    if self.cache is not None:
+                        self.cache.invalidate([change.expid])
+                    if matches(change, self.expids, self.tables):
+                        self.callback(change)
+            except OperationalError as e:
+                print(f"mldb: lost the change feed ({e}), reconnecting")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self.stopping.wait(self.retry_interval)
+        if conn is not None:
+            conn.close()
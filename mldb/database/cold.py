@@ -0,0 +1,48 @@
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import List
+
+from . import archive
+
+# Qualitative results of experiments that finished long ago are moved out of
+# the database into compressed files (in the archive format) under root_dir,
+# leaving their path in QUALITATIVECOLD: the database stores the path, not
+# the blob. Each move writes a new directory, so the one a committed pointer
+# refers to is never modified.
+COLD_DIR = ".mldb_cold"
+COLD_TABLES = ["QUALITATIVERESULTS", "QUALITATIVEARRAYS"]
+
+
+def new_cold_path(expid: str) -> str:
+    """Path, relative to root_dir, for a new generation of `expid`'s files."""
+    generation = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(COLD_DIR, expid.replace(os.sep, "_"), generation)
+
+
+def save(path: str, rows_by_table: dict):
+    os.makedirs(path, exist_ok=True)
+    for table in COLD_TABLES:
+        archive.save_table(path, table, rows_by_table.get(table, []))
+
+
+def load_rows(path: str, table: str, plot_id: str = None) -> list:
+    """Rows of `table` (expid, epoch, plotid, value) stored at `path`,
+    optionally only those of `plot_id`."""
+    rows = archive.load_table(path, table)
+    if plot_id is not None:
+        rows = [r for r in rows if r[2] == plot_id]
+    return rows
+
+
+def plot_ids(path: str) -> List[str]:
+    ids = []
+    for table in COLD_TABLES:
+        for row in load_rows(path, table):
+            if row[2] not in ids:
+                ids.append(row[2])
+    return ids
+
+
+def remove(path: str):
+    shutil.rmtree(path, ignore_errors=True)
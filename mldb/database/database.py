@@ -1,61 +1,190 @@
 import os
+import io
+import csv
 import json
-from typing import List
+import itertools
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Tuple
 
 import numpy as np
 from psycopg2 import connect
-import psycopg2.sql as sql
+from psycopg2.extras import execute_values
 
 from ..config import CONFIG
-from .schema import SCHEMA, TABLES
-from .exception import NoDataError
+from .base import BaseDatabase
+from .schema import SCHEMA, TABLES, REGISTRIES, KEYED_TABLES
+from .exception import NoDataError, SchemaVersionError
+from .buffer import WriteBuffer
+from .pool import get_pool
+from .keys import KeyCache, get_keys
+from .cache import cached_read, get_cache
+from .partitions import partition
+from .search import search_query
+from . import archive, cold, changes
+from .migrations import (
+    LATEST_VERSION,
+    REQUIRED_VERSION,
+    get_version,
+    is_fresh,
+    migrate,
+)
 
 
-class Database:
+class Database(BaseDatabase):
 
     COMMAND_SET_STATUS = "INSERT INTO STATUS (EXPID, STATUS) VALUES (%s, %s) ON CONFLICT (EXPID) DO UPDATE SET STATUS=excluded.STATUS;"
     COMMAND_GET_STATUS = "SELECT * FROM STATUS WHERE EXPID=%s;"
     COMMAND_ADD_LOSS = (
-        "INSERT INTO LOSS (EXPID, KIND, EPOCH, VALUE) VALUES (%s, %s, %s, %s)"
+        "INSERT INTO LOSS (EXPKEY, KINDKEY, EPOCH, VALUE) VALUES (%s, %s, %s, %s)"
     )
-    COMMAND_GET_LOSSES = "SELECT * FROM LOSS WHERE EXPID=%s;"
+    COMMAND_GET_LOSSES = "SELECT EXPID, EPOCH, KIND, VALUE FROM LOSS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s ORDER BY KIND, EPOCH;"
     COMMAND_ADD_HYPERPARAM = (
         "INSERT INTO HYPERPARAMS (EXPID, NAME, VALUE) VALUES (%s, %s, %s)"
     )
-    COMMAND_GET_HYPERPARAMS = "SELECT * FROM HYPERPARAMS WHERE EXPID=%s;"
+    COMMAND_GET_HYPERPARAMS = (
+        "SELECT EXPID, NAME, VALUE FROM HYPERPARAMS WHERE EXPID=%s;"
+    )
     COMMAND_ADD_METRICS = (
-        "INSERT INTO METRICS (EXPID, KIND, EPOCH, VALUE) VALUES (%s, %s, %s, %s);"
+        "INSERT INTO METRICS (EXPKEY, KINDKEY, EPOCH, VALUE) VALUES (%s, %s, %s, %s);"
     )
-    COMMAND_GET_LATEST_METRICS = "SELECT * FROM METRICS WHERE (EXPID, EPOCH) IN (SELECT EXPID, max(EPOCH) FROM METRICS WHERE EXPID=%s GROUP BY EXPID);"
+    COMMAND_GET_LATEST_METRICS = "SELECT EXPID, EPOCH, KIND, VALUE FROM LATESTMETRICS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s;"
     COMMAND_SET_CONFIG = "INSERT INTO CONFIG (EXPID, CONFIG) VALUES (%s, %s);"
-    COMMAND_ADD_STATE = "INSERT INTO STATE (EXPID, EPOCH, PATH) VALUES (%s, %s, %s);"
-    COMMAND_GET_STATE = "SELECT PATH FROM STATE WHERE EXPID=? AND EPOCH=%s;"
-    COMMAND_GET_EXPERIMENT_DETAILS = "SELECT * FROM STATUS INNER JOIN LOSS ON status.expid=loss.expid WHERE status.expid=%s;"
+    COMMAND_ADD_STATE = "INSERT INTO STATE (EXPKEY, EPOCH, PATH) VALUES (%s, %s, %s);"
+    COMMAND_GET_STATE = "SELECT PATH FROM STATE WHERE EXPKEY=%s AND EPOCH=%s;"
+    COMMAND_GET_EXPERIMENT_DETAILS = "SELECT * FROM STATUS JOIN EXPERIMENTS USING (EXPID) JOIN LOSS USING (EXPKEY) WHERE EXPID=%s;"
     COMMAND_ADD_LR = (
-        "INSERT INTO LEARNINGRATE (EXPID, EPOCH, VALUE) VALUES (%s, %s, %s)"
+        "INSERT INTO LEARNINGRATE (EXPKEY, EPOCH, VALUE) VALUES (%s, %s, %s)"
     )
     COMMAND_GET_LRS = (
-        "SELECT (EPOCH, VALUE) FROM LEARNINGRATE WHERE EXPID=%s ORDER BY EPOCH;"
+        "SELECT EPOCH, VALUE FROM LEARNINGRATE WHERE EXPKEY=%s ORDER BY EPOCH;"
     )
     COMMAND_ADD_QUALRESMETA = (
         "INSERT INTO QUALITATIVERESULTSMETA (EXPID, PLOTID, VALUE) VALUES (%s, %s, %s)"
     )
-    COMMAND_ADD_QUALRES = "INSERT INTO QUALITATIVERESULTS (EXPID, EPOCH, PLOTID, VALUE) VALUES (%s, %s, %s, %s)"
-    COMMAND_GET_QUALRES = (
-        "SELECT * FROM QUALITATIVERESULTS WHERE EXPID=%s AND PLOTID=%s;"
-    )
+    COMMAND_ADD_QUALRES = "INSERT INTO QUALITATIVERESULTS (EXPKEY, EPOCH, PLOTKEY, VALUE) VALUES (%s, %s, %s, %s)"
+    COMMAND_GET_QUALRES = "SELECT EXPKEY, EPOCH, PLOTKEY, VALUE FROM QUALITATIVERESULTS WHERE EXPKEY=%s AND PLOTKEY=%s;"
+    COMMAND_ADD_QUALRES_ARRAYS = "INSERT INTO QUALITATIVEARRAYS (EXPKEY, EPOCH, PLOTKEY, VALUE) VALUES (%s, %s, %s, %s)"
+    COMMAND_GET_QUALRES_ARRAYS = "SELECT EXPKEY, EPOCH, PLOTKEY, VALUE FROM QUALITATIVEARRAYS WHERE EXPKEY=%s AND PLOTKEY=%s;"
+    COMMAND_GET_QUALRES_PLOTIDS = "SELECT PLOTID FROM PLOTS WHERE PLOTKEY IN (SELECT PLOTKEY FROM QUALITATIVERESULTS WHERE EXPKEY=%s UNION SELECT PLOTKEY FROM QUALITATIVEARRAYS WHERE EXPKEY=%s);"
     COMMAND_GET_QUALRESMETA = (
         "SELECT * FROM QUALITATIVERESULTSMETA WHERE EXPID=%s AND PLOTID=%s;"
     )
     COMMAND_ADD_TO_GROUP = "INSERT INTO EXPGROUPS (EXPID, GROUPNAME) VALUES (%s, %s);"
-    COMMAND_REMOVE_FROM_GROUP = "DELETE FROM EXPGROUPS WHERE EXPID=%s AND GROUPNAME=%s;"
+    # deletions are logged for local mirrors to catch up with
+    COMMAND_REMOVE_FROM_GROUP = "WITH removed AS (DELETE FROM EXPGROUPS WHERE EXPID=%s AND GROUPNAME=%s RETURNING EXPID, GROUPNAME) INSERT INTO DELETIONS (EXPID, GROUPNAME) SELECT EXPID, GROUPNAME FROM removed;"
     COMMAND_GET_GROUP = "SELECT EXPID FROM EXPGROUPS WHERE GROUPNAME=%s;"
     COMMAND_GET_GROUPS_OF_EXP = "SELECT GROUPNAME FROM EXPGROUPS WHERE EXPID=%s;"
-    COMMAND_DELETE_EXPERIMENT = "DELETE FROM {} WHERE EXPID=%s;"
+    COMMAND_GET_COLD_PATH = "SELECT PATH FROM QUALITATIVECOLD WHERE EXPKEY=%s;"
+    COMMAND_GET_COLD_PATHS_MANY = (
+        "SELECT PATH FROM QUALITATIVECOLD WHERE EXPKEY = ANY(%s);"
+    )
+    COMMAND_SET_COLD_PATH = "INSERT INTO QUALITATIVECOLD (EXPKEY, PATH) VALUES (%s, %s) ON CONFLICT (EXPKEY) DO UPDATE SET PATH=excluded.PATH;"
+    COMMAND_GET_COLD_CANDIDATES = "SELECT EXPID FROM STATUS JOIN STATUSTIMES USING (EXPID) JOIN EXPERIMENTS USING (EXPID) WHERE STATUS='COMPLETE' AND UPDATED < now() - %s * interval '1 day' AND (EXISTS (SELECT 1 FROM QUALITATIVERESULTS q WHERE q.EXPKEY=EXPERIMENTS.EXPKEY) OR EXISTS (SELECT 1 FROM QUALITATIVEARRAYS a WHERE a.EXPKEY=EXPERIMENTS.EXPKEY)) ORDER BY EXPID;"
+    COMMAND_DELETE_EXPERIMENTS = "DELETE FROM {} WHERE EXPID = ANY(%s);"
+    COMMAND_DELETE_EXPERIMENTS_BY_KEY = "DELETE FROM {} WHERE EXPKEY = ANY(%s);"
+    COMMAND_LOG_DELETIONS = "INSERT INTO DELETIONS (EXPID) SELECT unnest(%s::text[]);"
+
+    # lookups for many experiments at once
+    COMMAND_GET_STATUS_MANY = "SELECT EXPID, STATUS FROM STATUS WHERE EXPID = ANY(%s);"
+    COMMAND_GET_LOSSES_MANY = "SELECT EXPID, EPOCH, KIND, VALUE FROM LOSS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY) WHERE EXPKEY = ANY(%s) ORDER BY EXPID, KIND, EPOCH;"
+    COMMAND_GET_LRS_MANY = "SELECT EXPID, EPOCH, VALUE FROM LEARNINGRATE JOIN EXPERIMENTS USING (EXPKEY) WHERE EXPKEY = ANY(%s) ORDER BY EXPID, EPOCH;"
+    COMMAND_GET_HYPERPARAMS_MANY = (
+        "SELECT EXPID, NAME, VALUE FROM HYPERPARAMS WHERE EXPID = ANY(%s);"
+    )
+    COMMAND_GET_LATEST_METRICS_MANY = "SELECT EXPID, EPOCH, KIND, VALUE FROM LATESTMETRICS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY) WHERE EXPKEY = ANY(%s);"
+    COMMAND_GET_GROUPS_MANY = (
+        "SELECT EXPID, GROUPNAME FROM EXPGROUPS WHERE EXPID = ANY(%s);"
+    )
+    COMMAND_GET_GROUPS_OF_MANY_EXPS = (
+        "SELECT DISTINCT GROUPNAME FROM EXPGROUPS WHERE EXPID = ANY(%s);"
+    )
+
+    # a page of experiments in id order, following the last id of the page
+    # before (keyset pagination): one subquery per status, each reading the
+    # STATUS_STATUS_EXPID index in order and stopping after a page
+    COMMAND_GET_STATUS_PAGE = (
+        "SELECT EXPID, STATUS FROM ({pages}) AS PAGES ORDER BY EXPID {order} LIMIT %s;"
+    )
+    COMMAND_GET_STATUS_PAGE_OF = "(SELECT EXPID, STATUS FROM STATUS WHERE {conditions} ORDER BY EXPID {order} LIMIT %s)"
+
+    # multi-row variants of the above, used when flushing buffered writes
+    COMMAND_ADD_LOSS_MANY = (
+        "INSERT INTO LOSS (EXPKEY, KINDKEY, EPOCH, VALUE) VALUES %s;"
+    )
+    COMMAND_ADD_HYPERPARAM_MANY = (
+        "INSERT INTO HYPERPARAMS (EXPID, NAME, VALUE) VALUES %s;"
+    )
+    COMMAND_ADD_METRICS_MANY = (
+        "INSERT INTO METRICS (EXPKEY, KINDKEY, EPOCH, VALUE) VALUES %s;"
+    )
+    COMMAND_ADD_LR_MANY = "INSERT INTO LEARNINGRATE (EXPKEY, EPOCH, VALUE) VALUES %s;"
+
+    COMMAND_ADD_STEP = "INSERT INTO STEPS (EXPKEY, KINDKEY, STEP, VALUE, WALLTIME) VALUES (%s, %s, %s, %s, %s);"
+    COMMAND_ADD_STEP_MANY = (
+        "INSERT INTO STEPS (EXPKEY, KINDKEY, STEP, VALUE, WALLTIME) VALUES %s;"
+    )
+    COMMAND_GET_STEPS = "SELECT KIND, STEP, VALUE, EXTRACT(EPOCH FROM WALLTIME) FROM STEPS JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s ORDER BY KIND, STEP;"
+    COMMAND_GET_STEPS_OF_KIND = "SELECT KIND, STEP, VALUE, EXTRACT(EPOCH FROM WALLTIME) FROM STEPS JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s AND KINDKEY=%s ORDER BY STEP;"
+
+    # columnar reads: rows come ordered by kind, so each kind is one contiguous run
+    COMMAND_GET_LOSS_COLUMNS = "SELECT KIND, EPOCH, VALUE FROM LOSS JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s ORDER BY KIND, EPOCH;"
+    COMMAND_GET_METRIC_HISTORY = "SELECT KIND, EPOCH, VALUE FROM METRICS JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s ORDER BY KIND, EPOCH;"
+    COMMAND_GET_METRIC_HISTORY_OF_KIND = "SELECT KIND, EPOCH, VALUE FROM METRICS JOIN KINDS USING (KINDKEY) WHERE EXPKEY=%s AND KINDKEY=%s ORDER BY EPOCH;"
+
+    COMMAND_CREATE_BULK_STAGING = (
+        "CREATE TEMP TABLE MLDB_BULK_STAGING (LIKE {table}) ON COMMIT DROP;"
+    )
+    COMMAND_COPY_CSV = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv);"
+    COMMAND_INSERT_FROM_STAGING = "INSERT INTO {table} ({columns}) SELECT {columns} FROM MLDB_BULK_STAGING ON CONFLICT ({keys}) {action};"
+    BULK_CONFLICT_ACTIONS = dict(
+        skip="DO NOTHING", overwrite="DO UPDATE SET VALUE=excluded.VALUE"
+    )
+
+    # methods that only write, which can be queued or journalled to run later
+    WRITE_METHODS = {
+        "set_exp_status",
+        "add_loss_value",
+        "add_hyperparam",
+        "add_metric_value",
+        "add_lr_value",
+        "add_loss_values",
+        "add_metric_values",
+        "add_lr_values",
+        "add_step_value",
+        "add_step_values",
+        "set_config_file",
+        "add_state_file",
+        "add_qualitative_result",
+        "add_qualitative_result_json",
+        "add_qualitative_result_arrays",
+        "add_qualitative_metadata",
+        "add_qualitative_metadata_json",
+    }
+    # those of them whose rows go through the write buffer when buffering;
+    # the others commit as they are called
+    BUFFERED_METHODS = {
+        "add_loss_value",
+        "add_hyperparam",
+        "add_metric_value",
+        "add_lr_value",
+        "add_step_value",
+    }
 
     TABLES = TABLES
 
-    def __init__(self):
+    # rows fetched at a time by iter_query and iter_chunks
+    CHUNK_SIZE = 2000
+    _cursor_ids = itertools.count()
+
+    def __init__(
+        self,
+        buffered=False,
+        buffer_size: int = 1000,
+        flush_interval: float = 5.0,
+        pooled=True,
+        cached=False,
+    ):
         self.root_dir = CONFIG.root_dir
         self.host = CONFIG.host
         self.user = CONFIG.user
@@ -63,9 +192,23 @@ class Database:
         self.database = CONFIG.database
         self.conn = None
         self.cursor = None
+        self.buffer = None
+        # experiments with rows in the buffer, which mustn't be cached until written
+        self.unflushed = set()
+        self.pool = get_pool(CONFIG) if pooled else None
+        self.keys = get_keys(CONFIG)
+        self.cache = get_cache(CONFIG) if cached else None
+        self.cache_ttl = CONFIG.cache_ttl
 
         self.connect()
-        self.ensure_schema()
+        try:
+            self.ensure_schema()
+        except Exception:
+            self.close()
+            raise
+
+        if buffered:
+            self.start_buffering(buffer_size, flush_interval)
 
     def __enter__(self):
         return self
@@ -82,44 +225,64 @@ class Database:
     def desanitise_path(self, sanitised_path: str) -> str:
         return os.path.join(self.root_dir, sanitised_path)
 
-    @classmethod
-    def sanitise_value(cls, v):
-        if isinstance(v, (str, int, float)):
-            return v
-        elif hasattr(v, "detach") and hasattr(v, "cpu") and hasattr(v, "numpy"):
-            return cls.sanitise_value(v.detach().cpu().numpy())
-        elif isinstance(v, (np.float16, np.float32, np.float64)):
-            return float(v)
-        elif isinstance(
-            v,
-            (
-                np.int8,
-                np.int16,
-                np.int32,
-                np.int64,
-                np.uint8,
-                np.uint16,
-                np.uint32,
-                np.uint64,
-            ),
-        ):
-            return int(v)
-        elif hasattr(v, "__iter__"):
-            return [cls.sanitise_value(vi) for vi in v]
-        else:
-            raise ValueError(f"Unexpected type encountered: {type(v)}.")
-
     def add_qualitative_result(
-        self, exp_id: str, epoch: int, plot_id: str, output, target=None, **extra
+        self,
+        exp_id: str,
+        epoch: int,
+        plot_id: str,
+        output,
+        target=None,
+        encoding: str = "json",
+        **extra,
     ):
+        """Store a qualitative result. With `encoding="binary"`, output, target
+        and extras are stored as typed arrays and read back as NumPy arrays
+        (scalars and strings as Python values), skipping the element-by-element
+        conversion to and from JSON."""
+        if encoding == "binary":
+            data = dict(output=output, **extra)
+            if target is not None:
+                data["target"] = target
+            self.add_qualitative_result_arrays(exp_id, epoch, plot_id, **data)
+            return
+        elif encoding != "json":
+            raise ValueError(
+                f'Unknown encoding "{encoding}", expected "json" or "binary".'
+            )
+
         data = dict(output=self.sanitise_value(output), **extra)
         if target is not None:
             data["target"] = self.sanitise_value(target)
 
         self.add_qualitative_result_json(exp_id, epoch, plot_id, json.dumps(data))
 
+    @staticmethod
+    def to_ndarray(v) -> np.ndarray:
+        if hasattr(v, "detach") and hasattr(v, "cpu") and hasattr(v, "numpy"):
+            v = v.detach().cpu().numpy()
+        return np.asarray(v)
+
+    @classmethod
+    def encode_arrays(cls, **arrays) -> bytes:
+        f = io.BytesIO()
+        np.savez(f, **{k: cls.to_ndarray(v) for k, v in arrays.items()})
+        return f.getvalue()
+
+    @staticmethod
+    def decode_arrays(value) -> dict:
+        with np.load(io.BytesIO(value), allow_pickle=False) as arrays:
+            # scalars and strings were saved as 0-d arrays: give them back as
+            # Python values, as the JSON encoding does
+            return {
+                k: a.item() if a.ndim == 0 else a
+                for k, a in ((k, arrays[k]) for k in arrays.files)
+            }
+
     def connect(self):
-        self.conn = connect(**CONFIG.as_dict())
+        if self.pool is not None:
+            self.conn = self.pool.getconn()
+        else:
+            self.conn = connect(**CONFIG.as_dict())
         self.cursor = self.conn.cursor()
 
     def run_query(self, *commands):
@@ -134,36 +297,373 @@ class Database:
         self.run_query(*commands)
         return self.cursor.fetchall()
 
-    def ensure_schema(self):
-        self.run_query_and_commit(*SCHEMA)
+    def iter_chunks(self, command: str, args=None, chunk_size: int = None):
+        """Yield the rows of the query `command` in lists of up to
+        `chunk_size` rows. They are fetched as they are asked for, through a
+        server-side cursor, so only a chunk at a time is held in memory.
+
+        The cursor lives in the connection's transaction, which is ended once
+        the rows run out (or iteration stops): don't write while iterating.
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        name = f"mldb_iter_{next(self._cursor_ids)}"
+        try:
+            with self.conn.cursor(name=name) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(command, args)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def iter_query(self, command: str, args=None, chunk_size: int = None):
+        """Yield the rows of the query `command` one at a time, fetching
+        `chunk_size` at once (see iter_chunks)."""
+        for rows in self.iter_chunks(command, args, chunk_size):
+            yield from rows
+
+    def ensure_schema(self, force=False):
+        # pooled connections share one check per process
+        if self.pool is not None and self.pool.schema_verified and not force:
+            return
+
+        version = get_version(self.conn)
+        if version < LATEST_VERSION:
+            if version == 0 and is_fresh(self.conn):
+                # nothing to convert in a new database, so migrations are quick
+                migrate(self.conn)
+                if CONFIG.partitions:
+                    partition(self.conn, CONFIG.partitions)
+            elif version < REQUIRED_VERSION:
+                raise SchemaVersionError(
+                    f"Database schema is at version {version}, but at least "
+                    f"{REQUIRED_VERSION} is needed. Run `python -m mldb migrate` to upgrade."
+                )
+            else:
+                self.run_query_and_commit(*SCHEMA)
+                print(
+                    f"mldb: database schema is at version {version}, latest is "
+                    f"{LATEST_VERSION}. Run `python -m mldb migrate` to upgrade."
+                )
+
+        if self.pool is not None:
+            self.pool.schema_verified = True
 
     def close(self):
-        self.conn.close()
+        if self.conn is None:
+            return
+        try:
+            self.stop_buffering()
+        finally:
+            conn, self.conn = self.conn, None
+            if self.pool is not None:
+                self.pool.putconn(conn)
+            else:
+                conn.close()
+
+    def start_buffering(self, buffer_size: int = 1000, flush_interval: float = 5.0):
+        if self.buffer is None:
+            self.buffer = WriteBuffer(
+                self.run_many_and_commit,
+                buffer_size,
+                flush_interval,
+                flush_apart_fn=self.run_many_apart,
+                on_flush=self.invalidate_flushed,
+            )
+
+    def stop_buffering(self, discard: bool = False):
+        """Stop buffering, writing the pending rows (or dropping them, if
+        `discard`)."""
+        buffer, self.buffer = self.buffer, None
+        if buffer is not None:
+            if discard:
+                buffer.discard()
+                self.invalidate_flushed()
+            else:
+                buffer.close()
+
+    def flush(self):
+        if self.buffer is not None:
+            self.buffer.flush()
+
+    @contextmanager
+    def buffered(self, buffer_size: int = 1000, flush_interval: float = 5.0):
+        """Buffer loss, metric, LR and hyperparameter writes within the context,
+        flushing them as multi-row inserts."""
+        if self.buffer is not None:
+            # already buffering: leave the outer buffer in charge
+            yield self
+            return
+
+        self.start_buffering(buffer_size, flush_interval)
+        try:
+            yield self
+        finally:
+            self.stop_buffering()
+
+    def run_many_and_commit(self, command: str, rows: List[tuple]):
+        if self.conn is None or self.conn.closed:
+            raise RuntimeError(f"Connection closed with {len(rows)} rows unwritten.")
+        try:
+            with self.conn.cursor() as cursor:
+                execute_values(cursor, command, rows, page_size=len(rows))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def run_many_apart(self, command: str, rows: List[tuple]):
+        """run_many_and_commit on a connection of its own, for flushes from
+        the buffer's timer thread, at exit and on SIGTERM: committing on
+        self.conn could commit half of the owner's transaction."""
+        if self.pool is not None:
+            conn = self.pool.getconn()
+        else:
+            conn = connect(**CONFIG.as_dict())
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, command, rows, page_size=len(rows))
+            conn.commit()
+        finally:
+            if self.pool is not None:
+                self.pool.putconn(conn)
+            else:
+                conn.close()
+
+    @classmethod
+    def as_array(cls, v, dtype) -> np.ndarray:
+        return np.asarray(cls.to_ndarray(v), dtype=dtype).reshape(-1)
+
+    def copy_rows(
+        self,
+        table: str,
+        columns: List[str],
+        keys: List[str],
+        rows,
+        on_conflict: str = None,
+    ):
+        """Stream `rows` into `table` with COPY in a single transaction.
+
+        With `on_conflict` of "skip" or "overwrite", rows are staged in a
+        temporary table first and merged on the `keys` unique constraint, so
+        loading the same data twice is harmless. Otherwise any clash raises."""
+        if on_conflict is not None and on_conflict not in self.BULK_CONFLICT_ACTIONS:
+            raise ValueError(
+                f'Unknown on_conflict "{on_conflict}", expected None, "skip" or "overwrite".'
+            )
+
+        # keep ordering with respect to anything buffered
+        self.flush()
+
+        data = io.StringIO()
+        csv.writer(data).writerows(rows)
+        data.seek(0)
+
+        columns = ", ".join(columns)
+        try:
+            if on_conflict is None:
+                self.cursor.copy_expert(
+                    self.COMMAND_COPY_CSV.format(table=table, columns=columns), data
+                )
+            else:
+                self.cursor.execute(
+                    self.COMMAND_CREATE_BULK_STAGING.format(table=table)
+                )
+                self.cursor.copy_expert(
+                    self.COMMAND_COPY_CSV.format(
+                        table="MLDB_BULK_STAGING", columns=columns
+                    ),
+                    data,
+                )
+                self.cursor.execute(
+                    self.COMMAND_INSERT_FROM_STAGING.format(
+                        table=table,
+                        columns=columns,
+                        keys=", ".join(keys),
+                        action=self.BULK_CONFLICT_ACTIONS[on_conflict],
+                    )
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @classmethod
+    def epoch_value_rows(cls, prefix: tuple, epochs, values, dedupe: bool):
+        epochs = cls.as_array(epochs, np.int64)
+        values = cls.as_array(values, np.float64)
+        if len(epochs) != len(values):
+            raise ValueError(f"Got {len(epochs)} epochs but {len(values)} values.")
+
+        if dedupe:
+            # one row per epoch (the last given), else the merge would hit the same row twice
+            _, last = np.unique(epochs[::-1], return_index=True)
+            keep = np.sort(len(epochs) - 1 - last)
+            epochs, values = epochs[keep], values[keep]
+
+        return [(*prefix, e, v) for e, v in zip(epochs.tolist(), values.tolist())]
+
+    def add_loss_values(
+        self, exp_id: str, kind: str, epochs, values, on_conflict: str = None
+    ):
+        keys = (self.experiment_key(exp_id, True), self.kind_key(kind, True))
+        rows = self.epoch_value_rows(keys, epochs, values, on_conflict is not None)
+        self.copy_rows(
+            "LOSS",
+            ["EXPKEY", "KINDKEY", "EPOCH", "VALUE"],
+            ["EXPKEY", "EPOCH", "KINDKEY"],
+            rows,
+            on_conflict,
+        )
+        self.invalidate(exp_id)
+
+    def add_metric_values(
+        self, exp_id: str, kind: str, epochs, values, on_conflict: str = None
+    ):
+        keys = (self.experiment_key(exp_id, True), self.kind_key(kind, True))
+        rows = self.epoch_value_rows(keys, epochs, values, on_conflict is not None)
+        self.copy_rows(
+            "METRICS",
+            ["EXPKEY", "KINDKEY", "EPOCH", "VALUE"],
+            ["EXPKEY", "EPOCH", "KINDKEY"],
+            rows,
+            on_conflict,
+        )
+        self.invalidate(exp_id)
+
+    def add_lr_values(self, exp_id: str, epochs, values, on_conflict: str = None):
+        keys = (self.experiment_key(exp_id, True),)
+        rows = self.epoch_value_rows(keys, epochs, values, on_conflict is not None)
+        self.copy_rows(
+            "LEARNINGRATE",
+            ["EXPKEY", "EPOCH", "VALUE"],
+            ["EXPKEY", "EPOCH"],
+            rows,
+            on_conflict,
+        )
+        self.invalidate(exp_id)
+
+    def lookup_keys(self, cache: KeyCache, names, create: bool = False) -> list:
+        """Integer keys of `names` in one of the registries; None for names
+        not registered yet, unless `create` is set to register them."""
+        missing = cache.missing(names)
+        if missing:
+            if create:
+                self.cursor.execute(cache.command_add, (missing,))
+            self.cursor.execute(cache.command_get, (missing,))
+            cache.update(self.cursor.fetchall())
+            # commit straight away: a key cached from a transaction that is
+            # later rolled back would point at nothing
+            self.conn.commit()
+        return [cache[n] for n in names]
+
+    def experiment_key(self, exp_id: str, create: bool = False):
+        return self.lookup_keys(self.keys.experiments, [exp_id], create)[0]
+
+    def experiment_keys(self, expids: List[str]) -> List[int]:
+        """Keys of the registered experiments among `expids`."""
+        keys = self.lookup_keys(self.keys.experiments, expids)
+        return [k for k in keys if k is not None]
+
+    def kind_key(self, kind: str, create: bool = False):
+        return self.lookup_keys(self.keys.kinds, [kind], create)[0]
+
+    def plot_key(self, plot_id: str, create: bool = False):
+        return self.lookup_keys(self.keys.plots, [plot_id], create)[0]
+
+    def write(self, exp_id: str, command: str, command_many: str, args: tuple):
+        buffer = self.buffer
+        if buffer is not None:
+            with buffer.lock:
+                self.unflushed.add(exp_id)
+                buffer.add(command_many, args)
+        else:
+            self.cursor.execute(command, args)
+            self.conn.commit()
+            self.invalidate(exp_id)
+
+    def invalidate_flushed(self):
+        """Drop what is cached about the experiments whose buffered rows have
+        just been written (or discarded)."""
+        expids, self.unflushed = self.unflushed, set()
+        self.invalidate(*expids)
 
     def set_exp_status(self, exp_id: str, status: str):
+        # write what is buffered first, so a finished experiment is never
+        # seen (and cached) without its last values
+        self.flush()
+        self.experiment_key(exp_id, create=True)
         self.cursor.execute(self.COMMAND_SET_STATUS, (exp_id, status))
         self.conn.commit()
+        self.invalidate(exp_id)
+
+    def invalidate(self, *expids):
+        """Drop what this process's read cache holds about `expids`."""
+        if self.cache is not None:
+            self.cache.invalidate(expids)
+
+    def subscribe(
+        self, expids: List[str] = None, tables: List[str] = None, timeout: float = None
+    ):
+        """Yield a Change (expid, table, epoch) for each write to `expids` and
+        `tables` (None: any) committed from now on, by any process, until none
+        come for `timeout` seconds (forever if None). Changes are listened for
+        on a connection of their own; what this process's read cache holds
+        about a changed experiment is dropped before it is yielded."""
+        for change in changes.iter_changes(CONFIG, expids, tables, timeout):
+            self.invalidate(change.expid)
+            yield change
 
     def add_loss_value(self, exp_id: str, kind: str, epoch: int, value: float):
-        self.cursor.execute(self.COMMAND_ADD_LOSS, (exp_id, kind, epoch, value))
-        self.conn.commit()
+        self.write(
+            exp_id,
+            self.COMMAND_ADD_LOSS,
+            self.COMMAND_ADD_LOSS_MANY,
+            (
+                self.experiment_key(exp_id, True),
+                self.kind_key(kind, True),
+                epoch,
+                value,
+            ),
+        )
 
     def add_hyperparam(self, exp_id: str, name: str, value: str):
-        self.cursor.execute(self.COMMAND_ADD_HYPERPARAM, (exp_id, name, value))
-        self.conn.commit()
+        self.write(
+            exp_id,
+            self.COMMAND_ADD_HYPERPARAM,
+            self.COMMAND_ADD_HYPERPARAM_MANY,
+            (exp_id, name, value),
+        )
 
+    @cached_read
     def get_hyperparams(self, exp_id: str) -> dict:
         self.cursor.execute(self.COMMAND_GET_HYPERPARAMS, (exp_id,))
-        results = self.cursor.fetchall()
+        return self.hyperparams_from_rows(self.cursor.fetchall())
 
+    @staticmethod
+    def hyperparams_from_rows(results) -> dict:
         rv = dict()
-        for (_, k, v) in results:
+        for _, k, v in results:
             rv[k] = v
         return rv
 
     def add_metric_value(self, exp_id: str, kind: str, epoch: int, value: float):
-        self.cursor.execute(self.COMMAND_ADD_METRICS, (exp_id, kind, epoch, value))
-        self.conn.commit()
+        self.write(
+            exp_id,
+            self.COMMAND_ADD_METRICS,
+            self.COMMAND_ADD_METRICS_MANY,
+            (
+                self.experiment_key(exp_id, True),
+                self.kind_key(kind, True),
+                epoch,
+                value,
+            ),
+        )
 
     def set_config_file(self, exp_id, config_file_path: str):
         config_file_path = self.sanitise_path(config_file_path)
@@ -175,7 +675,10 @@ class Database:
     ):
         path = self.sanitise_path(path)
         try:
-            self.cursor.execute(self.COMMAND_ADD_STATE, (exp_id, epoch, path))
+            self.cursor.execute(
+                self.COMMAND_ADD_STATE,
+                (self.experiment_key(exp_id, True), epoch, path),
+            )
             self.conn.commit()
         except Exception as e:
             if error_on_collision:
@@ -183,7 +686,7 @@ class Database:
             self.conn.rollback()
 
     def get_state_file(self, expid: str, epoch: int) -> str:
-        self.cursor.execute(self.COMMAND_GET_STATE, (expid, epoch))
+        self.cursor.execute(self.COMMAND_GET_STATE, (self.experiment_key(expid), epoch))
         results = self.cursor.fetchall()
         if not results:
             raise NoDataError(
@@ -193,6 +696,11 @@ class Database:
         state_file = results[0][0]
         return self.desanitise_path(state_file)
 
+    def get_status_or_none(self, expid: str):
+        self.cursor.execute(self.COMMAND_GET_STATUS, (expid,))
+        row = self.cursor.fetchone()
+        return None if row is None else row[1]
+
     def get_status(self, expid: str) -> str:
         self.cursor.execute(self.COMMAND_GET_STATUS, (expid,))
         results = self.cursor.fetchall()
@@ -203,34 +711,186 @@ class Database:
         status = results[0][1]
         return status
 
-    def get_losses(self, expid: str) -> dict:
-        self.cursor.execute(self.COMMAND_GET_LOSSES, (expid,))
-        results = self.cursor.fetchall()
+    @cached_read
+    def get_losses(self, expid: str, as_arrays: bool = False) -> dict:
+        """Losses by kind, ordered by epoch. With `as_arrays`, epoch and loss
+        are int32 and float64 arrays rather than lists."""
+        exp_key = self.experiment_key(expid)
+        if as_arrays:
+            self.cursor.execute(self.COMMAND_GET_LOSS_COLUMNS, (exp_key,))
+            return self.loss_columns_from_rows(expid, self.cursor.fetchall())
+        self.cursor.execute(self.COMMAND_GET_LOSSES, (exp_key,))
+        return self.losses_from_rows(expid, self.cursor.fetchall())
+
+    @staticmethod
+    def losses_from_rows(expid: str, results) -> dict:
+        if not results:
+            raise NoDataError(f'No losses found for experiment "{expid}"')
+
+        rv = dict()
+        for _, epoch, kind, loss in results:
+            if kind not in rv:
+                rv[kind] = dict(loss=[], epoch=[])
+            rv[kind]["loss"].append(loss)
+            rv[kind]["epoch"].append(epoch)
+        return rv
 
+    @classmethod
+    def loss_columns_from_rows(cls, expid: str, results) -> dict:
         if not results:
             raise NoDataError(f'No losses found for experiment "{expid}"')
-        res_by_cols = list(zip(*results))
+        return cls.epoch_columns_by_kind(results, "loss")
 
-        epochs = res_by_cols[1]
-        loss_kinds = res_by_cols[2]
-        losses = res_by_cols[3]
-        uniq_kinds = set(loss_kinds)
+    @staticmethod
+    def kind_runs(kinds: np.ndarray) -> list:
+        """(kind, start, stop) of each run of equal values in `kinds`."""
+        bounds = [0, *(np.flatnonzero(kinds[1:] != kinds[:-1]) + 1), len(kinds)]
+        return [(kinds[a], a, b) for a, b in zip(bounds[:-1], bounds[1:])]
 
+    @classmethod
+    def epoch_columns_by_kind(cls, results, value_name: str) -> dict:
+        """Arrays of epoch (int32) and value (float64) for each kind, from
+        (kind, epoch, value) rows ordered by kind then epoch."""
+        kinds, epochs, values = zip(*results)
+        epochs = np.array(epochs, dtype=np.int32)
+        values = np.array(values, dtype=np.float64)
         return {
-            k: dict(
-                loss=[l for l, lk in zip(losses, loss_kinds) if lk == k],
-                epoch=[e for e, lk in zip(epochs, loss_kinds) if lk == k],
-            )
-            for k in uniq_kinds
+            kind: {"epoch": epochs[a:b], value_name: values[a:b]}
+            for kind, a, b in cls.kind_runs(np.array(kinds, dtype=object))
         }
 
-    def get_lrs(self, expid: str) -> dict:
-        lr_es, lrs = [], []
-        for lr in self.get_lr_values(expid):
-            e, lr = lr[0][1:-1].split(",")
-            lr_es.append(int(e))
-            lrs.append(float(lr))
-        return dict(epochs=lr_es, lrs=lrs)
+    @cached_read
+    def get_lrs(self, expid: str, as_arrays: bool = False) -> dict:
+        """Learning rates, ordered by epoch. With `as_arrays`, epochs and lrs
+        are int32 and float64 arrays rather than lists."""
+        rows = self.get_lr_values(expid)
+        if as_arrays:
+            return self.lr_columns_from_rows(rows)
+        return self.lrs_from_rows(rows)
+
+    @staticmethod
+    def lrs_from_rows(results) -> dict:
+        return dict(
+            epochs=[int(e) for e, _ in results], lrs=[float(v) for _, v in results]
+        )
+
+    @staticmethod
+    def lr_columns_from_rows(results) -> dict:
+        epochs, lrs = zip(*results) if results else ((), ())
+        return dict(
+            epochs=np.array(epochs, dtype=np.int32),
+            lrs=np.array(lrs, dtype=np.float64),
+        )
+
+    def get_metric_history(self, expid: str, kind: str = None) -> dict:
+        """Every logged value of each metric (or just `kind`), as arrays of
+        epoch (int32) and value (float64) ordered by epoch."""
+        exp_key = self.experiment_key(expid)
+        if kind is None:
+            self.cursor.execute(self.COMMAND_GET_METRIC_HISTORY, (exp_key,))
+        else:
+            self.cursor.execute(
+                self.COMMAND_GET_METRIC_HISTORY_OF_KIND, (exp_key, self.kind_key(kind))
+            )
+        return self.metric_history_from_rows(expid, self.cursor.fetchall())
+
+    @classmethod
+    def metric_history_from_rows(cls, expid: str, results) -> dict:
+        if not results:
+            raise NoDataError(f'No metrics found for experiment "{expid}"')
+        return cls.epoch_columns_by_kind(results, "value")
+
+    def add_step_value(
+        self, exp_id: str, kind: str, step: int, value: float, walltime: float = None
+    ):
+        """Log a per-iteration value. At these rates, use buffered mode or a
+        BackgroundLogger rather than committing every step."""
+        if walltime is None:
+            walltime = datetime.now(timezone.utc)
+        else:
+            walltime = datetime.fromtimestamp(walltime, timezone.utc)
+        self.write(
+            exp_id,
+            self.COMMAND_ADD_STEP,
+            self.COMMAND_ADD_STEP_MANY,
+            (
+                self.experiment_key(exp_id, True),
+                self.kind_key(kind, True),
+                step,
+                value,
+                walltime,
+            ),
+        )
+
+    def add_step_values(
+        self,
+        exp_id: str,
+        kind: str,
+        steps,
+        values,
+        walltimes=None,
+        on_conflict: str = None,
+    ):
+        steps = self.as_array(steps, np.int64)
+        values = self.as_array(values, np.float64)
+        if walltimes is None:
+            walltimes = np.full(len(steps), datetime.now().timestamp())
+        walltimes = self.as_array(walltimes, np.float64)
+        if not (len(steps) == len(values) == len(walltimes)):
+            raise ValueError(
+                f"Got {len(steps)} steps, {len(values)} values and {len(walltimes)} walltimes."
+            )
+
+        if on_conflict is not None:
+            _, last = np.unique(steps[::-1], return_index=True)
+            keep = np.sort(len(steps) - 1 - last)
+            steps, values, walltimes = steps[keep], values[keep], walltimes[keep]
+
+        walltimes = np.datetime_as_string(
+            (walltimes * 1e6).astype("datetime64[us]"), timezone="UTC"
+        )
+        exp_key, kind_key = self.experiment_key(exp_id, True), self.kind_key(kind, True)
+        rows = [
+            (exp_key, kind_key, s, v, t)
+            for s, v, t in zip(steps.tolist(), values.tolist(), walltimes.tolist())
+        ]
+        self.copy_rows(
+            "STEPS",
+            ["EXPKEY", "KINDKEY", "STEP", "VALUE", "WALLTIME"],
+            ["EXPKEY", "KINDKEY", "STEP"],
+            rows,
+            on_conflict,
+        )
+        self.invalidate(exp_id)
+
+    def get_step_values(self, expid: str, kind: str = None) -> dict:
+        """Per-iteration values by kind, as arrays of step (int64), value
+        (float64) and walltime (float64, seconds since the epoch)."""
+        exp_key = self.experiment_key(expid)
+        if kind is None:
+            self.cursor.execute(self.COMMAND_GET_STEPS, (exp_key,))
+        else:
+            self.cursor.execute(
+                self.COMMAND_GET_STEPS_OF_KIND, (exp_key, self.kind_key(kind))
+            )
+        return self.step_values_from_rows(expid, self.cursor.fetchall())
+
+    @classmethod
+    def step_values_from_rows(cls, expid: str, results) -> dict:
+        if not results:
+            raise NoDataError(f'No step values found for experiment "{expid}"')
+
+        kinds, steps, values, walltimes = zip(*results)
+        kinds = np.array(kinds, dtype=object)
+        steps = np.array(steps, dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        walltimes = np.array(walltimes, dtype=np.float64)
+
+        # rows are ordered by kind, so each kind is one contiguous run
+        return {
+            kind: dict(step=steps[a:b], value=values[a:b], walltime=walltimes[a:b])
+            for kind, a, b in cls.kind_runs(kinds)
+        }
 
     def get_experiment_details(self, expid: str) -> dict:
         return dict(
@@ -240,10 +900,15 @@ class Database:
             lrs=self.get_lrs(expid),
         )
 
+    @cached_read
     def get_latest_metrics(self, exp_id) -> dict:
-        self.cursor.execute(self.COMMAND_GET_LATEST_METRICS, (exp_id,))
-        results = self.cursor.fetchall()
+        self.cursor.execute(
+            self.COMMAND_GET_LATEST_METRICS, (self.experiment_key(exp_id),)
+        )
+        return self.latest_metrics_from_rows(exp_id, self.cursor.fetchall())
 
+    @staticmethod
+    def latest_metrics_from_rows(exp_id: str, results) -> dict:
         if not results:
             return dict()
 
@@ -254,22 +919,51 @@ class Database:
         )
 
     def add_lr_value(self, exp_id: str, epoch: int, value: float):
-        self.cursor.execute(self.COMMAND_ADD_LR, (exp_id, epoch, value))
-        self.conn.commit()
+        self.write(
+            exp_id,
+            self.COMMAND_ADD_LR,
+            self.COMMAND_ADD_LR_MANY,
+            (self.experiment_key(exp_id, True), epoch, value),
+        )
 
     def get_lr_values(self, exp_id: str):
-        self.cursor.execute(self.COMMAND_GET_LRS, (exp_id,))
+        self.cursor.execute(self.COMMAND_GET_LRS, (self.experiment_key(exp_id),))
         return self.cursor.fetchall()
 
     def add_qualitative_metadata_json(self, exp_id: str, plot_id: str, value: str):
         self.cursor.execute(self.COMMAND_ADD_QUALRESMETA, (exp_id, plot_id, value))
         self.conn.commit()
+        self.invalidate(exp_id)
 
     def add_qualitative_result_json(
         self, exp_id: str, epoch: int, plot_id: str, value: str
     ):
-        self.cursor.execute(self.COMMAND_ADD_QUALRES, (exp_id, epoch, plot_id, value))
+        self.cursor.execute(
+            self.COMMAND_ADD_QUALRES,
+            (
+                self.experiment_key(exp_id, True),
+                epoch,
+                self.plot_key(plot_id, True),
+                value,
+            ),
+        )
         self.conn.commit()
+        self.invalidate(exp_id)
+
+    def add_qualitative_result_arrays(
+        self, exp_id: str, epoch: int, plot_id: str, **arrays
+    ):
+        self.cursor.execute(
+            self.COMMAND_ADD_QUALRES_ARRAYS,
+            (
+                self.experiment_key(exp_id, True),
+                epoch,
+                self.plot_key(plot_id, True),
+                self.encode_arrays(**arrays),
+            ),
+        )
+        self.conn.commit()
+        self.invalidate(exp_id)
 
     def add_qualitative_metadata(
         self, exp_id: str, plot_id: str, kind: str, **meta_data
@@ -278,24 +972,150 @@ class Database:
             exp_id, plot_id, json.dumps(dict(kind=kind, **meta_data))
         )
 
+    @cached_read
     def get_qualitative_result(self, exp_id: str, plot_id: str):
-        try:
+        keys = (self.experiment_key(exp_id), self.plot_key(plot_id))
+
+        def read(path):
             self.cursor.execute(self.COMMAND_GET_QUALRESMETA, (exp_id, plot_id))
             meta_enc = self.cursor.fetchall()
+            self.cursor.execute(self.COMMAND_GET_QUALRES, keys)
+            data = self.cursor.fetchall()
+            self.cursor.execute(self.COMMAND_GET_QUALRES_ARRAYS, keys)
+            array_data = self.cursor.fetchall()
+            if path is not None:
+                data = cold.load_rows(path, "QUALITATIVERESULTS", plot_id) + data
+                array_data = (
+                    cold.load_rows(path, "QUALITATIVEARRAYS", plot_id) + array_data
+                )
+            return self.qualitative_result_from_rows(meta_enc, data, array_data)
+
+        return self.read_cold(keys[0], read)
+
+    @classmethod
+    def qualitative_result_from_rows(cls, meta_enc, data, array_data) -> dict:
+        try:
             qualres = json.loads(meta_enc[0][-1])
         except IndexError:
             qualres = dict(kind="guess")
 
-        self.cursor.execute(self.COMMAND_GET_QUALRES, (exp_id, plot_id))
-        data = self.cursor.fetchall()
-
         qualres["data"] = []
         for row in data:
             # columns = ['expid', 'epoch', 'plotid', 'value']
             qualres["data"].append(dict(epoch=int(row[1]), **json.loads(row[-1])))
 
+        for row in array_data:
+            qualres["data"].append(
+                dict(epoch=int(row[1]), **cls.decode_arrays(row[-1]))
+            )
+
         return qualres
 
+    def get_qualitative_plot_ids(self, exp_id: str) -> List[str]:
+        exp_key = self.experiment_key(exp_id)
+
+        def read(path):
+            self.cursor.execute(self.COMMAND_GET_QUALRES_PLOTIDS, (exp_key, exp_key))
+            plot_ids = [r[0] for r in self.cursor.fetchall()]
+            if path is not None:
+                plot_ids += [p for p in cold.plot_ids(path) if p not in plot_ids]
+            return plot_ids
+
+        return self.read_cold(exp_key, read)
+
+    @contextmanager
+    def snapshot(self):
+        """Run the reads within in one REPEATABLE READ transaction, so they
+        all see the database as of one moment."""
+        self.conn.commit()
+        self.cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        try:
+            yield
+        finally:
+            self.conn.commit()
+
+    def read_cold(self, exp_key: int, read):
+        """`read(path)` of the experiment's rows in the database and its files
+        in cold storage at `path`, in one snapshot, so rows being moved are
+        read from one side only. A move removes the files it replaces once it
+        commits: if they went meanwhile, the read is repeated, in a snapshot
+        that has the new ones."""
+        while True:
+            with self.snapshot():
+                path = self.get_cold_path(exp_key)
+                try:
+                    return read(path)
+                except FileNotFoundError as e:
+                    error = e
+            if self.get_cold_path(exp_key) == path:
+                raise error
+
+    def get_cold_path(self, exp_key: int):
+        """Where the experiment's qualitative results in cold storage are, if
+        it has any."""
+        self.cursor.execute(self.COMMAND_GET_COLD_PATH, (exp_key,))
+        row = self.cursor.fetchone()
+        return None if row is None else self.desanitise_path(row[0])
+
+    def get_cold_paths(self, exp_keys: List[int]) -> List[str]:
+        self.cursor.execute(self.COMMAND_GET_COLD_PATHS_MANY, (exp_keys,))
+        return [self.desanitise_path(r[0]) for r in self.cursor.fetchall()]
+
+    def tier_qualitative_results(self, min_age_days: float = None) -> List[str]:
+        """Move the qualitative results of experiments that have been COMPLETE
+        for at least `min_age_days` (default: the config's cold_after_days)
+        to cold storage. Returns the experiments moved."""
+        if min_age_days is None:
+            min_age_days = CONFIG.cold_after_days
+        self.cursor.execute(self.COMMAND_GET_COLD_CANDIDATES, (min_age_days,))
+        expids = [r[0] for r in self.cursor.fetchall()]
+        self.conn.commit()
+        for expid in expids:
+            self.move_to_cold_storage(expid)
+        return expids
+
+    def move_to_cold_storage(self, exp_id: str) -> str:
+        """Move the experiment's rows in QUALITATIVERESULTS and
+        QUALITATIVEARRAYS to compressed files under root_dir, merged with any
+        it already has there. get_qualitative_result reads through to them.
+        Returns the files' directory.
+
+        The rows are read and deleted in one snapshot, so any added meanwhile
+        stay in the database, to be moved next time."""
+        exp_key = self.experiment_key(exp_id)
+        self.flush()
+        self.conn.commit()
+
+        sanitised = cold.new_cold_path(exp_id)
+        path = self.desanitise_path(sanitised)
+        try:
+            self.cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            old_path = self.get_cold_path(exp_key)
+            rows_by_table = dict()
+            for table in cold.COLD_TABLES:
+                self.cursor.execute(archive.export_query(table), ([exp_key],))
+                rows = self.cursor.fetchall()
+                if old_path is not None:
+                    rows = cold.load_rows(old_path, table) + rows
+                rows_by_table[table] = rows
+            cold.save(path, rows_by_table)
+
+            self.cursor.execute(self.COMMAND_SET_COLD_PATH, (exp_key, sanitised))
+            for table in cold.COLD_TABLES:
+                self.cursor.execute(
+                    self.COMMAND_DELETE_EXPERIMENTS_BY_KEY.format(table), ([exp_key],)
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            cold.remove(path)
+            raise
+        self.invalidate(exp_id)
+
+        if old_path is not None:
+            cold.remove(old_path)
+        return path
+
     def add_to_group(self, exp_id: str, group: str):
         self.cursor.execute(self.COMMAND_ADD_TO_GROUP, (exp_id, group))
         self.conn.commit()
@@ -325,21 +1145,276 @@ class Database:
         return groups
 
     def get_groups_of_many_exps(self, expids: List[str]):
-        condition = sql.SQL("")
-        for i, expid in enumerate(expids):
-            expid = sql.Literal(expid)
-            if i:
-                condition += sql.SQL(" OR ")
-            condition += sql.SQL(" EXPID={expid} ").format(expid=expid)
-        q = sql.SQL(
-            "SELECT DISTINCT GROUPNAME FROM EXPGROUPS WHERE {condition};"
-        ).format(condition=condition)
-        self.cursor.execute(q)
+        self.cursor.execute(self.COMMAND_GET_GROUPS_OF_MANY_EXPS, (list(expids),))
         groups = [r[0] for r in self.cursor.fetchall()]
         return groups
 
+    @staticmethod
+    def rows_by_expid(results, expid_col: int = 0) -> dict:
+        rv = dict()
+        for row in results:
+            rv.setdefault(row[expid_col], []).append(row)
+        return rv
+
+    @classmethod
+    def status_page_query(
+        cls,
+        statuses: List[str] = None,
+        group: str = None,
+        after: str = None,
+        limit: int = 50,
+        newest_first: bool = True,
+    ) -> Tuple[str, list]:
+        """Query, and its arguments, for the (expid, status) of up to `limit`
+        experiments in one of `statuses` (None: any) and in `group`, if given,
+        following the experiment `after` in id order."""
+        order, compare = ("DESC", "<") if newest_first else ("ASC", ">")
+        conditions, args = [], []
+        if after is not None:
+            conditions.append(f"EXPID {compare} %s")
+            args.append(after)
+        if group is not None:
+            conditions.append(
+                "EXPID IN (SELECT EXPID FROM EXPGROUPS WHERE GROUPNAME=%s)"
+            )
+            args.append(group)
+
+        pages, page_args = [], []
+        for status in statuses or [None]:
+            page_conditions = (
+                conditions if status is None else ["STATUS=%s"] + conditions
+            )
+            pages.append(
+                cls.COMMAND_GET_STATUS_PAGE_OF.format(
+                    conditions=" AND ".join(page_conditions) or "TRUE", order=order
+                )
+            )
+            page_args += ([] if status is None else [status]) + args + [limit]
+        query = cls.COMMAND_GET_STATUS_PAGE.format(
+            pages=" UNION ALL ".join(pages), order=order
+        )
+        return query, page_args + [limit]
+
+    def get_status_page(
+        self,
+        statuses: List[str] = None,
+        group: str = None,
+        after: str = None,
+        limit: int = 50,
+        newest_first: bool = True,
+    ) -> List[tuple]:
+        """(expid, status) of the next `limit` experiments after the expid
+        `after` (from the start if None), newest first or oldest first. The cost
+        of a page depends on `limit`, not on the number of experiments."""
+        self.cursor.execute(
+            *self.status_page_query(statuses, group, after, limit, newest_first)
+        )
+        return self.cursor.fetchall()
+
+    def search(self, text: str, limit: int = 100) -> List[tuple]:
+        """The `limit` best (expid, status) matches of the search `text`: terms
+        found in an experiment's id, status, groups or hyperparameter values,
+        "!term" for those it mustn't contain (see search.py)."""
+        self.cursor.execute(*search_query(text, limit))
+        return self.cursor.fetchall()
+
+    def get_experiment_details_many(self, expids: List[str]) -> dict:
+        """Details of each experiment, by expid, in three queries. Experiments
+        without a status or losses (for which get_experiment_details raises
+        NoDataError) are left out."""
+        expids = list(expids)
+        self.cursor.execute(self.COMMAND_GET_STATUS_MANY, (expids,))
+        status_rows = self.cursor.fetchall()
+        exp_keys = self.experiment_keys(expids)
+        self.cursor.execute(self.COMMAND_GET_LOSSES_MANY, (exp_keys,))
+        loss_rows = self.cursor.fetchall()
+        self.cursor.execute(self.COMMAND_GET_LRS_MANY, (exp_keys,))
+        lr_rows = self.cursor.fetchall()
+        return self.experiment_details_many_from_rows(
+            expids, status_rows, loss_rows, lr_rows
+        )
+
+    @classmethod
+    def experiment_details_many_from_rows(
+        cls, expids, status_rows, loss_rows, lr_rows
+    ) -> dict:
+        statuses = dict(status_rows)
+        losses = cls.rows_by_expid(loss_rows)
+        lrs = cls.rows_by_expid(lr_rows)
+
+        rv = dict()
+        for expid in expids:
+            if expid not in statuses or expid not in losses:
+                continue
+            rv[expid] = dict(
+                expid=expid,
+                status=statuses[expid],
+                losses=cls.losses_from_rows(expid, losses[expid]),
+                lrs=cls.lrs_from_rows([row[1:] for row in lrs.get(expid, [])]),
+            )
+        return rv
+
+    def get_latest_metrics_many(self, expids: List[str]) -> dict:
+        """Latest metrics of each experiment, by expid, in one query.
+        Experiments with no metrics are left out."""
+        self.cursor.execute(
+            self.COMMAND_GET_LATEST_METRICS_MANY, (self.experiment_keys(expids),)
+        )
+        return self.latest_metrics_many_from_rows(self.cursor.fetchall())
+
+    @classmethod
+    def latest_metrics_many_from_rows(cls, results) -> dict:
+        return {
+            expid: cls.latest_metrics_from_rows(expid, rows)
+            for expid, rows in cls.rows_by_expid(results).items()
+        }
+
+    def get_hyperparams_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        self.cursor.execute(self.COMMAND_GET_HYPERPARAMS_MANY, (expids,))
+        return self.hyperparams_many_from_rows(expids, self.cursor.fetchall())
+
+    @classmethod
+    def hyperparams_many_from_rows(cls, expids, results) -> dict:
+        by_expid = cls.rows_by_expid(results)
+        return {e: cls.hyperparams_from_rows(by_expid.get(e, [])) for e in expids}
+
+    def get_groups_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        self.cursor.execute(self.COMMAND_GET_GROUPS_MANY, (expids,))
+        return self.groups_many_from_rows(expids, self.cursor.fetchall())
+
+    @staticmethod
+    def groups_many_from_rows(expids, results) -> dict:
+        rv = {e: [] for e in expids}
+        for expid, group in results:
+            rv[expid].append(group)
+        return rv
+
     def delete_experiment(self, exp_id: str):
+        self.delete_experiments([exp_id])
+        return exp_id
+
+    def delete_experiments(self, expids: List[str]) -> List[str]:
+        """Delete every row of `expids`, with one statement per table, in a
+        single transaction."""
+        expids = list(expids)
+        exp_keys = self.experiment_keys(expids)
+        self.flush()
+        try:
+            cold_paths = self.get_cold_paths(exp_keys)
+            self.delete_rows_of(expids, exp_keys)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.invalidate(*expids)
+        for path in cold_paths:
+            cold.remove(path)
+        return expids
+
+    def delete_rows_of(self, expids: List[str], exp_keys: List[int]):
+        # registry entries are kept: other processes may have their keys
+        # cached. So is the log of deletions, which mirrors read.
         for table in self.TABLES:
-            self.cursor.execute(self.COMMAND_DELETE_EXPERIMENT.format(table), (exp_id,))
+            if table in KEYED_TABLES:
+                self.cursor.execute(
+                    self.COMMAND_DELETE_EXPERIMENTS_BY_KEY.format(table), (exp_keys,)
+                )
+            elif table not in REGISTRIES and table != "DELETIONS":
+                self.cursor.execute(
+                    self.COMMAND_DELETE_EXPERIMENTS.format(table), (expids,)
+                )
+        self.cursor.execute(self.COMMAND_LOG_DELETIONS, (expids,))
+
+    def archive_experiments(self, expids: List[str], dest: str) -> str:
+        """Export every row of `expids` to compressed columnar files in the
+        directory `dest` (relative to root_dir), then delete them.
+
+        The export and delete share one snapshot, so rows logged meanwhile are
+        neither archived nor deleted. Returns the archive's directory; see
+        restore_experiments to load it back.
+        """
+        expids = list(expids)
+        path = self.desanitise_path(dest)
+        os.makedirs(path, exist_ok=True)
+
+        exp_keys = self.experiment_keys(expids)
+        self.flush()
         self.conn.commit()
-        return exp_id
+        try:
+            self.cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            cold_paths = self.get_cold_paths(exp_keys)
+            counts = dict()
+            for table in archive.ARCHIVE_COLUMNS:
+                ids = exp_keys if table in KEYED_TABLES else expids
+                self.cursor.execute(archive.export_query(table), (ids,))
+                rows = self.cursor.fetchall()
+                if table in cold.COLD_TABLES:
+                    for cold_path in cold_paths:
+                        rows += cold.load_rows(cold_path, table)
+                archive.save_table(path, table, rows)
+                counts[table] = len(rows)
+            archive.write_manifest(
+                path,
+                dict(
+                    expids=expids,
+                    tables=counts,
+                    schema_version=LATEST_VERSION,
+                    created=datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+            self.delete_rows_of(expids, exp_keys)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.invalidate(*expids)
+        for cold_path in cold_paths:
+            cold.remove(cold_path)
+        return path
+
+    def restore_experiments(self, src: str) -> List[str]:
+        """Load an archive written by archive_experiments (from the directory
+        `src`, relative to root_dir) back in with COPY, in one transaction.
+        Returns the archive's experiments.
+
+        Raises ValueError if any of them still has rows in any of the
+        archived tables (or a status), rather than duplicate their rows."""
+        path = self.desanitise_path(src)
+        manifest = archive.read_manifest(path)
+        expids = manifest["expids"]
+        tables = archive.archived_tables(manifest)
+
+        self.flush()
+        try:
+            # checked in the transaction that loads the rows
+            present = set()
+            for table in {"STATUS", *tables}:
+                self.cursor.execute(archive.present_query(table), (expids,))
+                present.update(r[0] for r in self.cursor.fetchall())
+            if present:
+                raise ValueError(
+                    "Can't restore experiments that are in the database: "
+                    + ", ".join(sorted(present))
+                )
+
+            for table in tables:
+                rows = archive.load_table(path, table)
+                if not rows:
+                    continue
+                staging, commands = archive.restore_commands(table)
+                columns = ", ".join(c for c, _ in archive.ARCHIVE_COLUMNS[table])
+                self.cursor.execute(commands[0])
+                self.cursor.copy_expert(
+                    self.COMMAND_COPY_CSV.format(table=staging, columns=columns),
+                    archive.rows_to_csv(table, rows),
+                )
+                for command in commands[1:]:
+                    self.cursor.execute(command)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.invalidate(*expids)
+        return expids
@@ -4,3 +4,11 @@ class MLDBErrorBase(Exception):
 
 class NoDataError(MLDBErrorBase):
     """Error raised when no data is returned for a given query."""
+
+
+class PoolTimeoutError(MLDBErrorBase):
+    """Error raised when no pooled connection becomes free in time."""
+
+
+class SchemaVersionError(MLDBErrorBase):
+    """Error raised when the database schema is too old to be used."""
@@ -0,0 +1,52 @@
+import threading
+
+_KEYS = dict()
+_KEYS_LOCK = threading.Lock()
+
+
+class KeyCache:
+    """Integer keys of the names in one registry table (experiment ids, kinds
+    or plot ids), filled in from the database as names are first seen.
+
+    Keys are never reassigned, so once cached they stay valid for the life of
+    the process and can be shared between threads and connections.
+    """
+
+    def __init__(self, table: str, name_column: str, key_column: str):
+        self.table = table
+        self.name_column = name_column
+        self.key_column = key_column
+        self.keys = dict()
+        self.lock = threading.Lock()
+
+        self.command_get = f"SELECT {name_column}, {key_column} FROM {table} WHERE {name_column} = ANY(%s);"
+        self.command_add = f"INSERT INTO {table} ({name_column}) SELECT unnest(%s::text[]) ON CONFLICT ({name_column}) DO NOTHING;"
+
+    def __getitem__(self, name: str):
+        return self.keys.get(name)
+
+    def missing(self, names) -> list:
+        return list({n for n in names if n not in self.keys})
+
+    def update(self, rows):
+        with self.lock:
+            self.keys.update(rows)
+
+
+class Keys:
+    """The key caches of one database."""
+
+    def __init__(self):
+        self.experiments = KeyCache("EXPERIMENTS", "EXPID", "EXPKEY")
+        self.kinds = KeyCache("KINDS", "KIND", "KINDKEY")
+        self.plots = KeyCache("PLOTS", "PLOTID", "PLOTKEY")
+
+
+def get_keys(config) -> Keys:
+    """The process-wide key caches for the database described by `config`."""
+    key = tuple(sorted(config.as_dict().items()))
+    with _KEYS_LOCK:
+        keys = _KEYS.get(key)
+        if keys is None:
+            keys = _KEYS[key] = Keys()
+        return keys
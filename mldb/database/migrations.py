@@ -0,0 +1,712 @@
+from typing import Callable, List
+
+from psycopg2.errors import InsufficientPrivilege, UndefinedTable
+
+from .schema import (
+    SCHEMA_BY_TABLE,
+    REGISTRIES,
+    SEQUENCED_TABLES,
+    KEYED_TABLES,
+)
+from .changes import CHANNEL, NOTIFYING_TABLES
+
+# arbitrary key for the advisory lock that stops two processes migrating at once
+MIGRATION_LOCK_KEY = 0x6D6C6462
+
+COMMAND_CREATE_VERSION_TABLE = "CREATE TABLE IF NOT EXISTS MLDB_SCHEMA_VERSION (VERSION INTEGER NOT NULL UNIQUE, DESCRIPTION TEXT NOT NULL, APPLIED TIMESTAMPTZ NOT NULL DEFAULT now());"
+COMMAND_GET_VERSION = "SELECT max(VERSION) FROM MLDB_SCHEMA_VERSION;"
+COMMAND_SET_VERSION = (
+    "INSERT INTO MLDB_SCHEMA_VERSION (VERSION, DESCRIPTION) VALUES (%s, %s);"
+)
+COMMAND_HAS_TABLE = "SELECT to_regclass(%s) IS NOT NULL;"
+COMMAND_GET_COLUMN_TYPE = "SELECT data_type FROM information_schema.columns WHERE table_schema=current_schema() AND table_name=lower(%s) AND column_name=lower(%s);"
+COMMAND_IS_INDEX_INVALID = (
+    "SELECT NOT indisvalid FROM pg_index WHERE indexrelid=to_regclass(%s);"
+)
+COMMAND_GET_PARTITIONS = "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent=to_regclass(%s) ORDER BY 1;"
+COMMAND_GET_PAGES = (
+    "SELECT pg_relation_size(%s) / current_setting('block_size')::integer;"
+)
+COMMAND_IS_EXTENSION_AVAILABLE = (
+    "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name=%s);"
+)
+
+# The tables as they were before migrations, which migration 1 creates. Kept
+# as they were: later migrations change them from this shape, whether the
+# database is new or old.
+SCHEMA_V1 = [
+    "CREATE TABLE IF NOT EXISTS STATUS (EXPID TEXT NOT NULL UNIQUE, STATUS TEXT NOT NULL);",
+    "CREATE TABLE IF NOT EXISTS CONFIG (EXPID TEXT NOT NULL UNIQUE, CONFIG TEXT NOT NULL);",
+    "CREATE TABLE IF NOT EXISTS LOSS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL, UNIQUE(EXPID, EPOCH, KIND));",
+    "CREATE TABLE IF NOT EXISTS METRICS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL, UNIQUE(EXPID, EPOCH, KIND));",
+    "CREATE TABLE IF NOT EXISTS STATE (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, PATH TEXT NOT NULL, UNIQUE(EXPID, EPOCH, PATH));",
+    "CREATE TABLE IF NOT EXISTS HYPERPARAMS (EXPID TEXT NOT NULL, NAME TEXT NOT NULL, VALUE TEXT NOT NULL, UNIQUE(EXPID, NAME));",
+    "CREATE TABLE IF NOT EXISTS LEARNINGRATE (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, VALUE TEXT NOT NULL, UNIQUE(EXPID, EPOCH));",
+    "CREATE TABLE IF NOT EXISTS QUALITATIVERESULTSMETA (EXPID TEXT NOT NULL, PLOTID TEXT NOT NULL, VALUE TEXT NOT NULL, UNIQUE(EXPID, PLOTID));",
+    "CREATE TABLE IF NOT EXISTS QUALITATIVERESULTS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, PLOTID TEXT NOT NULL, VALUE TEXT NOT NULL);",
+    "CREATE TABLE IF NOT EXISTS QUALITATIVEARRAYS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, PLOTID TEXT NOT NULL, VALUE BYTEA NOT NULL);",
+    "CREATE TABLE IF NOT EXISTS EXPGROUPS (EXPID TEXT NOT NULL, GROUPNAME TEXT NOT NULL, UNIQUE(EXPID, GROUPNAME));",
+    "CREATE TABLE IF NOT EXISTS STEPS (STEP INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL, WALLTIME TIMESTAMPTZ NOT NULL DEFAULT now(), EXPID TEXT NOT NULL, KIND TEXT NOT NULL, UNIQUE(EXPID, KIND, STEP));",
+]
+
+# Keeps LATESTMETRICS holding the METRICS rows at each experiment's latest
+# epoch: a row for a later epoch replaces the experiment's rows, one for the
+# same epoch is added (or overwritten), and one for an earlier epoch is ignored.
+COMMAND_CREATE_LATEST_METRICS_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_LATEST_METRICS() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM LATESTMETRICS WHERE EXPKEY=NEW.EXPKEY AND EPOCH < NEW.EPOCH;
+    IF NOT EXISTS (SELECT 1 FROM LATESTMETRICS WHERE EXPKEY=NEW.EXPKEY AND EPOCH > NEW.EPOCH) THEN
+        INSERT INTO LATESTMETRICS (EXPKEY, KINDKEY, EPOCH, VALUE)
+        VALUES (NEW.EXPKEY, NEW.KINDKEY, NEW.EPOCH, NEW.VALUE)
+        ON CONFLICT (EXPKEY, KINDKEY) DO UPDATE SET EPOCH=EXCLUDED.EPOCH, VALUE=EXCLUDED.VALUE;
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_LATEST_METRICS_TRIGGER = "CREATE TRIGGER MLDB_LATEST_METRICS AFTER INSERT OR UPDATE ON METRICS FOR EACH ROW EXECUTE FUNCTION MLDB_LATEST_METRICS();"
+# Keeps STATUSTIMES holding the time each experiment's status last changed.
+COMMAND_CREATE_STATUS_TIMES_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_STATUS_TIMES() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.STATUS IS DISTINCT FROM OLD.STATUS THEN
+        INSERT INTO STATUSTIMES (EXPID, UPDATED) VALUES (NEW.EXPID, now())
+        ON CONFLICT (EXPID) DO UPDATE SET UPDATED=EXCLUDED.UPDATED;
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_STATUS_TIMES_TRIGGER = "CREATE TRIGGER MLDB_STATUS_TIMES AFTER INSERT OR UPDATE ON STATUS FOR EACH ROW EXECUTE FUNCTION MLDB_STATUS_TIMES();"
+# Numbers every row written to SEQUENCED_TABLES from one sequence. The
+# transaction id is taken first: a mirror that reads the sequence and then
+# finds no transaction in progress knows every row numbered up to the value it
+# read is visible (see mirror.py).
+COMMAND_CREATE_SEQ = "CREATE SEQUENCE IF NOT EXISTS MLDB_SEQ AS BIGINT;"
+COMMAND_CREATE_SEQ_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_SEQ() RETURNS trigger AS $$
+BEGIN
+    PERFORM txid_current();
+    NEW.SEQ := nextval('MLDB_SEQ');
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_SEQ_TRIGGER = "CREATE TRIGGER MLDB_SEQ BEFORE INSERT OR UPDATE ON {} FOR EACH ROW EXECUTE FUNCTION MLDB_SEQ();"
+# Publishes a change notification (see changes.py) per experiment written to
+# by a statement. Transition tables need a trigger per event, hence one for
+# inserts and one for updates.
+COMMAND_CREATE_NOTIFY_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_NOTIFY_{table}() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{channel}', json_build_object('expid', EXPID, 'table', TG_TABLE_NAME, 'epoch', EPOCH)::text)
+    FROM (SELECT EXPID, {epoch} AS EPOCH FROM MLDB_CHANGED {join} GROUP BY EXPID) AS CHANGED;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_NOTIFY_TRIGGER = "CREATE TRIGGER MLDB_NOTIFY_{event} AFTER {event} ON {table} REFERENCING NEW TABLE AS MLDB_CHANGED FOR EACH STATEMENT EXECUTE FUNCTION MLDB_NOTIFY_{table}();"
+# Rebuilds an experiment's row of SEARCHINDEX from STATUS, EXPGROUPS and
+# HYPERPARAMS, with the fields on separate lines. The experiment's STATUS row
+# is locked first: the statements after it see what other transactions
+# changing the experiment committed meanwhile, so concurrent writes can't
+# leave a stale document.
+COMMAND_CREATE_INDEX_EXPERIMENT_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_INDEX_EXPERIMENT(ID TEXT) RETURNS void AS $$
+BEGIN
+    PERFORM 1 FROM STATUS WHERE EXPID=ID FOR NO KEY UPDATE;
+    INSERT INTO SEARCHINDEX (EXPID, STATUS, DOC)
+    SELECT EXPID, STATUS, lower(concat_ws(E'\\n', EXPID, STATUS,
+        (SELECT string_agg(GROUPNAME, E'\\n' ORDER BY GROUPNAME) FROM EXPGROUPS WHERE EXPID=ID),
+        (SELECT string_agg(VALUE, E'\\n' ORDER BY NAME) FROM HYPERPARAMS WHERE EXPID=ID)))
+    FROM STATUS WHERE EXPID=ID
+    ON CONFLICT (EXPID) DO UPDATE SET STATUS=EXCLUDED.STATUS, DOC=EXCLUDED.DOC
+    WHERE SEARCHINDEX.DOC IS DISTINCT FROM EXCLUDED.DOC OR SEARCHINDEX.STATUS IS DISTINCT FROM EXCLUDED.STATUS;
+    IF NOT FOUND THEN
+        DELETE FROM SEARCHINDEX WHERE EXPID=ID AND NOT EXISTS (SELECT 1 FROM STATUS WHERE EXPID=ID);
+    END IF;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_SEARCH_INDEX_FUNCTION = """CREATE OR REPLACE FUNCTION MLDB_SEARCH_INDEX() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM MLDB_INDEX_EXPERIMENT(OLD.EXPID);
+    ELSE
+        PERFORM MLDB_INDEX_EXPERIMENT(NEW.EXPID);
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql;"""
+COMMAND_CREATE_SEARCH_INDEX_TRIGGER = "CREATE TRIGGER MLDB_SEARCH_INDEX AFTER INSERT OR UPDATE OR DELETE ON {} FOR EACH ROW EXECUTE FUNCTION MLDB_SEARCH_INDEX();"
+COMMAND_FILL_SEARCH_INDEX = """INSERT INTO SEARCHINDEX (EXPID, STATUS, DOC)
+SELECT EXPID, STATUS, lower(concat_ws(E'\\n', EXPID, STATUS, GROUPS, VALS)) FROM STATUS
+LEFT JOIN (SELECT EXPID, string_agg(GROUPNAME, E'\\n' ORDER BY GROUPNAME) AS GROUPS FROM EXPGROUPS GROUP BY EXPID) G USING (EXPID)
+LEFT JOIN (SELECT EXPID, string_agg(VALUE, E'\\n' ORDER BY NAME) AS VALS FROM HYPERPARAMS GROUP BY EXPID) H USING (EXPID)
+ON CONFLICT (EXPID) DO UPDATE SET STATUS=EXCLUDED.STATUS, DOC=EXCLUDED.DOC;"""
+COMMAND_FILL_LATEST_METRICS = "INSERT INTO LATESTMETRICS (EXPKEY, KINDKEY, EPOCH, VALUE) SELECT EXPKEY, KINDKEY, EPOCH, VALUE FROM METRICS WHERE (EXPKEY, EPOCH) IN (SELECT EXPKEY, max(EPOCH) FROM METRICS GROUP BY EXPKEY);"
+
+
+class Migration:
+    """A numbered change to the schema, made of steps run in order.
+
+    Each step is a callable taking a connection; steps manage their own
+    transactions, so long-running ones can commit as they go. Steps should be
+    safe to re-run, in case a migration is interrupted part way through.
+    """
+
+    def __init__(self, version: int, description: str, *steps: Callable):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+    def apply(self, conn, log=print):
+        log(f"Migrating to version {self.version}: {self.description}")
+        for step in self.steps:
+            step(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_SET_VERSION, (self.version, self.description))
+        conn.commit()
+
+
+def notify_commands(table: str) -> List[str]:
+    """Commands (re)creating the triggers publishing changes to `table`."""
+    epoch = NOTIFYING_TABLES[table]
+    commands = [
+        COMMAND_CREATE_NOTIFY_FUNCTION.format(
+            table=table,
+            channel=CHANNEL,
+            epoch=f"max({epoch})" if epoch else "NULL::integer",
+            join="JOIN EXPERIMENTS USING (EXPKEY)" if table in KEYED_TABLES else "",
+        )
+    ]
+    for event in ("INSERT", "UPDATE"):
+        commands += [
+            f"DROP TRIGGER IF EXISTS MLDB_NOTIFY_{event} ON {table};",
+            COMMAND_CREATE_NOTIFY_TRIGGER.format(event=event, table=table),
+        ]
+    return commands
+
+
+def run_sql(*commands: str) -> Callable:
+    """Step running `commands` in one transaction."""
+
+    def step(conn):
+        with conn.cursor() as cursor:
+            for command in commands:
+                cursor.execute(command)
+        conn.commit()
+
+    return step
+
+
+def create_index_concurrently(
+    name: str, table: str, columns: str, method: str = None, unique: bool = False
+) -> Callable:
+    """Step creating an index (of type `method`, default B-tree, and `unique`
+    if asked) without blocking writes to `table`.
+
+    A partitioned table's index can't be built concurrently, so it is created
+    on the table alone and each partition's is built concurrently and attached
+    to it.
+    """
+
+    using = f" USING {method}" if method else ""
+    create = "CREATE UNIQUE INDEX" if unique else "CREATE INDEX"
+
+    def build(cursor, name, table):
+        # an interrupted concurrent build leaves an invalid index behind
+        cursor.execute(COMMAND_IS_INDEX_INVALID, (name,))
+        row = cursor.fetchone()
+        if row is not None and row[0]:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        cursor.execute(
+            f"{create} CONCURRENTLY IF NOT EXISTS {name} ON {table}{using} ({columns});"
+        )
+
+    def step(conn):
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(COMMAND_GET_PARTITIONS, (table,))
+                partitions = [r[0] for r in cursor.fetchall()]
+                if not partitions:
+                    build(cursor, name, table)
+                    return
+
+                cursor.execute(
+                    f"{create} IF NOT EXISTS {name} ON ONLY {table}{using} ({columns});"
+                )
+                for partition in partitions:
+                    build(cursor, f"{partition}_{name}", partition)
+                    cursor.execute(
+                        f"ALTER INDEX {name} ATTACH PARTITION {partition}_{name};"
+                    )
+        finally:
+            conn.autocommit = False
+
+    return step
+
+
+def create_trigram_index(name: str, table: str, column: str) -> Callable:
+    """Step creating a trigram index on `column`, which LIKE '%...%' can use,
+    if the pg_trgm extension is available and can be installed. Without it,
+    such searches scan the table."""
+    build = create_index_concurrently(
+        name, table, f"{column} gin_trgm_ops", method="GIN"
+    )
+
+    def step(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_IS_EXTENSION_AVAILABLE, ("pg_trgm",))
+            available = cursor.fetchone()[0]
+        conn.commit()
+        if not available:
+            print(f"mldb: pg_trgm isn't available, substring searches scan {table}")
+            return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            conn.commit()
+        except InsufficientPrivilege:
+            conn.rollback()
+            print(f"mldb: can't install pg_trgm, substring searches scan {table}")
+            return
+        build(conn)
+
+    return step
+
+
+def change_column_type(
+    table: str,
+    column: str,
+    new_type: str,
+    keys: List[str],
+    batch_size: int = 10_000,
+    log=print,
+) -> Callable:
+    """Step changing the type of `column` without holding a long lock.
+
+    A new column is added and kept in step with the old one by a trigger,
+    existing rows are copied across in batches (walking the unique index on
+    `keys`), and finally the columns are swapped in one short transaction.
+    """
+    new = f"{column}__NEW"
+    function = f"MLDB_SYNC_{table}_{column}"
+    check = f"{table}_{column}__NEW_NOT_NULL"
+    keys_sql = ", ".join(keys)
+    placeholders = ", ".join(["%s"] * len(keys))
+
+    def step(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_GET_COLUMN_TYPE, (table, column))
+            row = cursor.fetchone()
+            if row is None or row[0].lower() == new_type.lower():
+                conn.commit()
+                return
+
+            cursor.execute(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {new} {new_type};"
+            )
+            cursor.execute(
+                f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ "
+                f"BEGIN NEW.{new} := NEW.{column}::{new_type}; RETURN NEW; END $$ LANGUAGE plpgsql;"
+            )
+            cursor.execute(f"DROP TRIGGER IF EXISTS {function} ON {table};")
+            cursor.execute(
+                f"CREATE TRIGGER {function} BEFORE INSERT OR UPDATE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {function}();"
+            )
+            conn.commit()
+
+            last, n = None, 0
+            while True:
+                after = "" if last is None else f"WHERE ({keys_sql}) > ({placeholders})"
+                # the last key of the next batch, in the index's own order
+                cursor.execute(
+                    f"SELECT {keys_sql} FROM {table} {after} ORDER BY {keys_sql} "
+                    f"OFFSET {batch_size - 1} LIMIT 1;",
+                    last,
+                )
+                upper = cursor.fetchone()
+                conditions = (
+                    [] if last is None else [f"({keys_sql}) > ({placeholders})"]
+                )
+                if upper is not None:
+                    conditions.append(f"({keys_sql}) <= ({placeholders})")
+                where = " AND ".join(conditions) or "TRUE"
+                cursor.execute(
+                    f"UPDATE {table} SET {new}={column}::{new_type} WHERE {where};",
+                    (*(last or ()), *(upper or ())),
+                )
+                n += cursor.rowcount
+                conn.commit()
+                log(f"  {table}.{column}: {n} rows converted")
+                if upper is None:
+                    break
+                last = upper
+
+            # validating a NOT VALID check only takes a light lock, and lets
+            # SET NOT NULL skip its own full scan
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check};")
+            cursor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({new} IS NOT NULL) NOT VALID;"
+            )
+            conn.commit()
+            cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check};")
+            conn.commit()
+
+            cursor.execute(f"DROP TRIGGER {function} ON {table};")
+            cursor.execute(f"DROP FUNCTION {function}();")
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column};")
+            cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {new} TO {column};")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL;")
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check};")
+            conn.commit()
+
+    return step
+
+
+def only_if_column(table: str, column: str, step: Callable) -> Callable:
+    """Run `step` only if `table` has `column`: for steps written against a
+    layout that a new database never has."""
+
+    def guarded(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_GET_COLUMN_TYPE, (table, column))
+            has_column = cursor.fetchone() is not None
+        conn.commit()
+        if has_column:
+            step(conn)
+
+    return guarded
+
+
+# registry table: (name column, key column)
+REGISTRY_COLUMNS = dict(
+    EXPERIMENTS=("EXPID", "EXPKEY"),
+    KINDS=("KIND", "KINDKEY"),
+    PLOTS=("PLOTID", "PLOTKEY"),
+)
+
+
+def rekey_table(
+    table: str,
+    registries: List[str],
+    unique: List[str] = None,
+    batch_pages: int = 1_000,
+    log=print,
+) -> Callable:
+    """Step replacing the name columns of `table` (EXPID, KIND, PLOTID) with
+    integer keys into `registries`, without holding a long lock.
+
+    As in change_column_type, the key columns are added and filled in by a
+    trigger for rows written meanwhile, existing rows are filled in batches
+    (of `batch_pages` pages of the table), and the unique index on `unique`
+    (if any) is built concurrently. The name columns are dropped in one short
+    transaction at the end.
+    """
+    names = [REGISTRY_COLUMNS[r][0] for r in registries]
+    keys = [REGISTRY_COLUMNS[r][1] for r in registries]
+    function = f"MLDB_REKEY_{table}"
+    checks = [f"{table}_{key}_NOT_NULL" for key in keys]
+    # the name the constraint gets in a table created with it
+    constraint = unique and f"{table}_{'_'.join(unique)}_key".lower()
+    build_unique = unique and create_index_concurrently(
+        constraint, table, ", ".join(unique), unique=True
+    )
+    lookups = " ".join(
+        f"INSERT INTO {r} ({n}) VALUES (NEW.{n}) ON CONFLICT ({n}) DO NOTHING; "
+        f"NEW.{k} := (SELECT {k} FROM {r} WHERE {n}=NEW.{n});"
+        for r, n, k in zip(registries, names, keys)
+    )
+    registries_sql = ", ".join(registries)
+    joins = " AND ".join(f"{r}.{n}={table}.{n}" for r, n in zip(registries, names))
+    assignments = ", ".join(f"{k}={r}.{k}" for r, k in zip(registries, keys))
+
+    def step(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_GET_COLUMN_TYPE, (table, names[0]))
+            if cursor.fetchone() is None:
+                conn.commit()
+                return
+
+            for key in keys:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {key} INTEGER;"
+                )
+            cursor.execute(
+                f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ "
+                f"BEGIN {lookups} RETURN NEW; END $$ LANGUAGE plpgsql;"
+            )
+            cursor.execute(f"DROP TRIGGER IF EXISTS {function} ON {table};")
+            # not fired by the batches below, which only set the keys
+            cursor.execute(
+                f"CREATE TRIGGER {function} BEFORE INSERT OR UPDATE OF {', '.join(names)} "
+                f"ON {table} FOR EACH ROW EXECUTE FUNCTION {function}();"
+            )
+            conn.commit()
+
+            # rows written from now on register their own names
+            for registry, name in zip(registries, names):
+                cursor.execute(
+                    f"INSERT INTO {registry} ({name}) SELECT DISTINCT {name} FROM {table} "
+                    f"ORDER BY {name} ON CONFLICT ({name}) DO NOTHING;"
+                )
+                conn.commit()
+
+            # rows updated by a batch move to the end of the table, with their
+            # keys set: only the pages there are now need walking
+            cursor.execute(COMMAND_GET_PAGES, (table,))
+            n_pages = cursor.fetchone()[0]
+            n = 0
+            for first in range(0, n_pages, batch_pages):
+                cursor.execute(
+                    f"UPDATE {table} SET {assignments} FROM {registries_sql} "
+                    f"WHERE {joins} AND {table}.{keys[0]} IS NULL "
+                    f"AND {table}.ctid >= %s::tid AND {table}.ctid < %s::tid;",
+                    (f"({first},0)", f"({first + batch_pages},0)"),
+                )
+                n += cursor.rowcount
+                conn.commit()
+                log(f"  {table}: {n} rows keyed")
+
+            # as in change_column_type, a validated check lets SET NOT NULL
+            # skip its own full scan
+            for key, check in zip(keys, checks):
+                cursor.execute(
+                    f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check};"
+                )
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({key} IS NOT NULL) NOT VALID;"
+                )
+                conn.commit()
+                cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check};")
+                conn.commit()
+
+        if build_unique:
+            build_unique(conn)
+
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {function} ON {table};")
+            cursor.execute(f"DROP FUNCTION {function}();")
+            # drops the indexes and constraints on the names along with them
+            for name in names:
+                cursor.execute(f"ALTER TABLE {table} DROP COLUMN {name};")
+            for key, check in zip(keys, checks):
+                cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL;")
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check};")
+            if unique:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE USING INDEX {constraint};"
+                )
+        conn.commit()
+
+    return step
+
+
+MIGRATIONS = [
+    Migration(1, "Create tables", run_sql(*SCHEMA_V1)),
+    Migration(
+        2,
+        "Index lookups by plot, status and group",
+        only_if_column(
+            "QUALITATIVERESULTS",
+            "EXPID",
+            create_index_concurrently(
+                "QUALITATIVERESULTS_EXPID_PLOTID",
+                "QUALITATIVERESULTS",
+                "EXPID, PLOTID",
+            ),
+        ),
+        only_if_column(
+            "QUALITATIVEARRAYS",
+            "EXPID",
+            create_index_concurrently(
+                "QUALITATIVEARRAYS_EXPID_PLOTID", "QUALITATIVEARRAYS", "EXPID, PLOTID"
+            ),
+        ),
+        create_index_concurrently("STATUS_STATUS", "STATUS", "STATUS"),
+        create_index_concurrently("EXPGROUPS_GROUPNAME", "EXPGROUPS", "GROUPNAME"),
+    ),
+    Migration(
+        3,
+        "Store loss, metric and learning rate values as float8",
+        change_column_type(
+            "LOSS", "VALUE", "DOUBLE PRECISION", ["EXPID", "EPOCH", "KIND"]
+        ),
+        change_column_type(
+            "METRICS", "VALUE", "DOUBLE PRECISION", ["EXPID", "EPOCH", "KIND"]
+        ),
+        change_column_type(
+            "LEARNINGRATE", "VALUE", "DOUBLE PRECISION", ["EXPID", "EPOCH"]
+        ),
+    ),
+    Migration(
+        4,
+        "Refer to experiments, kinds and plots by integer key",
+        run_sql(*(SCHEMA_BY_TABLE[r] for r in REGISTRIES)),
+        rekey_table("LOSS", ["EXPERIMENTS", "KINDS"], ["EXPKEY", "EPOCH", "KINDKEY"]),
+        rekey_table(
+            "METRICS", ["EXPERIMENTS", "KINDS"], ["EXPKEY", "EPOCH", "KINDKEY"]
+        ),
+        rekey_table("LEARNINGRATE", ["EXPERIMENTS"], ["EXPKEY", "EPOCH"]),
+        rekey_table("STATE", ["EXPERIMENTS"], ["EXPKEY", "EPOCH", "PATH"]),
+        rekey_table("QUALITATIVERESULTS", ["EXPERIMENTS", "PLOTS"]),
+        rekey_table("QUALITATIVEARRAYS", ["EXPERIMENTS", "PLOTS"]),
+        rekey_table("STEPS", ["EXPERIMENTS", "KINDS"], ["EXPKEY", "KINDKEY", "STEP"]),
+        create_index_concurrently(
+            "QUALITATIVERESULTS_EXPKEY_PLOTKEY",
+            "QUALITATIVERESULTS",
+            "EXPKEY, PLOTKEY",
+        ),
+        create_index_concurrently(
+            "QUALITATIVEARRAYS_EXPKEY_PLOTKEY", "QUALITATIVEARRAYS", "EXPKEY, PLOTKEY"
+        ),
+    ),
+    Migration(
+        5,
+        "Maintain the latest metrics of each experiment",
+        # creating the trigger blocks writes to METRICS until the table is
+        # filled, so no value is missed in between
+        run_sql(
+            SCHEMA_BY_TABLE["LATESTMETRICS"],
+            COMMAND_CREATE_LATEST_METRICS_FUNCTION,
+            "DROP TRIGGER IF EXISTS MLDB_LATEST_METRICS ON METRICS;",
+            COMMAND_CREATE_LATEST_METRICS_TRIGGER,
+            "DELETE FROM LATESTMETRICS;",
+            COMMAND_FILL_LATEST_METRICS,
+        ),
+    ),
+    Migration(
+        6,
+        "Record status changes, for moving qualitative results to cold storage",
+        # the time of earlier changes is unknown: they count from now
+        run_sql(
+            SCHEMA_BY_TABLE["STATUSTIMES"],
+            SCHEMA_BY_TABLE["QUALITATIVECOLD"],
+            COMMAND_CREATE_STATUS_TIMES_FUNCTION,
+            "DROP TRIGGER IF EXISTS MLDB_STATUS_TIMES ON STATUS;",
+            COMMAND_CREATE_STATUS_TIMES_TRIGGER,
+            "INSERT INTO STATUSTIMES (EXPID) SELECT EXPID FROM STATUS ON CONFLICT (EXPID) DO NOTHING;",
+        ),
+    ),
+    Migration(
+        7,
+        "Number rows as they are written, for syncing local mirrors",
+        # existing rows are left unnumbered: a mirror's first sync reads
+        # every row anyway
+        run_sql(
+            COMMAND_CREATE_SEQ,
+            COMMAND_CREATE_SEQ_FUNCTION,
+            # DELETIONS, and tables numbered since, may not exist yet
+            *(SCHEMA_BY_TABLE[table] for table in SEQUENCED_TABLES),
+            *(
+                command
+                for table in SEQUENCED_TABLES
+                for command in (
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS SEQ BIGINT;",
+                    f"DROP TRIGGER IF EXISTS MLDB_SEQ ON {table};",
+                    COMMAND_CREATE_SEQ_TRIGGER.format(table),
+                )
+            ),
+        ),
+        *(
+            create_index_concurrently(f"{table}_SEQ", table, "SEQ")
+            for table in SEQUENCED_TABLES
+        ),
+    ),
+    Migration(
+        8,
+        "Publish changes on a notification channel, for live dashboards",
+        run_sql(
+            *(
+                command
+                for table in NOTIFYING_TABLES
+                for command in notify_commands(table)
+            )
+        ),
+    ),
+    Migration(
+        9,
+        "Keep a search index of experiments",
+        # creating the triggers blocks writes to the tables until the index
+        # is filled, so no change is missed in between
+        run_sql(
+            SCHEMA_BY_TABLE["SEARCHINDEX"],
+            "DROP TRIGGER IF EXISTS MLDB_SEQ ON SEARCHINDEX;",
+            COMMAND_CREATE_SEQ_TRIGGER.format("SEARCHINDEX"),
+            COMMAND_CREATE_INDEX_EXPERIMENT_FUNCTION,
+            COMMAND_CREATE_SEARCH_INDEX_FUNCTION,
+            *(
+                command
+                for table in ("STATUS", "EXPGROUPS", "HYPERPARAMS")
+                for command in (
+                    f"DROP TRIGGER IF EXISTS MLDB_SEARCH_INDEX ON {table};",
+                    COMMAND_CREATE_SEARCH_INDEX_TRIGGER.format(table),
+                )
+            ),
+            COMMAND_FILL_SEARCH_INDEX,
+        ),
+        create_index_concurrently("SEARCHINDEX_SEQ", "SEARCHINDEX", "SEQ"),
+        # prefix matches, for ranking
+        create_index_concurrently(
+            "SEARCHINDEX_DOC", "SEARCHINDEX", "DOC text_pattern_ops"
+        ),
+    ),
+    Migration(
+        10,
+        "Index experiments by status in id order, for paging through them",
+        create_index_concurrently("STATUS_STATUS_EXPID", "STATUS", "STATUS, EXPID"),
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# steps depending on what the server offers (such as extensions), which aren't
+# recorded with a version but re-checked on every migrate, so they take effect
+# once it does: (the schema version they need, step)
+OPTIONAL_STEPS = [
+    (9, create_trigram_index("SEARCHINDEX_DOC_TRGM", "SEARCHINDEX", "DOC")),
+]
+
+# the oldest schema version the current code can read and write
+REQUIRED_VERSION = 9
+
+
+def get_version(conn) -> int:
+    """Schema version of the database: 0 if it predates migrations."""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_GET_VERSION)
+            version = cursor.fetchone()[0]
+        conn.commit()
+    except UndefinedTable:
+        conn.rollback()
+        return 0
+    return version or 0
+
+
+def is_fresh(conn) -> bool:
+    """Whether the database has no mldb tables yet."""
+    with conn.cursor() as cursor:
+        cursor.execute(COMMAND_HAS_TABLE, ("STATUS",))
+        has_status = cursor.fetchone()[0]
+    conn.commit()
+    return not has_status
+
+
+def migrate(conn, target: int = None, log=print) -> List[int]:
+    """Apply pending migrations, up to `target` (default: all of them), then
+    the OPTIONAL_STEPS the schema is recent enough for. Returns the versions
+    applied."""
+    target = LATEST_VERSION if target is None else target
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+        cursor.execute(COMMAND_CREATE_VERSION_TABLE)
+    conn.commit()
+
+    applied = []
+    try:
+        version = get_version(conn)
+        for migration in MIGRATIONS:
+            if version < migration.version <= target:
+                migration.apply(conn, log)
+                applied.append(migration.version)
+                version = migration.version
+        for needed, step in OPTIONAL_STEPS:
+            if needed <= version:
+                step(conn)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+    return applied
@@ -0,0 +1,386 @@
+import json
+import os
+import sqlite3
+import time
+from typing import List
+
+from ..config import CONFIG
+from .database import Database
+from .exception import NoDataError
+from .search import search_query
+
+# A local copy, in SQLite, of the tables the UI browses, with the layout (and
+# names instead of keys) of the database's own. Rows are numbered from
+# MLDB_SEQ as they are written (see migration 7), so each sync only fetches
+# those numbered above the mirror's watermark, and DELETIONS says what to drop.
+#
+# table: (SQLite schema, columns, where they come from in the database)
+MIRROR_TABLES = dict(
+    STATUS=(
+        "CREATE TABLE IF NOT EXISTS STATUS (EXPID TEXT NOT NULL PRIMARY KEY, STATUS TEXT NOT NULL);",
+        # a status change is numbered in STATUSTIMES, which the trigger on
+        # STATUS updates in the same transaction
+        "EXPID, STATUS",
+        "STATUS JOIN STATUSTIMES USING (EXPID)",
+    ),
+    EXPGROUPS=(
+        "CREATE TABLE IF NOT EXISTS EXPGROUPS (EXPID TEXT NOT NULL, GROUPNAME TEXT NOT NULL, UNIQUE(EXPID, GROUPNAME));",
+        "EXPID, GROUPNAME",
+        "EXPGROUPS",
+    ),
+    HYPERPARAMS=(
+        "CREATE TABLE IF NOT EXISTS HYPERPARAMS (EXPID TEXT NOT NULL, NAME TEXT NOT NULL, VALUE TEXT NOT NULL, UNIQUE(EXPID, NAME));",
+        "EXPID, NAME, VALUE",
+        "HYPERPARAMS",
+    ),
+    LOSS=(
+        "CREATE TABLE IF NOT EXISTS LOSS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL, UNIQUE(EXPID, KIND, EPOCH));",
+        "EXPID, EPOCH, KIND, VALUE",
+        "LOSS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY)",
+    ),
+    LEARNINGRATE=(
+        "CREATE TABLE IF NOT EXISTS LEARNINGRATE (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, VALUE REAL NOT NULL, UNIQUE(EXPID, EPOCH));",
+        "EXPID, EPOCH, VALUE",
+        "LEARNINGRATE JOIN EXPERIMENTS USING (EXPKEY)",
+    ),
+    # rows of earlier epochs are deleted from LATESTMETRICS without being
+    # logged, so the mirror may have some left: reads only take the latest
+    LATESTMETRICS=(
+        "CREATE TABLE IF NOT EXISTS LATESTMETRICS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL, UNIQUE(EXPID, KIND));",
+        "EXPID, EPOCH, KIND, VALUE",
+        "LATESTMETRICS JOIN EXPERIMENTS USING (EXPKEY) JOIN KINDS USING (KINDKEY)",
+    ),
+    SEARCHINDEX=(
+        "CREATE TABLE IF NOT EXISTS SEARCHINDEX (EXPID TEXT NOT NULL PRIMARY KEY, STATUS TEXT NOT NULL, DOC TEXT NOT NULL);",
+        "EXPID, STATUS, DOC",
+        "SEARCHINDEX",
+    ),
+)
+COMMAND_CREATE_STATE = (
+    "CREATE TABLE IF NOT EXISTS MLDB_MIRROR (NAME TEXT NOT NULL PRIMARY KEY, VALUE);"
+)
+
+# the last number taken from MLDB_SEQ, read before the snapshot
+COMMAND_GET_LAST_SEQ = (
+    "SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM MLDB_SEQ;"
+)
+COMMAND_GET_IN_PROGRESS = (
+    "SELECT ARRAY(SELECT txid_snapshot_xip(txid_current_snapshot()));"
+)
+COMMAND_ANY_IN_PROGRESS = (
+    "SELECT coalesce(bool_or(txid_status(x) = 'in progress'), false) "
+    "FROM unnest(%s::bigint[]) x;"
+)
+COMMAND_GET_DELETIONS = (
+    "SELECT EXPID, GROUPNAME FROM DELETIONS WHERE SEQ > %s ORDER BY SEQ;"
+)
+
+
+def default_path(config) -> str:
+    """The mirror's file in the user's cache directory, named after the
+    database described by `config`."""
+    cache_dir = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    name = f"{config.user}@{config.host}_{config.port}_{config.database}.sqlite"
+    return os.path.join(cache_dir, "mldb", name)
+
+
+class MirrorCursor:
+    """Runs the database's queries (with %s placeholders) against the mirror."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.cursor = conn.cursor()
+
+    def execute(self, query: str, args=None):
+        self.cursor.execute(query.replace("%s", "?"), tuple(args or ()))
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size: int):
+        return self.cursor.fetchmany(size)
+
+
+class Mirror:
+    """A local SQLite copy of the experiments' status, groups,
+    hyperparameters, losses, learning rates and latest metrics, with
+    Database's read methods for them.
+
+    `sync` brings it up to date with the database, fetching only the rows
+    written since the last sync.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or CONFIG.mirror_path or default_path(CONFIG)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30.0)
+        # readers carry on while a sync writes
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        for schema, _, _ in MIRROR_TABLES.values():
+            self.conn.execute(schema)
+        self.conn.execute(COMMAND_CREATE_STATE)
+        self.conn.commit()
+        self.cursor = MirrorCursor(self.conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f"Mirror({self.path})"
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def iter_chunks(self, command: str, args=None, chunk_size: int = None):
+        """Yield the rows of the query `command` in lists of up to
+        `chunk_size` rows, like Database.iter_chunks."""
+        chunk_size = chunk_size or Database.CHUNK_SIZE
+        cursor = MirrorCursor(self.conn)
+        cursor.execute(command, args)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+    def iter_query(self, command: str, args=None, chunk_size: int = None):
+        for rows in self.iter_chunks(command, args, chunk_size):
+            yield from rows
+
+    def get_state(self, name: str, default=None):
+        row = self.conn.execute(
+            "SELECT VALUE FROM MLDB_MIRROR WHERE NAME=?;", (name,)
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def set_state(self, name: str, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO MLDB_MIRROR (NAME, VALUE) VALUES (?, ?);",
+            (name, value),
+        )
+
+    @property
+    def watermark(self):
+        """Every row numbered up to this is in the mirror; None before the
+        first sync."""
+        return self.get_state("watermark")
+
+    def apply_rows(self, table: str, rows):
+        columns = MIRROR_TABLES[table][1]
+        placeholders = ", ".join("?" * len(columns.split(", ")))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders});",
+            rows,
+        )
+
+    def apply_deletions(self, rows):
+        """Drop the experiments (GROUPNAME None) and group memberships in
+        `rows` of (EXPID, GROUPNAME)."""
+        for expid, group in rows:
+            if group is None:
+                for table in MIRROR_TABLES:
+                    self.conn.execute(f"DELETE FROM {table} WHERE EXPID=?;", (expid,))
+            else:
+                self.conn.execute(
+                    "DELETE FROM EXPGROUPS WHERE EXPID=? AND GROUPNAME=?;",
+                    (expid, group),
+                )
+
+    @staticmethod
+    def wait_for(conn, xids: List[int], timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the transactions `xids` to end.
+        Returns whether they did."""
+        deadline = time.monotonic() + timeout
+        with conn.cursor() as cursor:
+            while True:
+                cursor.execute(COMMAND_ANY_IN_PROGRESS, (xids,))
+                if not cursor.fetchone()[0]:
+                    return True
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    def sync(self, conn, timeout: float = 2.0, batch_size: int = 10_000) -> dict:
+        """Fetch the rows written since the last sync (every row, the first
+        time) over the psycopg2 connection `conn`, and drop those deleted.
+        Returns the number of rows fetched from each table.
+
+        Numbers are taken from the sequence before transactions commit, so
+        rows can become visible out of order. The watermark only moves up to
+        the last number taken before the transactions in progress at the start
+        ended: those still running after `timeout` seconds are caught up with
+        next time, when the rows above the old watermark are fetched again.
+        """
+        watermark = self.watermark
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_GET_LAST_SEQ)
+            last_seq = cursor.fetchone()[0]
+            cursor.execute(COMMAND_GET_IN_PROGRESS)
+            in_progress = cursor.fetchone()[0]
+        settled = self.wait_for(conn, in_progress, timeout)
+        conn.commit()
+
+        counts = dict()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                if watermark is not None:
+                    cursor.execute(COMMAND_GET_DELETIONS, (watermark,))
+                    deletions = cursor.fetchall()
+                    self.apply_deletions(deletions)
+                    counts["DELETIONS"] = len(deletions)
+
+            for table, (_, columns, source) in MIRROR_TABLES.items():
+                query = f"SELECT {columns} FROM {source}"
+                if watermark is None:
+                    self.conn.execute(f"DELETE FROM {table};")
+                    args = ()
+                else:
+                    query += " WHERE SEQ > %s"
+                    args = (watermark,)
+                # a named cursor streams the rows rather than fetching them all
+                with conn.cursor(name=f"mldb_mirror_{table.lower()}") as cursor:
+                    cursor.itersize = batch_size
+                    cursor.execute(query, args)
+                    counts[table] = 0
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        self.apply_rows(table, rows)
+                        counts[table] += len(rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self.conn.rollback()
+            raise
+
+        if settled:
+            self.set_state("watermark", last_seq)
+        elif watermark is None:
+            # everything is in, but rows numbered before the sync may not be
+            self.set_state("watermark", 0)
+        self.set_state("synced", time.time())
+        self.conn.commit()
+        return counts
+
+    @staticmethod
+    def expid_list(expids) -> str:
+        return json.dumps(list(expids))
+
+    def get_status(self, expid: str) -> str:
+        self.cursor.execute("SELECT STATUS FROM STATUS WHERE EXPID=%s;", (expid,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise NoDataError(f'No status information found for experiment "{expid}"')
+        return row[0]
+
+    def get_losses(self, expid: str, as_arrays: bool = False) -> dict:
+        if as_arrays:
+            self.cursor.execute(
+                "SELECT KIND, EPOCH, VALUE FROM LOSS WHERE EXPID=%s ORDER BY KIND, EPOCH;",
+                (expid,),
+            )
+            return Database.loss_columns_from_rows(expid, self.cursor.fetchall())
+        self.cursor.execute(
+            "SELECT EXPID, EPOCH, KIND, VALUE FROM LOSS WHERE EXPID=%s ORDER BY KIND, EPOCH;",
+            (expid,),
+        )
+        return Database.losses_from_rows(expid, self.cursor.fetchall())
+
+    def get_lrs(self, expid: str, as_arrays: bool = False) -> dict:
+        self.cursor.execute(
+            "SELECT EPOCH, VALUE FROM LEARNINGRATE WHERE EXPID=%s ORDER BY EPOCH;",
+            (expid,),
+        )
+        rows = self.cursor.fetchall()
+        if as_arrays:
+            return Database.lr_columns_from_rows(rows)
+        return Database.lrs_from_rows(rows)
+
+    def get_hyperparams(self, expid: str) -> dict:
+        self.cursor.execute(
+            "SELECT EXPID, NAME, VALUE FROM HYPERPARAMS WHERE EXPID=%s;", (expid,)
+        )
+        return Database.hyperparams_from_rows(self.cursor.fetchall())
+
+    def get_latest_metrics(self, expid: str) -> dict:
+        self.cursor.execute(
+            "SELECT EXPID, EPOCH, KIND, VALUE FROM LATESTMETRICS WHERE EXPID=%s "
+            "AND EPOCH=(SELECT max(EPOCH) FROM LATESTMETRICS WHERE EXPID=%s);",
+            (expid, expid),
+        )
+        return Database.latest_metrics_from_rows(expid, self.cursor.fetchall())
+
+    def get_experiment_details(self, expid: str) -> dict:
+        return dict(
+            expid=expid,
+            status=self.get_status(expid),
+            losses=self.get_losses(expid),
+            lrs=self.get_lrs(expid),
+        )
+
+    def get_experiment_details_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        selected = "(SELECT value FROM json_each(%s))"
+        self.cursor.execute(
+            f"SELECT EXPID, STATUS FROM STATUS WHERE EXPID IN {selected};",
+            (self.expid_list(expids),),
+        )
+        status_rows = self.cursor.fetchall()
+        self.cursor.execute(
+            f"SELECT EXPID, EPOCH, KIND, VALUE FROM LOSS WHERE EXPID IN {selected} "
+            "ORDER BY EXPID, KIND, EPOCH;",
+            (self.expid_list(expids),),
+        )
+        loss_rows = self.cursor.fetchall()
+        self.cursor.execute(
+            f"SELECT EXPID, EPOCH, VALUE FROM LEARNINGRATE WHERE EXPID IN {selected} "
+            "ORDER BY EXPID, EPOCH;",
+            (self.expid_list(expids),),
+        )
+        lr_rows = self.cursor.fetchall()
+        return Database.experiment_details_many_from_rows(
+            expids, status_rows, loss_rows, lr_rows
+        )
+
+    def get_latest_metrics_many(self, expids: List[str]) -> dict:
+        self.cursor.execute(
+            "SELECT m.EXPID, m.EPOCH, m.KIND, m.VALUE FROM LATESTMETRICS m "
+            "WHERE m.EXPID IN (SELECT value FROM json_each(%s)) AND m.EPOCH="
+            "(SELECT max(EPOCH) FROM LATESTMETRICS l WHERE l.EXPID=m.EXPID);",
+            (self.expid_list(expids),),
+        )
+        return Database.latest_metrics_many_from_rows(self.cursor.fetchall())
+
+    def get_hyperparams_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        self.cursor.execute(
+            "SELECT EXPID, NAME, VALUE FROM HYPERPARAMS "
+            "WHERE EXPID IN (SELECT value FROM json_each(%s));",
+            (self.expid_list(expids),),
+        )
+        return Database.hyperparams_many_from_rows(expids, self.cursor.fetchall())
+
+    def get_groups_many(self, expids: List[str]) -> dict:
+        expids = list(expids)
+        self.cursor.execute(
+            "SELECT EXPID, GROUPNAME FROM EXPGROUPS "
+            "WHERE EXPID IN (SELECT value FROM json_each(%s));",
+            (self.expid_list(expids),),
+        )
+        return Database.groups_many_from_rows(expids, self.cursor.fetchall())
+
+    def search(self, text: str, limit: int = 100) -> List[tuple]:
+        self.cursor.execute(*search_query(text, limit))
+        return self.cursor.fetchall()
@@ -0,0 +1,137 @@
+from typing import Callable, List
+
+from .schema import SCHEMA_BY_TABLE, PARTITIONED_TABLES
+from .exception import SchemaVersionError
+from .migrations import (
+    COMMAND_GET_PARTITIONS,
+    MIGRATION_LOCK_KEY,
+    REQUIRED_VERSION,
+    get_version,
+)
+
+COMMAND_IS_PARTITIONED = "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid=to_regclass(%s));"
+# indexes other than those behind the table's own constraints, which the
+# schema creates anyway
+COMMAND_GET_EXTRA_INDEXES = "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid=to_regclass(%s) AND indexrelid NOT IN (SELECT conindid FROM pg_constraint WHERE conrelid=to_regclass(%s));"
+# columns in the order the table declares them, which a rebuilt table needn't
+# share with the original (e.g. if a column was added by ALTER TABLE)
+COMMAND_GET_COLUMNS = "SELECT column_name FROM information_schema.columns WHERE table_schema=current_schema() AND table_name=lower(%s) ORDER BY ordinal_position;"
+COMMAND_GET_TRIGGERS = "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid=to_regclass(%s) AND NOT tgisinternal;"
+
+
+def partitioned_schema(table: str, partitions: int) -> List[str]:
+    """Commands creating `table` hash partitioned by experiment, in
+    `partitions` partitions named {table}_P0, {table}_P1, ..."""
+    create = SCHEMA_BY_TABLE[table].rstrip().rstrip(";")
+    return [f"{create} PARTITION BY HASH (EXPKEY);"] + [
+        f"CREATE TABLE IF NOT EXISTS {table}_P{i} PARTITION OF {table} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i});"
+        for i in range(partitions)
+    ]
+
+
+def is_partitioned(conn, table: str) -> bool:
+    with conn.cursor() as cursor:
+        cursor.execute(COMMAND_IS_PARTITIONED, (table,))
+        partitioned = cursor.fetchone()[0]
+    conn.commit()
+    return partitioned
+
+
+def get_partitions(conn, table: str) -> List[str]:
+    """Names of the partitions of `table`: empty if it isn't partitioned."""
+    with conn.cursor() as cursor:
+        cursor.execute(COMMAND_GET_PARTITIONS, (table,))
+        partitions = [r[0] for r in cursor.fetchall()]
+    conn.commit()
+    return partitions
+
+
+def get_columns(cursor, table: str) -> List[str]:
+    cursor.execute(COMMAND_GET_COLUMNS, (table,))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def partition_table(table: str, partitions: int) -> Callable:
+    """Step rebuilding `table` hash partitioned by experiment.
+
+    Like rekey_table, the table is copied in one transaction, holding a lock
+    that makes writers wait until it is done. Extra indexes and triggers
+    (such as the one maintaining LATESTMETRICS) are recreated on the new table.
+    """
+    old = f"{table}__OLD"
+
+    def step(conn):
+        if is_partitioned(conn, table):
+            return
+
+        with conn.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE;")
+            cursor.execute(COMMAND_GET_EXTRA_INDEXES, (table, table))
+            indexes = [r[0] for r in cursor.fetchall()]
+            cursor.execute(COMMAND_GET_TRIGGERS, (table,))
+            triggers = [r[0] for r in cursor.fetchall()]
+
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {old};")
+            for command in partitioned_schema(table, partitions):
+                cursor.execute(command)
+            # copy by name: the new table's columns may be in another order
+            names = ", ".join(get_columns(cursor, table))
+            cursor.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {old};")
+            cursor.execute(f"DROP TABLE {old};")
+            for command in indexes + triggers:
+                cursor.execute(command + ";")
+        conn.commit()
+
+    return step
+
+
+def partition(conn, partitions: int = 16, log=print) -> List[str]:
+    """Hash partition the high-volume tables (PARTITIONED_TABLES) by
+    experiment. Tables already partitioned are left as they are. Returns the
+    tables converted.
+
+    Writes to each table wait while it is copied, so this is best run on a
+    new or quiet database.
+    """
+    version = get_version(conn)
+    if version < REQUIRED_VERSION:
+        raise SchemaVersionError(
+            f"Database schema is at version {version}: migrate it before partitioning."
+        )
+
+    # the same lock as migrations, which mustn't run while tables are rebuilt
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+    conn.commit()
+
+    converted = []
+    try:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(conn, table):
+                continue
+            log(f"Partitioning {table} into {partitions} partitions")
+            partition_table(table, partitions)(conn)
+            converted.append(table)
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+    return converted
+
+
+def vacuum(conn, tables: List[str] = None, log=print):
+    """VACUUM ANALYZE `tables` (default: the partitioned ones) a partition at
+    a time, so each pass is short and holds its lock on a fraction of the
+    table only."""
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for table in tables or PARTITIONED_TABLES:
+                for part in get_partitions(conn, table) or [table]:
+                    log(f"Vacuuming {part}")
+                    cursor.execute(f"VACUUM ANALYZE {part};")
+    finally:
+        conn.autocommit = False
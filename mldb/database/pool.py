@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2 import connect
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
+
+from .exception import PoolTimeoutError
+
+_POOLS = dict()
+_POOLS_LOCK = threading.Lock()
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections to one database.
+
+    Keeps at least `minconn` connections open and hands out at most `maxconn`
+    at once; further borrowers wait (up to `timeout` seconds, if given) for a
+    connection to be returned.
+    """
+
+    def __init__(self, dsn: dict, minconn: int = 1, maxconn: int = 10, timeout=None):
+        if not 0 <= minconn <= maxconn:
+            raise ValueError(f"Need 0 <= minconn <= maxconn, got {minconn}, {maxconn}.")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.schema_verified = False
+
+        self.idle = deque()
+        self.n_open = 0
+        self.n_in_use = 0
+        self.cond = threading.Condition()
+        self.counters = dict(
+            connections_opened=0,
+            borrows=0,
+            waits=0,
+            wait_time=0.0,
+            discarded=0,
+            replaced=0,
+            peak_in_use=0,
+        )
+
+        for _ in range(minconn):
+            self.idle.append(self.open_connection())
+            self.n_open += 1
+
+    def open_connection(self):
+        conn = connect(**self.dsn)
+        self.counters["connections_opened"] += 1
+        return conn
+
+    @staticmethod
+    def is_alive(conn) -> bool:
+        """Whether an idle connection still works: the server may have closed
+        it (restart, idle timeout) since it was returned."""
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def getconn(self):
+        t0 = time.monotonic()
+        deadline = None if self.timeout is None else t0 + self.timeout
+        with self.cond:
+            if not self.idle and self.n_open >= self.maxconn:
+                self.counters["waits"] += 1
+            while not self.idle and self.n_open >= self.maxconn:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No connection free after {self.timeout}s ({self.maxconn} in use)."
+                    )
+                self.cond.wait(remaining)
+            self.counters["wait_time"] += time.monotonic() - t0
+
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.n_open += 1
+            self.n_in_use += 1
+            self.counters["borrows"] += 1
+            self.counters["peak_in_use"] = max(
+                self.counters["peak_in_use"], self.n_in_use
+            )
+
+        if conn is not None and not self.is_alive(conn):
+            # keep its slot, but hand out a fresh connection instead
+            if not conn.closed:
+                conn.close()
+            conn = None
+            with self.cond:
+                self.counters["replaced"] += 1
+        if conn is None:
+            # connect outside the lock, so other borrowers aren't held up
+            try:
+                conn = self.open_connection()
+            except Exception:
+                with self.cond:
+                    self.n_open -= 1
+                    self.n_in_use -= 1
+                    self.cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            # don't leave a transaction open for the next borrower
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        discard = (
+            discard
+            or bool(conn.closed)
+            or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN
+        )
+
+        with self.cond:
+            self.n_in_use -= 1
+            if discard or len(self.idle) >= self.maxconn:
+                self.n_open -= 1
+                self.counters["discarded"] += int(discard)
+            else:
+                self.idle.append(conn)
+                conn = None
+            self.cond.notify()
+
+        if conn is not None and not conn.closed:
+            conn.close()
+
+    def closeall(self):
+        with self.cond:
+            while self.idle:
+                self.idle.pop().close()
+                self.n_open -= 1
+
+    def stats(self) -> dict:
+        with self.cond:
+            return dict(
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+                open=self.n_open,
+                in_use=self.n_in_use,
+                idle=len(self.idle),
+                **self.counters,
+            )
+
+
+def get_pool(config) -> ConnectionPool:
+    """The process-wide pool for the database described by `config`."""
+    dsn = config.as_dict()
+    key = tuple(sorted(dsn.items()))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool.pid != os.getpid():
+            # connections can't be shared with a forked parent: start afresh
+            pool = _POOLS[key] = ConnectionPool(
+                dsn, config.pool_min, config.pool_max, config.pool_timeout
+            )
+        return pool
+
+
+def pool_stats() -> dict:
+    """Usage statistics of every pool in this process, by database."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return {
+        f"{p.dsn['user']}@{p.dsn['host']}:{p.dsn['port']}/{p.dsn['database']}": p.stats()
+        for p in pools
+        if p.pid == os.getpid()
+    }
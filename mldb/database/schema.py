@@ -1,32 +1,105 @@
+# Tables with a row per epoch (or step, or plot) refer to experiments, kinds
+# and plot ids by integer key, looked up in the EXPERIMENTS, KINDS and PLOTS
+# registries, rather than repeating the names on every row.
 _SCHEMA_AND_TABLES = {
+    "EXPERIMENTS": "CREATE TABLE IF NOT EXISTS \
+    EXPERIMENTS (EXPKEY SERIAL PRIMARY KEY, EXPID TEXT NOT NULL UNIQUE);",
+    "KINDS": "CREATE TABLE IF NOT EXISTS \
+    KINDS (KINDKEY SERIAL PRIMARY KEY, KIND TEXT NOT NULL UNIQUE);",
+    "PLOTS": "CREATE TABLE IF NOT EXISTS \
+    PLOTS (PLOTKEY SERIAL PRIMARY KEY, PLOTID TEXT NOT NULL UNIQUE);",
     "STATUS": "CREATE TABLE IF NOT EXISTS \
     STATUS (EXPID TEXT NOT NULL UNIQUE, STATUS TEXT NOT NULL);",
+    # when each experiment's status last changed, kept up to date by a trigger
+    # on STATUS (see migration 6)
+    "STATUSTIMES": "CREATE TABLE IF NOT EXISTS \
+    STATUSTIMES (EXPID TEXT NOT NULL UNIQUE, UPDATED TIMESTAMPTZ NOT NULL DEFAULT now(), SEQ BIGINT);",
     "CONFIG": "CREATE TABLE IF NOT EXISTS \
     CONFIG (EXPID TEXT NOT NULL UNIQUE, CONFIG TEXT NOT NULL);",
     "LOSS": "CREATE TABLE IF NOT EXISTS \
-    LOSS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL,\
-    UNIQUE(EXPID, EPOCH, KIND));",
+    LOSS (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, KINDKEY INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL,\
+    SEQ BIGINT, UNIQUE(EXPKEY, EPOCH, KINDKEY));",
     "METRICS": "CREATE TABLE IF NOT EXISTS \
-    METRICS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, KIND TEXT NOT NULL, VALUE REAL NOT NULL,\
-    UNIQUE(EXPID, EPOCH, KIND));",
+    METRICS (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, KINDKEY INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL,\
+    UNIQUE(EXPKEY, EPOCH, KINDKEY));",
+    # the METRICS rows of each experiment's latest epoch, kept up to date by a
+    # trigger on METRICS (see migration 5)
+    "LATESTMETRICS": "CREATE TABLE IF NOT EXISTS \
+    LATESTMETRICS (EXPKEY INTEGER NOT NULL, KINDKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL,\
+    SEQ BIGINT, UNIQUE(EXPKEY, KINDKEY));",
     "STATE": "CREATE TABLE IF NOT EXISTS \
-    STATE (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, PATH TEXT NOT NULL,\
-    UNIQUE(EXPID, EPOCH, PATH));",
+    STATE (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, PATH TEXT NOT NULL,\
+    UNIQUE(EXPKEY, EPOCH, PATH));",
     "HYPERPARAMS": "CREATE TABLE IF NOT EXISTS \
     HYPERPARAMS (EXPID TEXT NOT NULL, NAME TEXT NOT NULL, VALUE TEXT NOT NULL,\
-    UNIQUE(EXPID, NAME));",
+    SEQ BIGINT, UNIQUE(EXPID, NAME));",
     "LEARNINGRATE": "CREATE TABLE IF NOT EXISTS \
-    LEARNINGRATE (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, VALUE TEXT NOT NULL,\
-    UNIQUE(EXPID, EPOCH));",
+    LEARNINGRATE (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL,\
+    SEQ BIGINT, UNIQUE(EXPKEY, EPOCH));",
     "QUALITATIVERESULTSMETA": "CREATE TABLE IF NOT EXISTS \
     QUALITATIVERESULTSMETA (EXPID TEXT NOT NULL, PLOTID TEXT NOT NULL, VALUE TEXT NOT NULL,\
     UNIQUE(EXPID, PLOTID));",
     "QUALITATIVERESULTS": "CREATE TABLE IF NOT EXISTS \
-    QUALITATIVERESULTS (EXPID TEXT NOT NULL, EPOCH INTEGER NOT NULL, PLOTID TEXT NOT NULL, VALUE TEXT NOT NULL);",
+    QUALITATIVERESULTS (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, PLOTKEY INTEGER NOT NULL, VALUE TEXT NOT NULL);",
+    "QUALITATIVEARRAYS": "CREATE TABLE IF NOT EXISTS \
+    QUALITATIVEARRAYS (EXPKEY INTEGER NOT NULL, EPOCH INTEGER NOT NULL, PLOTKEY INTEGER NOT NULL, VALUE BYTEA NOT NULL);",
+    # where the qualitative results moved to cold storage are (see cold.py)
+    "QUALITATIVECOLD": "CREATE TABLE IF NOT EXISTS \
+    QUALITATIVECOLD (EXPKEY INTEGER NOT NULL UNIQUE, PATH TEXT NOT NULL);",
     "EXPGROUPS": "CREATE TABLE IF NOT EXISTS \
-    EXPGROUPS (EXPID TEXT NOT NULL, GROUPNAME TEXT NOT NULL, \
+    EXPGROUPS (EXPID TEXT NOT NULL, GROUPNAME TEXT NOT NULL, SEQ BIGINT, \
     UNIQUE(EXPID, GROUPNAME));",
+    # experiments deleted (GROUPNAME null) and experiments removed from groups,
+    # for local mirrors to catch up with (see mirror.py)
+    "DELETIONS": "CREATE TABLE IF NOT EXISTS \
+    DELETIONS (EXPID TEXT NOT NULL, GROUPNAME TEXT, SEQ BIGINT);",
+    # each experiment's id, status, groups and hyperparameter values in one
+    # lower case document, for searching, kept up to date by triggers (see
+    # migration 9 and search.py)
+    "SEARCHINDEX": "CREATE TABLE IF NOT EXISTS \
+    SEARCHINDEX (EXPID TEXT NOT NULL UNIQUE, STATUS TEXT NOT NULL, DOC TEXT NOT NULL, SEQ BIGINT);",
+    "STEPS": "CREATE TABLE IF NOT EXISTS \
+    STEPS (EXPKEY INTEGER NOT NULL, KINDKEY INTEGER NOT NULL, STEP INTEGER NOT NULL, VALUE DOUBLE PRECISION NOT NULL,\
+    WALLTIME TIMESTAMPTZ NOT NULL DEFAULT now(), UNIQUE(EXPKEY, KINDKEY, STEP));",
 }
 
 SCHEMA = list(_SCHEMA_AND_TABLES.values())
 TABLES = list(_SCHEMA_AND_TABLES.keys())
+SCHEMA_BY_TABLE = dict(_SCHEMA_AND_TABLES)
+
+REGISTRIES = ["EXPERIMENTS", "KINDS", "PLOTS"]
+# statuses an experiment ends in, after which nothing more is logged to it
+FAILED_STATUSES = ["ERROR", "CANCELLED"]
+TERMINAL_STATUSES = frozenset(["COMPLETE", *FAILED_STATUSES])
+# the high-volume tables, hash partitioned by experiment when opted in to (see
+# partitions.py)
+PARTITIONED_TABLES = [
+    "LOSS",
+    "METRICS",
+    "QUALITATIVERESULTS",
+    "QUALITATIVEARRAYS",
+    "STEPS",
+]
+# tables whose rows are numbered from MLDB_SEQ as they are written, so local
+# mirrors can fetch what changed since they last synced (see migration 7)
+SEQUENCED_TABLES = [
+    "STATUSTIMES",
+    "LOSS",
+    "LATESTMETRICS",
+    "HYPERPARAMS",
+    "LEARNINGRATE",
+    "EXPGROUPS",
+    "DELETIONS",
+    "SEARCHINDEX",
+]
+KEYED_TABLES = [
+    "LOSS",
+    "METRICS",
+    "LATESTMETRICS",
+    "STATE",
+    "LEARNINGRATE",
+    "QUALITATIVERESULTS",
+    "QUALITATIVEARRAYS",
+    "QUALITATIVECOLD",
+    "STEPS",
+]
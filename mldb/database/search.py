@@ -0,0 +1,70 @@
+from typing import List, Tuple
+
+# Searches run against SEARCHINDEX, which holds a lower case document per
+# experiment: its id, status, groups and hyperparameter values, a line each,
+# id first. The same query runs on the database and on a local mirror.
+#
+# Space separated terms must all appear somewhere in the document, and terms
+# starting with "!" mustn't. Results are ranked by how the first term matches
+# the id: exactly, then as a prefix, then anywhere. Each rank is fetched
+# newest first with its own LIMIT, so a common term stops at the first few
+# matches rather than ranking every experiment: prefixes come from the
+# B-tree index on DOC, other matches from the trigram index (where pg_trgm is
+# installed) or a scan of the index's compact rows.
+
+COMMAND_SEARCH_RANK = "SELECT * FROM (SELECT EXPID, STATUS, {rank} AS RANK FROM SEARCHINDEX WHERE {conditions} ORDER BY EXPID DESC LIMIT %s) AS RANK{rank}"
+COMMAND_SEARCH = "SELECT EXPID, STATUS FROM ({ranks}) AS RANKED ORDER BY RANK DESC, EXPID DESC LIMIT %s;"
+COMMAND_LIKE = "DOC LIKE %s ESCAPE '\\'"
+COMMAND_NOT_LIKE = "NOT DOC LIKE %s ESCAPE '\\'"
+
+
+def parse(text: str) -> Tuple[List[str], List[str]]:
+    """(terms, negated terms) of a search, in lower case."""
+    terms, negated = [], []
+    for part in text.lower().split():
+        if part.startswith("!"):
+            if part[1:]:
+                negated.append(part[1:])
+        else:
+            terms.append(part)
+    return terms, negated
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_query(text: str, limit: int = 100) -> Tuple[str, list]:
+    """Query, and its arguments, for the `limit` best (expid, status) matches
+    of the search `text`."""
+    terms, negated = parse(text)
+    conditions, args = [], []
+    for term in terms[1:]:
+        conditions.append(COMMAND_LIKE)
+        args.append(f"%{escape_like(term)}%")
+    for term in negated:
+        conditions.append(COMMAND_NOT_LIKE)
+        args.append(f"%{escape_like(term)}%")
+
+    if not terms:
+        ranks = [(0, [], [])]
+    else:
+        first = escape_like(terms[0])
+        exact, prefix, anywhere = f"{first}\n%", f"{first}%", f"%{first}%"
+        ranks = [
+            (2, [COMMAND_LIKE], [exact]),
+            (1, [COMMAND_LIKE, COMMAND_NOT_LIKE], [prefix, exact]),
+            (0, [COMMAND_LIKE, COMMAND_NOT_LIKE], [anywhere, prefix]),
+        ]
+
+    selects, query_args = [], []
+    for rank, rank_conditions, rank_args in ranks:
+        selects.append(
+            COMMAND_SEARCH_RANK.format(
+                rank=rank,
+                conditions=" AND ".join(rank_conditions + conditions) or "TRUE",
+            )
+        )
+        query_args += rank_args + args + [limit]
+    query = COMMAND_SEARCH.format(ranks=" UNION ALL ".join(selects))
+    return query, query_args + [limit]
@@ -0,0 +1,303 @@
+import glob
+import json
+import math
+import os
+import socket
+import threading
+import time
+
+from psycopg2 import OperationalError
+from psycopg2.errors import UniqueViolation
+
+from ..config import CONFIG
+from .database import Database
+
+SPOOL_DIR_NAME = ".mldb_spool"
+
+# Journal segments move through these states, by file suffix:
+#   .open        being appended to by the process named in the file
+#   .jsonl       sealed, waiting to be replayed
+#   .replaying   claimed by the replayer named after the @
+# A .progress file alongside holds the number of lines (calls) at the start of
+# the segment whose writes have been committed.
+OPEN, SEALED, REPLAYING, PROGRESS = ".open", ".jsonl", ".replaying", ".progress"
+
+_HOST = socket.gethostname()
+
+
+def default_spool_dir() -> str:
+    return os.path.join(CONFIG.root_dir, SPOOL_DIR_NAME)
+
+
+def encode_call(name: str, args: tuple, kwargs: dict) -> str:
+    return json.dumps([name, args, kwargs], default=Database.sanitise_value)
+
+
+def decode_call(line: str) -> tuple:
+    name, args, kwargs = json.loads(line)
+    return name, tuple(args), kwargs
+
+
+class Journal:
+    """Append-only journal of Database write calls, one JSON line per call,
+    split into segments that can be sealed and replayed independently."""
+
+    def __init__(self, spool_dir: str = None, fsync: bool = False):
+        self.spool_dir = spool_dir or default_spool_dir()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.fsync = fsync
+        self.name = f"{_HOST}_{os.getpid()}_{time.time_ns()}"
+        self.segment = 0
+        self.n_calls = 0
+        self.file = None
+        self.lock = threading.Lock()
+
+    def segment_base(self) -> str:
+        return os.path.join(self.spool_dir, f"{self.name}_{self.segment:06d}")
+
+    def append(self, name: str, args: tuple, kwargs: dict):
+        line = encode_call(name, args, kwargs) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.segment_base() + OPEN, "a")
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.n_calls += 1
+
+    def seal(self):
+        """Close the current segment, making it available for replay."""
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+            base = self.segment_base()
+            os.replace(base + OPEN, base + SEALED)
+            self.segment += 1
+            self.n_calls = 0
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _owner_is_dead(owner: str) -> bool:
+    # owner is "<host>_<pid>"; we can only tell for processes on this host
+    host, _, pid = owner.rpartition("_")
+    return host == _HOST and not _pid_alive(int(pid))
+
+
+def recover_orphans(spool_dir: str):
+    """Seal segments left open, and release segments left claimed, by
+    processes on this host that have since died."""
+    for path in glob.glob(os.path.join(spool_dir, "*" + OPEN)):
+        base = path[: -len(OPEN)]
+        owner = "_".join(os.path.basename(base).split("_")[:-2])
+        if _owner_is_dead(owner):
+            os.replace(path, base + SEALED)
+
+    for path in glob.glob(os.path.join(spool_dir, "*" + REPLAYING)):
+        base, owner = path[: -len(REPLAYING)].rsplit("@", 1)
+        if _owner_is_dead(owner):
+            os.replace(path, base + SEALED)
+
+
+def claim_segment(path: str) -> str:
+    """Atomically claim a sealed segment for replay, or return None if another
+    replayer got there first."""
+    claimed = f"{path[: -len(SEALED)]}@{_HOST}_{os.getpid()}{REPLAYING}"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def write_calls(db: Database, calls: list, committed) -> int:
+    """Write calls in order, calling `committed(n)` whenever the first n are
+    known to be committed. The rows of buffered calls are written in one go,
+    and flushed before any call that commits by itself, so calls are always
+    committed in order. If a call fails, the rest are written one at a time
+    to isolate it; rows that are already present are skipped."""
+    done = 0
+
+    def commit(n: int):
+        nonlocal done
+        done = n
+        committed(n)
+
+    db.start_buffering(len(calls) + 1, math.inf)
+    try:
+        for i, (name, args, kwargs) in enumerate(calls):
+            if name in db.BUFFERED_METHODS:
+                getattr(db, name)(*args, **kwargs)
+            else:
+                db.flush()
+                commit(i)
+                getattr(db, name)(*args, **kwargs)
+                commit(i + 1)
+        db.flush()
+        commit(len(calls))
+        return len(calls)
+    except OperationalError:
+        raise
+    except Exception:
+        db.conn.rollback()
+    finally:
+        # rows not flushed are written again below, or by the next replay
+        db.stop_buffering(discard=True)
+
+    n_written = done
+    for i in range(done, len(calls)):
+        name, args, kwargs = calls[i]
+        try:
+            getattr(db, name)(*args, **kwargs)
+            n_written += 1
+        except UniqueViolation:
+            db.conn.rollback()
+        except OperationalError:
+            raise
+        except Exception as e:
+            db.conn.rollback()
+            print(f"mldb: skipping {name}{args} from journal: {e}")
+        commit(i + 1)
+    return n_written
+
+
+def read_progress(progress_path: str) -> int:
+    if not os.path.exists(progress_path):
+        return 0
+    with open(progress_path) as f:
+        return int(f.read().strip() or 0)
+
+
+def write_progress(progress_path: str, n: int):
+    # replaced whole, so a crash leaves the old count or the new one
+    with open(progress_path + ".tmp", "w") as f:
+        f.write(f"{n}\n")
+    os.replace(progress_path + ".tmp", progress_path)
+
+
+def replay_segment(db: Database, claimed_path: str, batch_size: int = 1000) -> int:
+    """Write the calls of a claimed segment, in order, `batch_size` at a time,
+    resuming after the calls an earlier attempt committed."""
+    base = claimed_path[: -len(REPLAYING)].rsplit("@", 1)[0]
+    progress_path = base + PROGRESS
+
+    with open(claimed_path) as f:
+        calls = [decode_call(line) for line in f if line.strip()]
+
+    offset = read_progress(progress_path)
+    n_written = 0
+    while offset < len(calls):
+        batch = calls[offset : offset + batch_size]
+
+        def committed(n: int, start=offset):
+            write_progress(progress_path, start + n)
+
+        n_written += write_calls(db, batch, committed)
+        offset += len(batch)
+
+    os.remove(claimed_path)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return n_written
+
+
+def replay(spool_dir: str = None, db: Database = None) -> int:
+    """Load every sealed journal segment in `spool_dir` into the database,
+    removing each once it's done. Returns the number of calls written."""
+    spool_dir = spool_dir or default_spool_dir()
+    if not os.path.isdir(spool_dir):
+        return 0
+    recover_orphans(spool_dir)
+
+    segments = sorted(glob.glob(os.path.join(spool_dir, "*" + SEALED)))
+    if not segments:
+        return 0
+
+    if db is None:
+        with Database() as db:
+            return replay(spool_dir, db)
+
+    n_written = 0
+    for path in segments:
+        claimed = claim_segment(path)
+        if claimed is None:
+            continue
+        try:
+            n_written += replay_segment(db, claimed)
+        except Exception:
+            # release the claim; the progress file lets the next attempt resume
+            os.replace(claimed, path)
+            raise
+    return n_written
+
+
+class SpoolLogger:
+    """Journals Database write calls to local files under `spool_dir` and
+    replays them into the database from a background thread whenever it is
+    reachable. Logging never connects to the database on the caller's thread,
+    so training can't stall or fail because the database is down.
+
+    Journals left behind (e.g. by a job killed while the database was down)
+    are picked up by the next replay: `python -m mldb replay`.
+    """
+
+    WRITE_METHODS = Database.WRITE_METHODS
+
+    def __init__(
+        self, spool_dir: str = None, replay_interval: float = 30.0, fsync=False
+    ):
+        self.journal = Journal(spool_dir, fsync=fsync)
+        self.replay_interval = replay_interval
+        self.n_replayed = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="mldb-spool-replay", daemon=True
+        )
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, name):
+        if name not in self.WRITE_METHODS:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+
+        def journal(*args, **kwargs):
+            self.journal.append(name, args, kwargs)
+
+        return journal
+
+    def try_replay(self):
+        self.journal.seal()
+        try:
+            self.n_replayed += replay(self.journal.spool_dir)
+        except OperationalError as e:
+            print(f"mldb: database unreachable, keeping journal for later: {e}")
+
+    def run(self):
+        while not self.stopping.wait(self.replay_interval):
+            self.try_replay()
+
+    def close(self, replay: bool = True):
+        self.stopping.set()
+        self.thread.join()
+        if replay:
+            self.try_replay()
+        else:
+            self.journal.seal()
@@ -1,16 +1,42 @@
 from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
 
 from mldb import Database
+from mldb.config import CONFIG
+from mldb.database import Mirror, ChangeListener
+
+
+def open_reader(local: bool = True):
+    """The local mirror, if the config enables it (and `local`), else the
+    database. The mirror only has what it had at its last sync."""
+    return Mirror() if local and CONFIG.mirror else Database(cached=True)
+
+
+class ChangeNotifier(QObject):
+    """Emits `changed` with each change committed to the database; connected
+    slots run in the receiver's (GUI) thread."""
+
+    changed = Signal(object)
+    _instance = None
+
+    def __init__(self):
+        super().__init__()
+        self.listener = ChangeListener(CONFIG, self.changed.emit).start()
+
+    @classmethod
+    def instance(cls) -> "ChangeNotifier":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
 
 
 class DBQuery(QObject):
 
     results_returned = Signal(list)
 
-    def __init__(self, query: str, slot=None):
+    def __init__(self, query: str, slot=None, args=None, local=False):
         super().__init__()
         self.query = _DBQueryWorker(
-            query, lambda rows: self.results_returned.emit(rows)
+            query, lambda rows: self.results_returned.emit(rows), args, local
         )
         if slot:
             self.results_returned.connect(slot)
@@ -20,14 +46,16 @@ class DBQuery(QObject):
 
 
 class _DBQueryWorker(QRunnable):
-    def __init__(self, query: str, cb):
+    def __init__(self, query: str, cb, args=None, local=False):
         super().__init__()
         self.query = query
         self.cb = cb
+        self.args = args
+        self.local = local
 
     def run(self):
-        with Database() as db:
-            db.cursor.execute(self.query)
+        with open_reader(self.local) as db:
+            db.cursor.execute(self.query, self.args)
             results = db.cursor.fetchall()
         self.cb(results)
 
@@ -35,6 +63,54 @@ class _DBQueryWorker(QRunnable):
         QThreadPool.globalInstance().start(self)
 
 
+class DBQueryChunks(QObject):
+    """Like DBQuery, but emits the rows as they are fetched, `chunk_size` at a
+    time, then `finished` once they are all in."""
+
+    chunk_returned = Signal(list)
+    finished = Signal()
+
+    def __init__(
+        self, query: str, slot=None, args=None, local=False, chunk_size: int = None
+    ):
+        super().__init__()
+        self.query = _DBQueryChunksWorker(
+            query,
+            lambda rows: self.chunk_returned.emit(rows),
+            lambda: self.finished.emit(),
+            args,
+            local,
+            chunk_size,
+        )
+        if slot:
+            self.chunk_returned.connect(slot)
+
+    def start(self):
+        self.query.start()
+
+
+class _DBQueryChunksWorker(QRunnable):
+    def __init__(
+        self, query: str, cb, done_cb, args=None, local=False, chunk_size=None
+    ):
+        super().__init__()
+        self.query = query
+        self.cb = cb
+        self.done_cb = done_cb
+        self.args = args
+        self.local = local
+        self.chunk_size = chunk_size
+
+    def run(self):
+        with open_reader(self.local) as db:
+            for rows in db.iter_chunks(self.query, self.args, self.chunk_size):
+                self.cb(rows)
+        self.done_cb()
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+
+
 class DBExpDetails(QObject):
 
     results_returned = Signal(dict)
@@ -58,7 +134,7 @@ class _DBExpDetailsWorker(QRunnable):
         self.cb = cb
 
     def run(self):
-        with Database() as db:
+        with open_reader() as db:
             rv = db.get_experiment_details(self.expid)
         self.cb(rv)
 
@@ -89,7 +165,7 @@ class _DBExpMetricsWorker(QRunnable):
         self.cb = cb
 
     def run(self):
-        with Database() as db:
+        with open_reader() as db:
             metrics = db.get_latest_metrics(self.expid)
         self.cb(metrics)
 
@@ -97,6 +173,71 @@ class _DBExpMetricsWorker(QRunnable):
         QThreadPool.globalInstance().start(self)
 
 
+class DBExpDetailsMany(QObject):
+
+    results_returned = Signal(dict)
+
+    def __init__(self, expids: list, slot=None):
+        super().__init__()
+        self.query = _DBExpDetailsManyWorker(
+            expids, lambda rv: self.results_returned.emit(rv)
+        )
+        if slot:
+            self.results_returned.connect(slot)
+
+    def start(self):
+        self.query.start()
+
+
+class _DBExpDetailsManyWorker(QRunnable):
+    def __init__(self, expids: list, cb):
+        super().__init__()
+        self.expids = expids
+        self.cb = cb
+
+    def run(self):
+        with open_reader() as db:
+            rv = db.get_experiment_details_many(self.expids)
+        self.cb(rv)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+
+
+class DBExpMetricsMany(QObject):
+
+    results_returned = Signal(dict)
+
+    def __init__(self, expids: list, slot=None):
+        super().__init__()
+        self.query = _DBExpMetricsManyWorker(
+            expids, lambda rv: self.results_returned.emit(rv)
+        )
+        if slot:
+            self.results_returned.connect(slot)
+
+    def start(self):
+        self.query.start()
+
+
+class _DBExpMetricsManyWorker(QRunnable):
+    def __init__(self, expids: list, cb):
+        super().__init__()
+        self.expids = expids
+        self.cb = cb
+
+    def run(self):
+        with open_reader() as db:
+            rv = dict(
+                metrics=db.get_latest_metrics_many(self.expids),
+                groups=db.get_groups_many(self.expids),
+            )
+        self.cb(rv)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+
+
 class DBExpQualResults(QObject):
 
     results_returned = Signal(dict)
@@ -121,18 +262,13 @@ class _DBExpQualResultsWorker(QRunnable):
         self.plotids = plots
 
     def run(self):
-        with Database() as db:
+        with Database(cached=True) as db:
             qualres = []
             if not self.plotids:
-                db.cursor.execute(
-                    "SELECT DISTINCT PLOTID FROM QUALITATIVERESULTS WHERE EXPID=%s",
-                    (self.expid,),
-                )
-                self.plotids = db.cursor.fetchall()
+                self.plotids = db.get_qualitative_plot_ids(self.expid)
                 print("plot ids", self.plotids)
 
             for plotid in self.plotids:
-                plotid = plotid[0]
                 qualres.append((plotid, db.get_qualitative_result(self.expid, plotid)))
         self.cb(qualres)
 
@@ -163,7 +299,7 @@ class _DBExpHyperParamsWorker(QRunnable):
         self.cb = cb
 
     def run(self):
-        with Database() as db:
+        with open_reader() as db:
             hparams = db.get_hyperparams(self.expid)
         self.cb(hparams)
 
@@ -171,6 +307,34 @@ class _DBExpHyperParamsWorker(QRunnable):
         QThreadPool.globalInstance().start(self)
 
 
+class DBSync(QObject):
+
+    results_returned = Signal(dict)
+
+    def __init__(self, slot=None):
+        super().__init__()
+        self.query = _DBSyncWorker(lambda counts: self.results_returned.emit(counts))
+        if slot:
+            self.results_returned.connect(slot)
+
+    def start(self):
+        self.query.start()
+
+
+class _DBSyncWorker(QRunnable):
+    def __init__(self, cb):
+        super().__init__()
+        self.cb = cb
+
+    def run(self):
+        with Database(cached=False) as db, Mirror() as mirror:
+            counts = mirror.sync(db.conn)
+        self.cb(counts)
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
+
+
 class DBMethod(QObject):
 
     results_returned = Signal(object)
@@ -195,6 +359,6 @@ class _DBMethodWorker(QRunnable):
         self.cb = cb
 
     def run(self):
-        with Database() as db:
+        with Database(cached=True) as db:
             for args in self.argss:
                 self.cb(self.method(db, *args))
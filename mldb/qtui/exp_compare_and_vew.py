@@ -1,6 +1,6 @@
 from typing import List
 
-from PySide6.QtCore import Signal
+from PySide6.QtCore import Signal, QTimer
 from PySide6.QtWidgets import (
     QWidget,
     QDialog,
@@ -14,6 +14,8 @@ from PySide6.QtWidgets import (
     QPushButton,
 )
 
+from mldb.config import CONFIG
+from .db_iop import ChangeNotifier, DBSync
 from .plot_widget import PlotWidget
 from .exp_views import (
     ExpLossAndLRView,
@@ -80,6 +82,17 @@ def plot_widget_and_table(grouping_table=False):
 
 class ExpCompareAndViewDialog(QDialog):
     QUERY = ""
+    # the views to refresh when a table is written to
+    VIEWS_BY_TABLE = dict(
+        STATUS=["Loss Curve"],
+        LOSS=["Loss Curve"],
+        LEARNINGRATE=["Loss Curve"],
+        METRICS=["Metrics"],
+        EXPGROUPS=["Metrics"],
+        DELETIONS=["Metrics"],
+        QUALITATIVERESULTS=["Qualitative Results"],
+        QUALITATIVEARRAYS=["Qualitative Results"],
+    )
 
     def __init__(self, parent: QWidget, expids: List[str], *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
@@ -94,7 +107,7 @@ class ExpCompareAndViewDialog(QDialog):
 
         self.layout = QVBoxLayout(self)
         refresh_button = QPushButton('Refresh')
-        refresh_button.clicked.connect(self.refresh)
+        refresh_button.clicked.connect(lambda: self.refresh())
         self.layout.addWidget(refresh_button)
 
         self.tabs = QTabWidget()
@@ -110,9 +123,41 @@ class ExpCompareAndViewDialog(QDialog):
 
         for tabname, widget in self.views.items():
             self.tabs.addTab(widget, tabname)
-    
-    def refresh(self):
-        for view in self.views.values():
+
+        # refresh the views showing what was written to the experiments, at
+        # most once a second
+        self.changed_tables = set()
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.setInterval(1000)
+        self.change_timer.timeout.connect(self.refresh_changed)
+        ChangeNotifier.instance().changed.connect(self.experiment_changed)
+
+    def experiment_changed(self, change):
+        if change.expid not in self.expids or not self.isVisible():
+            return
+        self.changed_tables.add(change.table)
+        if not self.change_timer.isActive():
+            self.change_timer.start()
+
+    def refresh_changed(self):
+        names = {
+            name
+            for table in self.changed_tables
+            for name in self.VIEWS_BY_TABLE.get(table, [])
+        }
+        self.changed_tables.clear()
+        if not names:
+            return
+        if CONFIG.mirror:
+            DBSync(lambda _: self.refresh(names)).start()
+        else:
+            self.refresh(names)
+
+    def refresh(self, names=None):
+        for name, view in self.views.items():
+            if names is not None and name not in names:
+                continue
             try:
                 view.refresh()
             except Exception as e:
@@ -1,4 +1,5 @@
-from typing import List, Union
+from datetime import datetime
+from typing import List
 import re
 
 from PySide6.QtWidgets import (
@@ -14,10 +15,18 @@ from PySide6.QtWidgets import (
     QLineEdit,
     QHeaderView,
 )
-from PySide6.QtCore import Signal, Qt
-import psycopg2.sql as sql
-
-from .db_iop import DBQuery, DBMethod, Database
+from PySide6.QtCore import Signal, Qt, QTimer
+
+from mldb.config import CONFIG
+from mldb.database.search import search_query
+from .db_iop import (
+    DBQuery,
+    DBQueryChunks,
+    DBMethod,
+    DBSync,
+    Database,
+    ChangeNotifier,
+)
 from .exp_compare_and_vew import ExpCompareAndViewDialog
 from .edit_groups import GroupEditDialog
 
@@ -32,6 +41,10 @@ class ExperimentListWidget(QWidget):
         ),
     )
 
+    FOLD_RE = re.compile(r"(.*)_(fold_?\d+|final|mean)")
+    # searches list the best matches only; see mldb/database/search.py
+    SEARCH_LIMIT = 1000
+
     status_signal = Signal(str)
     progress_signal = Signal(int)
 
@@ -84,25 +97,104 @@ class ExperimentListWidget(QWidget):
         self.view_button = QPushButton()
         self.delete_button = QPushButton("Delete Exp")
         self.delete_button.clicked.connect(self.delete_selected)
+        self.archive_button = QPushButton("Archive Exp")
+        self.archive_button.clicked.connect(self.archive_selected)
         self.group_button = QPushButton("Group")
         self.group_button.clicked.connect(self.edit_groups)
         btn_box.layout.addWidget(self.view_button)
         btn_box.layout.addWidget(self.delete_button)
+        btn_box.layout.addWidget(self.archive_button)
         btn_box.layout.addWidget(self.group_button)
         self.layout.addWidget(btn_box)
         self.view_button.clicked.connect(self.view_or_compare_exp)
+
+        # rows are shown as they arrive: experiments grouped by their base id
+        self.query_id = 0
+        self.base_items = {}
+
+        # statuses and groups written to are updated in place, every couple
+        # of seconds at most
+        self.changed = set()
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.setInterval(2000)
+        self.change_timer.timeout.connect(self.apply_changes)
+        ChangeNotifier.instance().changed.connect(self.experiment_changed)
+
         self.refresh()
 
     def refresh(self):
-        self.query_changed(0)
+        if CONFIG.mirror:
+            self.set_status("Syncing local mirror...")
+            DBSync(self.mirror_synced).start()
+        else:
+            self.query_changed(0)
         self.exp_selection_changed()
 
+    def mirror_synced(self, counts):
+        self.set_status(f"Synced {sum(counts.values())} rows")
+        self.query_changed(0)
+
+    def experiment_changed(self, change):
+        if change.table in ("STATUS", "EXPGROUPS", "DELETIONS"):
+            self.changed.add((change.expid, change.table))
+            if not self.change_timer.isActive():
+                self.change_timer.start()
+
+    def apply_changes(self):
+        changed, self.changed = self.changed, set()
+        # deletions are logged along with removals from groups: an experiment
+        # without a status any more was deleted
+        expids = sorted({e for e, t in changed if t != "EXPGROUPS"})
+        groups_changed = any(t != "STATUS" for _, t in changed)
+        if CONFIG.mirror:
+            DBSync(lambda _: self.refresh_changed(expids, groups_changed)).start()
+        else:
+            self.refresh_changed(expids, groups_changed)
+
+    def refresh_changed(self, expids, groups_changed):
+        if expids:
+            placeholders = ", ".join(["%s"] * len(expids))
+            DBQuery(
+                f"SELECT EXPID, STATUS FROM STATUS WHERE EXPID IN ({placeholders});",
+                lambda rows: self.update_statuses(expids, rows),
+                args=expids,
+                local=True,
+            ).start()
+        if groups_changed:
+            self.refresh_groups()
+
+    def update_statuses(self, expids, rows):
+        statuses = dict(rows)
+        self.remove_expids_from_table([e for e in expids if e not in statuses])
+        shown = set()
+        for i in range(self.experiments_view.topLevelItemCount()):
+            tli = self.experiments_view.topLevelItem(i)
+            for j in range(tli.childCount()):
+                ci = tli.child(j)
+                expid = ci.data(0, Qt.UserRole)[0]
+                shown.add(expid)
+                if expid in statuses:
+                    ci.setText(1, statuses[expid])
+            all_status = {tli.child(j).text(1) for j in range(tli.childCount())}
+            tli.setText(1, ", ".join(sorted(all_status)))
+        new = set(statuses) - shown
+        if new:
+            self.set_status(f"{len(new)} unlisted experiments changed, refresh to see them")
+
     def edit_groups(self):
         expids = self.get_selected_experiments()
         dia = GroupEditDialog(self, expids)
-        dia.groups_changed.connect(self.refresh_groups)
+        dia.groups_changed.connect(self.groups_edited)
         dia.show()
 
+    def groups_edited(self):
+        # the edits went to the database: bring the mirror up to date first
+        if CONFIG.mirror:
+            DBSync(lambda _: self.refresh_groups()).start()
+        else:
+            self.refresh_groups()
+
     def get_selected_experiments(self) -> List[str]:
         selection = self.experiments_view.selectedItems()
         expids = []
@@ -116,17 +208,41 @@ class ExperimentListWidget(QWidget):
     def delete_selected(self):
         exp_ids = self.get_selected_experiments()
         DBMethod(
-            Database.delete_experiment,
-            *[(e,) for e in exp_ids],
-            slot=self.remove_expid_from_table,
+            Database.delete_experiments,
+            (exp_ids,),
+            slot=self.remove_expids_from_table,
         ).start()
 
-    def remove_expid_from_table(self, expid):
-        raise NotImplementedError
-        items = self.experiments_view.findItems(expid, Qt.MatchFlag.MatchExactly & 1)
-        rows = set(i.row() for i in items)
-        assert len(rows) == 1
-        self.table_experiments.removeRow(list(rows)[0])
+    def archive_selected(self):
+        exp_ids = self.get_selected_experiments()
+        dest = datetime.now().strftime("archive/%Y%m%d_%H%M%S")
+        DBMethod(
+            Database.archive_experiments,
+            (exp_ids, dest),
+            slot=lambda path: self.experiments_archived(exp_ids, path),
+        ).start()
+
+    def experiments_archived(self, expids, path):
+        self.remove_expids_from_table(expids)
+        self.set_status(f"Archived {len(expids)} experiments to {path}")
+
+    def remove_expids_from_table(self, expids):
+        expids = set(expids)
+        for i in reversed(range(self.experiments_view.topLevelItemCount())):
+            tli = self.experiments_view.topLevelItem(i)
+            for j in reversed(range(tli.childCount())):
+                if tli.child(j).data(0, Qt.UserRole)[0] in expids:
+                    tli.removeChild(tli.child(j))
+            remaining = [e for e in tli.data(0, Qt.UserRole) if e not in expids]
+            if not remaining:
+                self.experiments_view.takeTopLevelItem(i)
+                self.base_items = {
+                    k: v for k, v in self.base_items.items() if v is not tli
+                }
+            else:
+                base_expid = tli.text(0).rsplit("x", 1)[0]
+                tli.setText(0, f"{base_expid}x{len(remaining)}")
+                tli.setData(0, Qt.UserRole, remaining)
 
     def exp_selection_changed(self):
         exps = self.get_selected_experiments()
@@ -138,11 +254,13 @@ class ExperimentListWidget(QWidget):
             self.view_button.setEnabled(True)
             self.group_button.setEnabled(True)
             self.delete_button.setEnabled(True)
+            self.archive_button.setEnabled(True)
         else:
             ttl = "No experiment selected"
             self.view_button.setEnabled(False)
             self.group_button.setEnabled(False)
             self.delete_button.setEnabled(False)
+            self.archive_button.setEnabled(False)
         self.view_button.setText(ttl)
 
     def view_or_compare_exp(self):
@@ -152,74 +270,52 @@ class ExperimentListWidget(QWidget):
         else:
             print("No experiments")
 
-    def run_query(self, query: Union[str, sql.Composable]):
+    def run_query(self, query: str, args=None):
         self.experiments_view.clear()
+        self.base_items = {}
         self.set_status("Querying database...")
         self.set_progress(10)
 
-        query = DBQuery(query)
-        query.results_returned.connect(self.display_experiments)
+        # chunks still coming from an earlier query are dropped
+        self.query_id += 1
+        query_id = self.query_id
+        query = DBQueryChunks(query, args=args, local=True)
+        query.chunk_returned.connect(
+            lambda rows: self.display_experiments(rows, query_id)
+        )
+        query.finished.connect(lambda: self.experiments_loaded(query_id))
         query.start()
 
-    @staticmethod
-    def parse_sql_from_search(sq: str) -> sql.Literal:
-        parts = sq.split(" ")
-        condition = sql.SQL("")
-
-        for i, part in enumerate(parts):
-            if part.startswith("!"):
-                part = part[1:]
-                negative = True
-            else:
-                negative = False
-            term = sql.Literal(f"%{part}%")
-            c = sql.SQL(
-                " (STATUS.EXPID IN (SELECT EXPID FROM EXPGROUPS WHERE GROUPNAME LIKE {term}) "
-                "OR STATUS.EXPID LIKE {term}"
-                "OR STATUS.STATUS LIKE {term}) "
-            )
-            if i:
-                condition += sql.SQL(" AND ")
-            if negative:
-                condition += sql.SQL(" NOT ")
-            condition += c.format(term=term)
-
-        return condition
-
-    def search(self, search_query: str):
-        query = sql.SQL("SELECT * FROM STATUS WHERE {condition} ORDER BY EXPID DESC;")
-        condition = self.parse_sql_from_search(search_query)
-        self.run_query(query.format(condition=condition))
+    def search(self, text: str):
+        self.run_query(*search_query(text, self.SEARCH_LIMIT))
 
     def query_changed(self, _: int):
         self.run_query(self.query_selector.currentData())
 
-    def display_experiments(self, rows):
-        FOLD_RE = re.compile(r"(.*)_(fold_?\d+|final|mean)")
-        exps = {}
+    def display_experiments(self, rows, query_id):
+        if query_id != self.query_id:
+            return
         for (expid, status) in rows:
-            m = FOLD_RE.match(expid)
-            if m:
-                base_expid = m.group(1)
-                if base_expid not in exps:
-                    exps[base_expid] = []
-                exps[base_expid].append((expid, status))
-            else:
-                exps[expid] = [(expid, status)]
-
-        n = len(exps)
-        if n:
-            for i, (base_expid, data) in enumerate(exps.items()):
-                all_status = set([s for _, s in data])
-                all_status = ", ".join(sorted(all_status))
-                wi = QTreeWidgetItem([f"{base_expid}x{len(data)}", all_status])
-                wi.setData(0, Qt.UserRole, [e for e, _ in data])
+            m = self.FOLD_RE.match(expid)
+            base_expid = m.group(1) if m else expid
+            wi = self.base_items.get(base_expid)
+            if wi is None:
+                wi = self.base_items[base_expid] = QTreeWidgetItem()
+                wi.setData(0, Qt.UserRole, [])
                 self.experiments_view.addTopLevelItem(wi)
-                for (expid, status) in data:
-                    cwi = QTreeWidgetItem([expid, status])
-                    cwi.setData(0, Qt.UserRole, [expid])
-                    wi.addChild(cwi)
-        else:
+            expids = wi.data(0, Qt.UserRole) + [expid]
+            wi.setData(0, Qt.UserRole, expids)
+            wi.setText(0, f"{base_expid}x{len(expids)}")
+            cwi = QTreeWidgetItem([expid, status])
+            cwi.setData(0, Qt.UserRole, [expid])
+            wi.addChild(cwi)
+            all_status = {wi.child(j).text(1) for j in range(wi.childCount())}
+            wi.setText(1, ", ".join(sorted(all_status)))
+
+    def experiments_loaded(self, query_id):
+        if query_id != self.query_id:
+            return
+        if not self.base_items:
             self.set_status("No experiments found!")
 
         self.set_progress(100)
@@ -227,15 +323,21 @@ class ExperimentListWidget(QWidget):
         self.refresh_groups()
 
     def refresh_groups(self):
-        DBQuery("SELECT * FROM EXPGROUPS;", self.display_groups).start()
-
-    def display_groups(self, rv):
         groups_by_exp = {}
-        for e, g in rv:
-            if e not in groups_by_exp:
-                groups_by_exp[e] = []
-            groups_by_exp[e].append(g)
 
+        def add_groups(rows):
+            for e, g in rows:
+                if e not in groups_by_exp:
+                    groups_by_exp[e] = []
+                groups_by_exp[e].append(g)
+
+        query = DBQueryChunks(
+            "SELECT EXPID, GROUPNAME FROM EXPGROUPS;", add_groups, local=True
+        )
+        query.finished.connect(lambda: self.display_groups(groups_by_exp))
+        query.start()
+
+    def display_groups(self, groups_by_exp):
         for i in range(self.experiments_view.topLevelItemCount()):
             tli = self.experiments_view.topLevelItem(i)
             tli_groups = set()
@@ -1,14 +1,12 @@
-from collections import defaultdict
 import os.path
 
 from PySide6.QtWidgets import QPushButton, QVBoxLayout, QFileDialog, QMessageBox
 
-import psycopg2.sql as sql
 import numpy as np
 from openpyxl import Workbook
 
 from .view_base import BaseExpView
-from ..db_iop import DBQuery, DBExpDetails, DBExpQualResults
+from ..db_iop import DBExpDetails, DBExpMetricsMany, DBExpQualResults
 
 
 class ExportData(BaseExpView):
@@ -38,18 +36,8 @@ class ExportData(BaseExpView):
     
     def get_metrics(self):
         self.data = {}
-        q = sql.SQL("SELECT * FROM METRICS WHERE {condition};")
-        condition = sql.SQL("")
-        for i, expid in enumerate(self.expids):
-            expid = sql.Literal(expid)
-            if i:
-                condition += sql.SQL(" OR ")
-            condition += sql.SQL(" EXPID={e} ").format(e=expid)
-            # fewer rows return, but is slower!
-            # condition += sql.SQL(
-            #     "((EXPID, EPOCH) IN (SELECT EXPID, max(EPOCH) FROM METRICS WHERE EXPID={e} GROUP BY EXPID))"
-            # ).format(e=expid)
-        DBQuery(q.format(condition=condition), self.metrics_returned).start()
+        # latest metrics and groups of every experiment in one go
+        DBExpMetricsMany(list(self.expids), self.metrics_returned).start()
     
     def get_expdetails_and_qualres_then_metrics(self):
         if self.expids_to_get:
@@ -146,29 +134,13 @@ class ExportData(BaseExpView):
         else:
             self.get_metrics()
 
-    def metrics_returned(self, rows):
-        data_by_exp_epoch = defaultdict(lambda: defaultdict(dict))
-        for expid, epoch, kind, value in rows:
-            data_by_exp_epoch[expid][epoch][kind] = value
-
-        latest_data_by_exp = {}
-        for expid, epoch_data in data_by_exp_epoch.items():
-            latest_data = epoch_data[sorted(epoch_data)[-1]]
-            latest_data_by_exp[expid] = latest_data
-
-        self.data = latest_data_by_exp
-
-        self.get_groups()
-
-    def get_groups(self):
-        q = sql.SQL("SELECT * FROM EXPGROUPS WHERE {condition};")
-        condition = sql.SQL("")
-        for i, expid in enumerate(self.expids):
-            expid = sql.Literal(expid)
-            if i:
-                condition += sql.SQL(" OR ")
-            condition += sql.SQL(" EXPID={e} ").format(e=expid)
-        DBQuery(q.format(condition=condition), self.groups_returned).start()
+    def metrics_returned(self, rv):
+        self.data = {
+            expid: metrics['data'] for expid, metrics in rv['metrics'].items() if metrics
+        }
+        self.groups_returned(
+            [(expid, group) for expid, groups in rv['groups'].items() for group in groups]
+        )
 
     def groups_returned(self, rows):
         primary_groups_by_exp = {}
@@ -11,7 +11,7 @@ from PySide6.QtCore import Qt
 import numpy as np
 
 from ..plot_widget import PlotWidget
-from ..db_iop import DBExpDetails
+from ..db_iop import DBExpDetailsMany
 from ..util import is_dark_theme
 from .view_base import BaseExpView
 
@@ -55,14 +55,17 @@ class ExpLossAndLRView(BaseExpView):
         self.lr_ax = self.plot.twax
         self.layout.addWidget(self.plot)
 
-        self.refresh()
         self.i = 0
+        self.refresh()
 
     def refresh(self):
         self.plot.clear()
-        self.i = 0
-        for expid in self.expids:
-            DBExpDetails(expid, self.details_returned).start()
+        DBExpDetailsMany(self.expids, self.all_details_returned).start()
+
+    def all_details_returned(self, details: dict):
+        for d in details.values():
+            self.details_returned(d)
+        self.replot()
 
     def details_returned(self, d: dict):
 
@@ -102,11 +105,6 @@ class ExpLossAndLRView(BaseExpView):
             lr_v=lr_values,
         )
 
-        self.i += 1
-
-        if self.i == len(self.expids):
-            self.replot()
-
     def replot(self):
         self.i = 0.0
         self.plot.clear()
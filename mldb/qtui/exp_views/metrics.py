@@ -14,7 +14,7 @@ from PySide6.QtWidgets import (
 import numpy as np
 from sklearn.manifold import TSNE
 
-from ..db_iop import DBExpMetrics, DBQuery
+from ..db_iop import DBExpMetricsMany
 from ..plot_widget import PlotWidget
 from .view_base import BaseExpView
 
@@ -32,8 +32,6 @@ def wrap(s: str) -> str:
 
 
 class MetricsView(BaseExpView):
-    GROUP_QUERY = "SELECT * FROM EXPGROUPS WHERE EXPID='{}';"
-
     def __init__(self, *expids: str):
         super().__init__(*expids)
         self.layout = QVBoxLayout(self)
@@ -74,20 +72,25 @@ class MetricsView(BaseExpView):
         self.metrics_by_exp = dict()
         self.groupings_by_exp = {e: [] for e in self.expids}
         self.exps_by_group = {}
-        self.readiness = 0
 
         self.refresh()
 
     def refresh(self):
-        self.readiness = -len(self.expids)
-        for expid in self.expids:
-            DBExpMetrics(expid, self.metrics_returned).start()
+        DBExpMetricsMany(self.expids, self.all_returned).start()
 
-    def metrics_returned(self, d):
-        if not d:
-            self.readiness += 1
-            return
+    def all_returned(self, d):
+        for metrics in d["metrics"].values():
+            self.metrics_returned(metrics)
+        for expid, groups in d["groups"].items():
+            self.grouping_returned(expid, groups)
 
+        self.error_parts_selector.addItems(sorted(self.group_parts_set))
+        self.error_parts_selector.currentIndexChanged.connect(self.plot_errors)
+        self.corr_parts_selector.addItems(sorted(self.group_parts_set))
+        self.corr_parts_selector.currentIndexChanged.connect(self.plot_corrs)
+        self.plot_metrics()
+
+    def metrics_returned(self, d):
         expid = d["expid"]
 
         for m, _ in d["data"].items():
@@ -100,7 +103,6 @@ class MetricsView(BaseExpView):
                 self.corrs.add(m)
 
         self.metrics_by_exp[expid] = d["data"]
-        DBQuery(self.GROUP_QUERY.format(expid), self.grouping_returned).start()
 
     def extract_data_from_groups(self, groups):
         for group in groups:
@@ -128,25 +130,12 @@ class MetricsView(BaseExpView):
 
                 self.group_parts_data[group][k] = v
 
-    def grouping_returned(self, rows):
-        try:
-            expid = rows[0][0]
-            groups = [row[1] for row in rows]
-
-            self.extract_data_from_groups(groups)
-
-            self.groupings_by_exp[expid] = groups
-        except Exception as e:
-            print(type(e), e, rows)
-
-        self.readiness += 1
-
-        if self.readiness >= 0:
-            self.error_parts_selector.addItems(sorted(self.group_parts_set))
-            self.error_parts_selector.currentIndexChanged.connect(self.plot_errors)
-            self.corr_parts_selector.addItems(sorted(self.group_parts_set))
-            self.corr_parts_selector.currentIndexChanged.connect(self.plot_corrs)
-            self.plot_metrics()
+    def grouping_returned(self, expid, groups):
+        # experiments without metrics have nothing to plot
+        if not groups or expid not in self.metrics_by_exp:
+            return
+        self.extract_data_from_groups(groups)
+        self.groupings_by_exp[expid] = groups
 
     def plot_metrics(self):
         self.sort_exps_by_group()
@@ -67,13 +67,17 @@ class ModelListWidget(QWidget):
             rows = db.cursor.fetchall()
             self.set_progress(10)
 
+            expids = [expid for expid, _ in rows]
+            hparams_by_exp = db.get_hyperparams_many(expids)
+            metrics_by_exp = db.get_latest_metrics_many(expids)
+
             data = []
             for expid, status in rows:
                 datum = {}
-                hparams = db.get_hyperparams(expid)
+                hparams = hparams_by_exp[expid]
                 if hparams and "error" not in hparams:
                     datum.update(hparams)
-                metrics = db.get_latest_metrics(expid)
+                metrics = metrics_by_exp.get(expid)
                 if metrics and "error" not in metrics:
                     datum.update(metrics["data"])
                 # datum['expid'] = expid  # dunno if I want to include this?
@@ -31,6 +31,12 @@ function display_about()
 
 function display_result(results_object)
 {
+    if (results_object.kind === "unchanged") {
+        // nothing new since the last check: keep what is shown
+        schedule_refresh(results_object);
+        return;
+    }
+
     hide_all();
     if (results_object.hasOwnProperty("error")) {
         display_error(results_object);
@@ -42,6 +48,11 @@ function display_result(results_object)
         display_exp_details(results_object);
     }
 
+    schedule_refresh(results_object);
+}
+
+function schedule_refresh(results_object)
+{
     if (results_object.hasOwnProperty("refresh")) {
         var query = results_object.refresh.query;
         var timeout = results_object.refresh.period;
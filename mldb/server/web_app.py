@@ -1,21 +1,71 @@
 from typing import Optional
+from base64 import b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+import itertools
 import os
-from http.server import SimpleHTTPRequestHandler, HTTPServer
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 import simplejson as json
 
-from ..database import Database
+from ..config import CONFIG
+from ..database import Database, ChangeListener
+from ..database.schema import FAILED_STATUSES
 
 SERVER_SOURCE_DIR = os.path.join(os.path.dirname(__file__), "site")
 
 
 class MLDB_Handler(SimpleHTTPRequestHandler):
 
-    db: Database = None
+    # shown on the page; set when the server starts
+    conninfo: str = ""
+    # set by the change listener each time an experiment is written to, so
+    # pages can check for changes without querying the database
+    versions: dict = dict()
+    # every experiment's version is at least this: raised when the listener
+    # reconnects, as the changes missed meanwhile could be to any experiment
+    min_version: int = 0
+    _next_version = itertools.count(1)
+    REFRESH_PERIOD = 2_000
+    # details are sent again after this many seconds even if no change was
+    # heard of, in case a notification was lost
+    FULL_REFRESH_PERIOD = 60
+
+    # statuses of the experiments listed by each table (None: any), which are
+    # also served a page at a time as JSON from /api/<table>
+    TABLES = dict(
+        status=None,
+        running=["TRAINING"],
+        completed=["COMPLETE"],
+        failed=FAILED_STATUSES,
+    )
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 1000
+
+    _db: Optional[Database] = None
+
+    @property
+    def db(self) -> Database:
+        """This request's connection, borrowed from the pool on first use, so
+        requests for static files and unchanged experiments don't take one."""
+        if self._db is None:
+            self._db = Database(cached=True)
+        return self._db
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            if self._db is not None:
+                db, self._db = self._db, None
+                db.close()
 
     def run_query(self, query: dict) -> dict:
         if query["show"] == "details":
             return self.get_experiment_details(query["expid"])
+        elif query["show"] == "changes":
+            return self.get_changes(query)
         elif query["kind"] == "all":
             return self.get_status_table(recent=query.get("recent", False))
         elif query["kind"] == "completed":
@@ -30,6 +80,10 @@ class MLDB_Handler(SimpleHTTPRequestHandler):
             return dict(error=True, why=f"unhandled query, unknown kind: {query}")
 
     def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path.startswith("/api/"):
+            self.do_api(url.path, url.query)
+            return
 
         if self.path in {"/", "/index.html"}:
             path = self.path + "?"
@@ -65,7 +119,7 @@ class MLDB_Handler(SimpleHTTPRequestHandler):
                 index_html = f.read()
 
             index_html = index_html.replace("//SCRIPT GOES HERE//", js).replace(
-                "<!--CONNINFO-->", repr(self.db)
+                "<!--CONNINFO-->", self.conninfo
             )
 
             self.wfile.write(index_html.encode())
@@ -85,16 +139,92 @@ class MLDB_Handler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(result, ignore_nan=True).encode())
 
-    def get_table(self, query, title, recent: bool) -> dict:
-        _ = self.db
-        self.db.cursor.execute(query)
-        rows = self.db.cursor.fetchall()
-        if rows:
-            if recent:
-                rows = rows[-10:]
-            experiments, statuses = zip(*rows)
+    def send_json(self, obj: dict, code: int = 200):
+        self.send_response(code)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(obj, ignore_nan=True).encode())
+
+    @staticmethod
+    def encode_cursor(expid: str) -> str:
+        return urlsafe_b64encode(expid.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> str:
+        return b64decode(cursor, altchars=b"-_", validate=True).decode()
+
+    def do_api(self, path: str, query: str):
+        """Serve a page of a table as JSON, for GET /api/<table>.
+
+        Experiments come newest first ("order=oldest" for the reverse),
+        "limit" at a time, optionally only those in some of the table's
+        statuses ("status", comma separated) or in a "group". The response's
+        `next` is the URL of the next page (the same query with a "cursor"),
+        null after the last one."""
+        table = path[len("/api/") :].strip("/")
+        if table not in self.TABLES:
+            self.send_json(dict(error=True, why=f"unknown table: {table}"), 404)
+            return
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        try:
+            limit = int(params.get("limit", self.API_PAGE_SIZE))
+            if not 0 < limit <= self.API_MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be 1 to {self.API_MAX_PAGE_SIZE}")
+            order = params.get("order", "newest")
+            if order not in ("newest", "oldest"):
+                raise ValueError('order must be "newest" or "oldest"')
+            after = params.get("cursor")
+            if after is not None:
+                after = self.decode_cursor(after)
+        except ValueError as e:
+            self.send_json(dict(error=True, why=f"bad query: {e}"), 400)
+            return
+
+        statuses = self.TABLES[table]
+        if "status" in params:
+            wanted = params["status"].upper().split(",")
+            statuses = [s for s in wanted if statuses is None or s in statuses]
+
+        # one more than a page, to tell whether there is another
+        rows = []
+        if statuses is None or statuses:
+            rows = self.db.get_status_page(
+                statuses,
+                params.get("group"),
+                after,
+                limit + 1,
+                newest_first=order == "newest",
+            )
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            params["cursor"] = self.encode_cursor(rows[-1][0])
+            next_url = f"{path}?{urlencode(params)}"
+        self.send_json(
+            dict(
+                table=table,
+                experiments=[dict(expid=e, status=s) for e, s in rows],
+                next=next_url,
+            )
+        )
+
+    def get_table(self, table_statuses, title, recent: bool) -> dict:
+        if recent:
+            # the latest few, shown in the same order as the whole table
+            rows = self.db.get_status_page(table_statuses, limit=10)[::-1]
+        elif table_statuses is None:
+            rows = self.db.iter_query(
+                "SELECT EXPID, STATUS FROM STATUS ORDER BY EXPID;"
+            )
         else:
-            experiments, statuses = [], []
+            rows = self.db.iter_query(
+                "SELECT EXPID, STATUS FROM STATUS WHERE STATUS = ANY(%s) ORDER BY EXPID;",
+                (table_statuses,),
+            )
+        experiments, statuses = [], []
+        for expid, status in rows:
+            experiments.append(expid)
+            statuses.append(status)
 
         result = dict(
             title=("Most Recent " if recent else "") + title,
@@ -106,30 +236,20 @@ class MLDB_Handler(SimpleHTTPRequestHandler):
         return result
 
     def get_failed_experiments_table(self, recent: bool) -> dict:
-        return self.get_table(
-            "SELECT * FROM status WHERE status.status='ERROR' or status.status='CANCELLED';",
-            "Running Experiments",
-            recent,
-        )
+        return self.get_table(self.TABLES["failed"], "Failed Experiments", recent)
 
     def get_running_experiments_table(self, recent: bool) -> dict:
-        return self.get_table(
-            "SELECT * FROM status WHERE status.status='TRAINING';",
-            "Running Experiments",
-            recent,
-        )
+        return self.get_table(self.TABLES["running"], "Running Experiments", recent)
 
     def get_completed_experiments_table(self, recent: bool) -> dict:
-        return self.get_table(
-            "SELECT * FROM status WHERE status.status='COMPLETE';",
-            "Completed Experiments",
-            recent,
-        )
+        return self.get_table(self.TABLES["completed"], "Completed Experiments", recent)
 
     def get_status_table(self, recent: bool) -> dict:
-        return self.get_table("SELECT * FROM status;", "Experiments Status", recent)
+        return self.get_table(self.TABLES["status"], "Experiments Status", recent)
 
     def get_experiment_details(self, expid) -> dict:
+        # read before anything else, so a change made meanwhile shows next time
+        version = self.version_of(expid)
         details = self.db.get_experiment_details(expid)
         if "error" in details:
             return details
@@ -172,27 +292,89 @@ class MLDB_Handler(SimpleHTTPRequestHandler):
             metrics=metrics,
         )
 
-        # If is still training, refresh data every 30 seconds
+        # If is still training, check for changes every couple of seconds
         if "status" in details:
             if details["status"] == "TRAINING":
                 result["refresh"] = dict(
-                    query=dict(show="details", expid=expid), period=30_000
+                    query=dict(
+                        show="changes",
+                        expid=expid,
+                        version=version,
+                        fetched=time.time(),
+                    ),
+                    period=self.REFRESH_PERIOD,
                 )
 
         return result
 
+    def get_changes(self, query: dict) -> dict:
+        """The experiment's details if it changed since `query["version"]`, or
+        if they were fetched over FULL_REFRESH_PERIOD seconds ago."""
+        changed = self.version_of(query["expid"]) != int(query["version"])
+        fetched = float(query.get("fetched", 0))
+        if changed or time.time() - fetched >= self.FULL_REFRESH_PERIOD:
+            return self.get_experiment_details(query["expid"])
+        return dict(
+            kind="unchanged", refresh=dict(query=query, period=self.REFRESH_PERIOD)
+        )
+
+    @classmethod
+    def version_of(cls, expid: str) -> int:
+        return max(cls.versions.get(expid, 0), cls.min_version)
 
-def run_server(hostname: str, port: int):
-    os.chdir(SERVER_SOURCE_DIR)
-    with Database() as MLDB_Handler.db:
-        print(f'Connected to database "{MLDB_Handler.db}"')
-        server = HTTPServer((hostname, port), MLDB_Handler)
-        print(f"Server started: http://{hostname}:{port}")
+    @classmethod
+    def experiment_changed(cls, change):
+        cls.versions[change.expid] = next(cls._next_version)
 
-        try:
-            server.serve_forever()
-        except KeyboardInterrupt:
-            pass
-        finally:
-            server.server_close()
-            print("Server stopped.")
+    @classmethod
+    def changes_missed(cls):
+        cls.min_version = next(cls._next_version)
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """Handles each request on one of `workers` threads; requests arriving
+    while all are busy wait their turn."""
+
+    def __init__(self, address, handler, workers: int):
+        super().__init__(address, handler)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="mldb-web")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+
+
+def run_server(hostname: str, port: int, workers: int = None):
+    """Serve the web app, handling up to `workers` requests at once (default:
+    the config's "server_workers", or else its "pool_max"), each with its own
+    connection from the pool."""
+    workers = workers or CONFIG.server_workers or CONFIG.pool_max
+    os.chdir(SERVER_SOURCE_DIR)
+    # checks the database can be reached (and its schema) before serving
+    with Database() as db:
+        MLDB_Handler.conninfo = repr(db)
+    print(f'Connected to database "{MLDB_Handler.conninfo}"')
+    if workers > CONFIG.pool_max:
+        print(
+            f"mldb: {workers} workers share at most {CONFIG.pool_max} connections "
+            '(config "pool_max"), the rest wait for one'
+        )
+    listener = ChangeListener(
+        CONFIG,
+        MLDB_Handler.experiment_changed,
+        on_missed=MLDB_Handler.changes_missed,
+    ).start()
+    server = PooledHTTPServer((hostname, port), MLDB_Handler, workers)
+    print(f"Server started: http://{hostname}:{port} ({workers} workers)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        listener.stop()
+        print("Server stopped.")
@@ -17,5 +17,9 @@ setup(
         "scipy",
         "scikit-learn",
     ],
-    extras_require=dict(test=["pytest", "torch"], qtui="PySide6"),
+    extras_require=dict(
+        test=["pytest", "torch", "psycopg[binary]>=3.1", "psycopg_pool"],
+        qtui="PySide6",
+        asyncio=["psycopg[binary]>=3.1", "psycopg_pool"],
+    ),
 )
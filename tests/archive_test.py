@@ -0,0 +1,70 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+from mldb.database import Database
+from mldb.database.archive import (
+    export_query,
+    load_table,
+    restore_commands,
+    rows_to_csv,
+    save_table,
+)
+
+
+def test_table_round_trip(tmp_path):
+    rows = [
+        ("exp_1", 0, "plot", b"\x00\x01\x00"),
+        ("exp_1", 1, "plot", b""),
+        ("exp_2", 0, "é", b"\xff"),
+    ]
+    save_table(str(tmp_path), "QUALITATIVEARRAYS", rows)
+    assert load_table(str(tmp_path), "QUALITATIVEARRAYS") == rows
+
+    save_table(str(tmp_path), "LOSS", [])
+    assert load_table(str(tmp_path), "LOSS") == []
+
+
+def test_rows_to_csv():
+    rows = [("exp", "", 3, b"\x0a\x0b")]
+    data = rows_to_csv("QUALITATIVEARRAYS", rows).getvalue()
+    # empty strings are quoted, or COPY would read them as NULL
+    assert data.strip() == '"exp","",3,"\\x0a0b"'
+    assert next(csv.reader([data])) == ["exp", "", "3", "\\x0a0b"]
+
+
+def test_queries_use_keys():
+    assert "WHERE EXPKEY = ANY(%s)" in export_query("STEPS")
+    assert "EXTRACT(EPOCH FROM WALLTIME)" in export_query("STEPS")
+    assert "WHERE EXPID = ANY(%s)" in export_query("STATUS")
+
+    staging, commands = restore_commands("LOSS")
+    assert commands[-1] == (
+        f"INSERT INTO LOSS (EXPKEY, KINDKEY, EPOCH, VALUE) SELECT EXPKEY, KINDKEY, EPOCH, VALUE "
+        f"FROM {staging} JOIN EXPERIMENTS USING (EXPID) JOIN KINDS USING (KIND);"
+    )
+
+
+def test_restore_refuses_experiments_with_rows_left():
+    expid = f"archive_test_{os.getpid()}"
+    with Database() as db:
+        dest = f"archive_test_{os.getpid()}"
+        try:
+            db.set_exp_status(expid, "COMPLETE")
+            db.add_qualitative_result_json(expid, 0, "plot", "{}")
+            db.archive_experiments([expid], dest)
+
+            # rows of the experiment, but no status
+            db.add_qualitative_result_json(expid, 0, "plot", "{}")
+            with pytest.raises(ValueError):
+                db.restore_experiments(dest)
+
+            db.delete_experiments([expid])
+            assert db.restore_experiments(dest) == [expid]
+            assert db.get_status(expid) == "COMPLETE"
+            assert len(db.get_qualitative_result(expid, "plot")["data"]) == 1
+        finally:
+            db.delete_experiments([expid])
+            shutil.rmtree(db.desanitise_path(dest), ignore_errors=True)
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("psycopg_pool")
+
+from mldb.database import AsyncDatabase
+from mldb.database import database
+from mldb.database.exception import SchemaVersionError
+
+
+def test_async_round_trip():
+    expid = f"async_test_{os.getpid()}"
+
+    async def run():
+        async with AsyncDatabase() as db:
+            await db.set_exp_status(expid, "TRAINING")
+            await asyncio.gather(
+                db.add_loss_value(expid, "train", 0, 1.0),
+                db.add_loss_value(expid, "train", 1, 0.5),
+                db.add_lr_value(expid, 0, 0.1),
+            )
+            return await asyncio.gather(
+                db.get_experiment_details(expid), db.get_status(expid)
+            )
+
+    try:
+        details, status = asyncio.run(run())
+        assert status == "TRAINING"
+        assert details["expid"] == expid
+        assert details["losses"]["train"]["loss"] == [1.0, 0.5]
+    finally:
+        with database.Database() as db:
+            db.delete_experiments([expid])
+
+
+def test_open_checks_the_schema(monkeypatch):
+    monkeypatch.setattr(database, "get_version", lambda conn: 1)
+    db = AsyncDatabase()
+    with pytest.raises(SchemaVersionError):
+        asyncio.run(db.open())
+    assert db.pool.closed
+
+
+def test_async_reads_through_to_cold_storage():
+    expid = f"async_cold_test_{os.getpid()}"
+    with database.Database() as sync_db:
+        try:
+            sync_db.set_exp_status(expid, "COMPLETE")
+            for epoch in range(2):
+                sync_db.add_qualitative_result_json(expid, epoch, "plot", "{}")
+            sync_db.move_to_cold_storage(expid)
+            sync_db.add_qualitative_result_json(expid, 2, "plot", "{}")
+            expected = sync_db.get_qualitative_result(expid, "plot")
+
+            async def run():
+                async with AsyncDatabase() as db:
+                    return await asyncio.gather(
+                        db.get_qualitative_result(expid, "plot"),
+                        db.get_qualitative_plot_ids(expid),
+                    )
+
+            result, plot_ids = asyncio.run(run())
+            assert result == expected
+            assert len(result["data"]) == 3
+            assert plot_ids == ["plot"]
+        finally:
+            sync_db.delete_experiments([expid])
+
+
+def test_async_reads_during_moves_see_every_row_once():
+    expid = f"async_cold_race_test_{os.getpid()}"
+    with database.Database() as sync_db, database.Database() as mover:
+        try:
+            sync_db.set_exp_status(expid, "COMPLETE")
+            sync_db.add_qualitative_result_json(expid, 0, "plot", "{}")
+            done = threading.Event()
+
+            def move():
+                try:
+                    for i in range(20):
+                        mover.add_qualitative_result_json(expid, 1 + i, "plot", "{}")
+                        mover.move_to_cold_storage(expid)
+                finally:
+                    done.set()
+
+            async def run():
+                async with AsyncDatabase() as db:
+                    n_rows = 1
+                    while not done.is_set():
+                        data = (await db.get_qualitative_result(expid, "plot"))["data"]
+                        epochs = [d["epoch"] for d in data]
+                        assert len(set(epochs)) == len(epochs) >= n_rows
+                        n_rows = len(epochs)
+
+            thread = threading.Thread(target=move)
+            thread.start()
+            try:
+                asyncio.run(run())
+            finally:
+                thread.join()
+        finally:
+            sync_db.delete_experiments([expid])
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from mldb.database.background import BackgroundLogger
+
+
+class HeldLogger(BackgroundLogger):
+    """Keeps the calls it is given instead of writing them, once `release`
+    is set, so the queue can be filled up behind it."""
+
+    def __init__(self, **kwargs):
+        self.release = threading.Event()
+        self.calls = []
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch: list):
+        self.release.wait()
+        self.calls += batch
+        self.counters["written"] += len(batch)
+        self.counters["flushes"] += 1
+
+
+def epochs(logger) -> list:
+    return [args[2] for _, args, _ in logger.calls]
+
+
+def fill(logger, n: int):
+    """Queue calls for epochs 0 to n - 1, with the writer holding epoch 0."""
+    logger.add_loss_value("exp", "train", 0, 0.5)
+    deadline = time.monotonic() + 5
+    while logger.queue and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for epoch in range(1, n):
+        logger.add_loss_value("exp", "train", epoch, 0.5)
+
+
+@pytest.mark.parametrize(
+    "overflow, expected", [("drop_oldest", [0, 2, 3]), ("drop_newest", [0, 1, 2])]
+)
+def test_overflow_drops(overflow, expected):
+    logger = HeldLogger(max_queue=2, overflow=overflow)
+    fill(logger, 4)
+    assert len(logger.queue) == 2
+    logger.release.set()
+    logger.close()
+    assert epochs(logger) == expected
+    stats = logger.stats()
+    assert stats["enqueued"] == 4 and stats["dropped"] == 1 and stats["written"] == 3
+    assert stats["max_queue_depth"] == 2 and stats["queue_depth"] == 0
+
+
+def test_overflow_blocks_until_room():
+    logger = HeldLogger(max_queue=2, overflow="block")
+    fill(logger, 3)
+    blocked = threading.Thread(
+        target=logger.add_loss_value, args=("exp", "train", 3, 0.5)
+    )
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    logger.release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    logger.close()
+    assert epochs(logger) == [0, 1, 2, 3]
+    assert logger.stats()["dropped"] == 0
+
+
+def test_overflow_spills_in_order(tmp_path):
+    logger = HeldLogger(max_queue=2, overflow="spill", spill_dir=str(tmp_path))
+    fill(logger, 5)
+    assert logger.stats()["spilled"] == 2
+    logger.release.set()
+    logger.close()
+    assert epochs(logger) == [0, 1, 2, 3, 4]
+    assert not list(tmp_path.iterdir())
+
+
+def test_close_flushes_queue():
+    logger = HeldLogger(max_queue=100)
+    logger.release.set()
+    for epoch in range(10):
+        logger.add_loss_value("exp", "train", epoch, 0.5)
+    assert logger.flush(timeout=5)
+    logger.add_loss_value("exp", "train", 10, 0.5)
+    logger.close()
+    assert epochs(logger) == list(range(11))
+    assert logger.stats()["written"] == 11
+    with pytest.raises(RuntimeError):
+        logger.add_loss_value("exp", "train", 11, 0.5)
@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+
+from mldb.database import Database
+from mldb.database.buffer import WriteBuffer
+
+
+def test_buffer_flushes_at_size_limit():
+    flushed = []
+    buf = WriteBuffer(
+        lambda c, r: flushed.append((c, r)), max_rows=3, flush_interval=1e9
+    )
+
+    buf.add("A", (1,))
+    buf.add("B", (2,))
+    assert not flushed
+    assert len(buf) == 2
+
+    buf.add("A", (3,))
+    assert sorted(flushed) == [("A", [(1,), (3,)]), ("B", [(2,)])]
+    assert len(buf) == 0
+
+
+def test_buffer_flushes_on_interval_and_close():
+    flushed = []
+    buf = WriteBuffer(
+        lambda c, r: flushed.append((c, r)), max_rows=100, flush_interval=0.0
+    )
+    buf.add("A", (1,))
+    assert flushed == [("A", [(1,)])]
+
+    buf = WriteBuffer(
+        lambda c, r: flushed.append((c, r)), max_rows=100, flush_interval=1e9
+    )
+    buf.add("A", (2,))
+    buf.close()
+    assert flushed[-1] == ("A", [(2,)])
+
+
+def test_buffer_keeps_rows_when_flush_fails():
+    flushed, failing = [], {"B"}
+
+    def flush_fn(command, rows):
+        if command in failing:
+            raise RuntimeError("write failed")
+        flushed.append((command, list(rows)))
+
+    buf = WriteBuffer(flush_fn, max_rows=100, flush_interval=1e9)
+    buf.add("A", (1,))
+    buf.add("B", (2,))
+    buf.add("C", (3,))
+    with pytest.raises(RuntimeError):
+        buf.flush()
+    # A was written; B, and C after it, are still pending
+    assert flushed == [("A", [(1,)])]
+    assert len(buf) == 2
+
+    failing.clear()
+    buf.add("B", (4,))
+    buf.flush()
+    assert flushed[1:] == [("B", [(2,), (4,)]), ("C", [(3,)])]
+    assert len(buf) == 0
+
+
+def test_buffer_timer_flushes_quiet_writer_apart():
+    flushed, apart = [], []
+    buf = WriteBuffer(
+        lambda c, r: flushed.append((c, r)),
+        max_rows=100,
+        flush_interval=0.05,
+        flush_apart_fn=lambda c, r: apart.append((c, r)),
+    )
+    buf.add("A", (1,))
+    deadline = time.monotonic() + 5
+    while not apart and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert apart == [("A", [(1,)])] and not flushed
+    buf.close()
+
+
+def test_timer_flush_leaves_open_transaction_alone():
+    expid = f"buffer_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            db.set_exp_status(expid, "TRAINING")
+            # registering a kind commits: do it before the transaction starts
+            db.kind_key("train", create=True)
+            db.start_buffering(100, flush_interval=0.05)
+            db.cursor.execute(
+                "CREATE TEMP TABLE BUFFER_TEST (X INTEGER) ON COMMIT DROP;"
+            )
+            db.add_loss_value(expid, "train", 0, 0.5)
+            deadline = time.monotonic() + 5
+            while len(db.buffer) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert not len(db.buffer)
+            # the owner's transaction wasn't committed under it
+            db.cursor.execute("SELECT count(*) FROM BUFFER_TEST;")
+            db.conn.commit()
+            assert db.get_losses(expid)["train"]["epoch"] == [0]
+        finally:
+            db.stop_buffering()
+            db.delete_experiments([expid])
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import torch
+
+from mldb.database import Database
+
+
+def test_epoch_value_rows():
+    rows = Database.epoch_value_rows(
+        ("exp", "train"), np.arange(3), torch.tensor([0.5, 0.25, 0.125]), False
+    )
+    assert rows == [
+        ("exp", "train", 0, 0.5),
+        ("exp", "train", 1, 0.25),
+        ("exp", "train", 2, 0.125),
+    ]
+
+
+def test_epoch_value_rows_dedupes_keeping_last():
+    rows = Database.epoch_value_rows(("exp",), [1, 2, 1], [0.1, 0.2, 0.3], True)
+    assert rows == [("exp", 2, 0.2), ("exp", 1, 0.3)]
+
+
+def test_epoch_value_rows_length_mismatch():
+    with pytest.raises(ValueError):
+        Database.epoch_value_rows(("exp",), [1, 2], [0.1], False)
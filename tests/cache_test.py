@@ -0,0 +1,110 @@
+import math
+import os
+
+import numpy as np
+
+from mldb.database import Database
+from mldb.database.cache import ReadCache, sizeof
+from mldb.database.schema import FAILED_STATUSES
+
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ReadCache(max_bytes=3 * sizeof(np.zeros(100)))
+    for i in range(3):
+        cache.put(i, f"exp{i}", np.zeros(100))
+    assert cache.get(0)[0]
+
+    cache.put(3, "exp3", np.zeros(100))
+    assert cache.get(1) == (False, None)
+    assert all(cache.get(k)[0] for k in (0, 2, 3))
+    assert cache.stats()["evictions"] == 1
+
+    cache.put(4, "exp4", np.zeros(1000))
+    assert cache.get(4) == (False, None)
+
+
+def test_cache_expires_entries_with_ttl():
+    clock = Clock()
+    cache = ReadCache(max_bytes=10000, clock=clock)
+    cache.put("training", "a", [1.0], ttl=5.0)
+    cache.put("complete", "b", [2.0])
+
+    clock.t = 4.0
+    assert cache.get("training") == (True, [1.0])
+    clock.t = 5.0
+    assert cache.get("training") == (False, None)
+    assert cache.get("complete") == (True, [2.0])
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (2, 1, 1)
+    assert stats["entries"] == 1
+
+
+def test_cache_returns_copies_and_invalidates():
+    cache = ReadCache(max_bytes=10000)
+    cache.put(("get_losses", "a"), "a", dict(train=[1.0]))
+    cache.put(("get_lrs", "a"), "a", dict(lrs=[0.1]))
+    cache.put(("get_lrs", "b"), "b", dict(lrs=[0.2]))
+
+    _, value = cache.get(("get_losses", "a"))
+    value["train"].append(2.0)
+    assert cache.get(("get_losses", "a"))[1] == dict(train=[1.0])
+
+    cache.invalidate(["a"])
+    assert not cache.get(("get_losses", "a"))[0]
+    assert not cache.get(("get_lrs", "a"))[0]
+    assert cache.get(("get_lrs", "b"))[0]
+    assert cache.stats()["bytes"] == sizeof(dict(lrs=[0.2]))
+
+
+def test_writes_invalidate_cached_reads():
+    expid = f"cache_test_{os.getpid()}"
+    with Database(cached=True) as db:
+        try:
+            db.set_exp_status(expid, "COMPLETE")
+            db.add_metric_value(expid, "acc", 0, 0.5)
+            db.add_loss_values(expid, "train", [0, 1], [1.0, 0.9])
+            assert db.get_latest_metrics(expid)["data"] == dict(acc=0.5)
+            assert db.get_losses(expid)["train"]["loss"] == [1.0, 0.9]
+
+            db.add_metric_value(expid, "acc", 1, 0.6)
+            latest = db.get_latest_metrics(expid)
+            assert (latest["epoch"], latest["data"]) == (1, dict(acc=0.6))
+            db.add_loss_values(expid, "train", [1], [0.8], on_conflict="overwrite")
+            assert db.get_losses(expid)["train"]["loss"] == [1.0, 0.8]
+
+            # buffered rows: not cached while pending, and written before the
+            # status changes
+            db.set_exp_status(expid, "TRAINING")
+            with db.buffered(flush_interval=math.inf):
+                db.add_loss_value(expid, "train", 2, 0.7)
+                db.add_metric_value(expid, "acc", 2, 0.7)
+                assert db.get_losses(expid)["train"]["epoch"] == [0, 1]
+                db.set_exp_status(expid, "COMPLETE")
+                assert db.get_latest_metrics(expid)["epoch"] == 2
+                db.add_loss_value(expid, "train", 3, 0.6)
+            assert db.get_losses(expid)["train"]["epoch"] == [0, 1, 2, 3]
+        finally:
+            db.delete_experiments([expid])
+
+
+def test_failed_experiments_are_cached_as_finished():
+    expid = f"cache_test_failed_{os.getpid()}"
+    with Database(cached=True) as db:
+        try:
+            db.add_hyperparam(expid, "lr", "0.1")
+            for status in FAILED_STATUSES:
+                db.set_exp_status(expid, status)
+                assert db.get_hyperparams(expid) == dict(lr="0.1")
+                expires = [e[2] for e in db.cache.entries.values() if e[3] == expid]
+                assert expires == [None]
+        finally:
+            db.delete_experiments([expid])
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from psycopg2 import connect
+
+from mldb.config import CONFIG
+from mldb.database.changes import (
+    NOTIFYING_TABLES,
+    Change,
+    ChangeListener,
+    matches,
+    parse,
+)
+from mldb.database.migrations import notify_commands
+
+
+def test_parse_and_filter():
+    change = parse('{"expid" : "a", "table" : "loss", "epoch" : 3}')
+    assert change == Change("a", "LOSS", 3)
+    assert matches(change)
+    assert matches(change, expids={"a", "b"}, tables={"LOSS"})
+    assert not matches(change, expids={"b"})
+    assert not matches(change, tables={"METRICS", "STATUS"})
+    assert parse('{"expid": "a", "table": "status", "epoch": null}').epoch is None
+
+
+def test_notify_commands():
+    for table in NOTIFYING_TABLES:
+        function, *triggers = notify_commands(table)
+        assert f"MLDB_NOTIFY_{table}()" in function
+        assert len(triggers) == 4
+    assert "max(STEP)" in notify_commands("STEPS")[0]
+    assert "JOIN EXPERIMENTS" in notify_commands("LOSS")[0]
+    status = notify_commands("STATUS")[0]
+    assert "NULL::integer" in status and "JOIN" not in status
+
+
+def test_listener_reports_missed_changes_on_reconnect():
+    missed = threading.Event()
+    listener = ChangeListener(
+        CONFIG,
+        lambda change: None,
+        poll_interval=0.05,
+        retry_interval=0.05,
+        on_missed=missed.set,
+    ).start()
+    try:
+        deadline = time.monotonic() + 5
+        while listener.backend_pid is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        pid = listener.backend_pid
+        conn = connect(**CONFIG.as_dict())
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s);", (pid,))
+            assert cursor.fetchone()[0]
+        conn.close()
+        assert missed.wait(5)
+        assert listener.backend_pid != pid
+    finally:
+        listener.stop()
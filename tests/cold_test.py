@@ -0,0 +1,76 @@
+import os
+import threading
+
+import numpy as np
+
+from mldb.database import Database
+
+
+def test_moved_results_are_read_through():
+    expid = f"cold_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            db.set_exp_status(expid, "COMPLETE")
+            db.add_qualitative_metadata(expid, "plot", "scatter")
+            db.add_qualitative_result_json(expid, 0, "plot", '{"x": 1}')
+            db.add_qualitative_result_arrays(expid, 1, "plot", y=np.arange(3))
+            before = db.get_qualitative_result(expid, "plot")
+
+            assert expid in db.tier_qualitative_results(min_age_days=0)
+            for table in ["QUALITATIVERESULTS", "QUALITATIVEARRAYS"]:
+                db.cursor.execute(
+                    f"SELECT count(*) FROM {table} WHERE EXPKEY = %s;",
+                    (db.experiment_key(expid),),
+                )
+                assert db.cursor.fetchone()[0] == 0
+            # nothing left to move
+            assert expid not in db.tier_qualitative_results(min_age_days=0)
+            after = db.get_qualitative_result(expid, "plot")
+            assert after["kind"] == "scatter"
+            assert after["data"][0] == before["data"][0]
+            assert np.array_equal(after["data"][1]["y"], np.arange(3))
+            assert db.get_qualitative_plot_ids(expid) == ["plot"]
+
+            # rows added later are merged with those already moved
+            db.add_qualitative_result_json(expid, 2, "plot", '{"x": 2}')
+            assert len(db.get_qualitative_result(expid, "plot")["data"]) == 3
+            db.move_to_cold_storage(expid)
+            data = db.get_qualitative_result(expid, "plot")["data"]
+            assert [d["epoch"] for d in data] == [0, 2, 1]
+        finally:
+            db.delete_experiments([expid])
+
+
+def test_reads_during_moves_see_every_row_once():
+    expid = f"cold_race_test_{os.getpid()}"
+    with Database() as db, Database() as mover:
+        try:
+            db.set_exp_status(expid, "COMPLETE")
+            for epoch in range(3):
+                db.add_qualitative_result_json(expid, epoch, "plot", "{}")
+
+            done = threading.Event()
+
+            def move():
+                try:
+                    for i in range(20):
+                        mover.add_qualitative_result_json(expid, 3 + i, "plot", "{}")
+                        mover.move_to_cold_storage(expid)
+                finally:
+                    done.set()
+
+            thread = threading.Thread(target=move)
+            thread.start()
+            try:
+                n_rows = 3
+                while not done.is_set():
+                    data = db.get_qualitative_result(expid, "plot")["data"]
+                    epochs = [d["epoch"] for d in data]
+                    assert len(set(epochs)) == len(epochs)
+                    assert len(epochs) >= n_rows
+                    n_rows = len(epochs)
+            finally:
+                thread.join()
+            assert len(db.get_qualitative_result(expid, "plot")["data"]) == 23
+        finally:
+            db.delete_experiments([expid])
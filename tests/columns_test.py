@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+from mldb.database import Database
+from mldb.database.exception import NoDataError
+
+
+def test_loss_columns_from_rows():
+    rows = [("train", 1, 0.5), ("train", 2, 0.25), ("valid", 1, 0.75)]
+    losses = Database.loss_columns_from_rows("exp", rows)
+    assert losses["train"]["epoch"].dtype == np.int32
+    assert losses["train"]["loss"].dtype == np.float64
+    assert np.array_equal(losses["train"]["loss"], [0.5, 0.25])
+    assert np.array_equal(losses["valid"]["epoch"], [1])
+    assert Database.lrs_from_rows([(1, 0.1), (2, 0.05)]) == dict(
+        epochs=[1, 2], lrs=[0.1, 0.05]
+    )
+
+
+def test_columns_round_trip():
+    expid = f"columns_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            with pytest.raises(NoDataError):
+                db.get_metric_history(expid)
+
+            db.add_loss_values(expid, "train", [2, 0, 1], [0.25, 1.0, 0.5])
+            db.add_loss_value(expid, "valid", 0, 0.75)
+            db.add_lr_values(expid, [1, 0], [0.05, 0.1])
+            db.add_metric_values(expid, "acc", [1, 0], [0.6, 0.4])
+            db.add_metric_value(expid, "f1", 1, 0.3)
+
+            losses = db.get_losses(expid, as_arrays=True)
+            assert losses["train"]["epoch"].dtype == np.int32
+            assert np.array_equal(losses["train"]["epoch"], [0, 1, 2])
+            assert np.array_equal(losses["train"]["loss"], [1.0, 0.5, 0.25])
+            lists = db.get_losses(expid)
+            for kind in lists:
+                assert losses[kind]["loss"].tolist() == lists[kind]["loss"]
+
+            lrs = db.get_lrs(expid, as_arrays=True)
+            assert lrs["epochs"].dtype == np.int32
+            assert np.array_equal(lrs["epochs"], [0, 1])
+            assert np.array_equal(lrs["lrs"], [0.1, 0.05])
+
+            history = db.get_metric_history(expid)
+            assert list(history) == ["acc", "f1"]
+            assert np.array_equal(history["acc"]["epoch"], [0, 1])
+            assert np.array_equal(history["acc"]["value"], [0.4, 0.6])
+            assert list(db.get_metric_history(expid, "f1")) == ["f1"]
+        finally:
+            db.delete_experiments([expid])
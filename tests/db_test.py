@@ -32,16 +32,17 @@ def test_db():
 
         db.cursor.execute(
             'SELECT STATUS.EXPID FROM \
-            STATUS INNER JOIN METRICS ON STATUS.EXPID=METRICS.EXPID \
+            STATUS JOIN EXPERIMENTS USING (EXPID) \
+            JOIN METRICS USING (EXPKEY) JOIN KINDS USING (KINDKEY) \
             WHERE STATUS.STATUS=\'COMPLETE\' \
-            AND METRICS.KIND=\'RMSE\' \
-            AND METRICS.EXPID LIKE %s \
+            AND KINDS.KIND=\'RMSE\' \
+            AND STATUS.EXPID LIKE %s \
             ORDER BY METRICS.VALUE ASC LIMIT 1;', (f'{today}_TEST_%',))
 
         rows = db.cursor.fetchall()
         assert len(rows) == 1
         assert rows[0][0] == f'{today}_TEST_2'
 
-        db.cursor.execute('DELETE FROM METRICS WHERE EXPID LIKE %s;', (f'{today}_TEST_%',))
+        db.cursor.execute('DELETE FROM METRICS USING EXPERIMENTS WHERE METRICS.EXPKEY=EXPERIMENTS.EXPKEY AND EXPID LIKE %s;', (f'{today}_TEST_%',))
         db.cursor.execute('DELETE FROM STATUS WHERE EXPID LIKE %s;', (f'{today}_TEST_%',))
         db.conn.commit()
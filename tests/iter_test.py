@@ -0,0 +1,43 @@
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from mldb.database import Database
+
+SERIES = "SELECT generate_series(1, %s);"
+OPEN_CURSORS = "SELECT count(*) FROM pg_cursors WHERE name LIKE 'mldb_iter_%%';"
+
+
+def test_chunk_boundaries():
+    with Database() as db:
+
+        def chunks(n, chunk_size):
+            return [[r[0] for r in c] for c in db.iter_chunks(SERIES, (n,), chunk_size)]
+
+        assert chunks(7, 3) == [[1, 2, 3], [4, 5, 6], [7]]
+        # no empty chunk after an exact multiple
+        assert chunks(6, 3) == [[1, 2, 3], [4, 5, 6]]
+        assert chunks(1, 3) == [[1]]
+        assert chunks(0, 3) == []
+        rows = db.iter_query(SERIES, (5,), chunk_size=2)
+        assert [r[0] for r in rows] == list(range(1, 6))
+        assert db.conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+
+def test_cursor_is_closed_when_iteration_stops_early():
+    with Database() as db:
+        rows = db.iter_query(SERIES, (10,), chunk_size=2)
+        assert next(rows) == (1,)
+        db.cursor.execute(OPEN_CURSORS)
+        assert db.cursor.fetchone()[0] == 1
+
+        rows.close()
+        assert db.conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+        db.cursor.execute(OPEN_CURSORS)
+        assert db.cursor.fetchone()[0] == 0
+
+        # the loop drops the generator, which closes it
+        for row in db.iter_query(SERIES, (10,), chunk_size=2):
+            if row[0] == 3:
+                break
+        db.cursor.execute(OPEN_CURSORS)
+        assert db.cursor.fetchone()[0] == 0
+        assert list(db.iter_query(SERIES, (3,))) == [(1,), (2,), (3,)]
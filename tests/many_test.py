@@ -0,0 +1,44 @@
+import os
+
+from mldb.database import Database
+
+
+def test_experiment_details_many_from_rows():
+    details = Database.experiment_details_many_from_rows(
+        ["a", "b", "c"],
+        [("a", "TRAINING"), ("c", "COMPLETE")],
+        [("a", 1, "train", 0.5), ("a", 2, "train", 0.25)],
+        [("a", 1, 0.1)],
+    )
+    assert list(details) == ["a"]
+    assert details["a"]["losses"]["train"] == dict(loss=[0.5, 0.25], epoch=[1, 2])
+    assert details["a"]["lrs"] == dict(epochs=[1], lrs=[0.1])
+
+
+def test_many_lookups_match_one_at_a_time():
+    expids = [f"many_test_{os.getpid()}_{i}" for i in range(3)]
+    group = f"many_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            for i, expid in enumerate(expids[:2]):
+                db.set_exp_status(expid, "TRAINING")
+                db.add_loss_value(expid, "train", 0, 1.0 + i)
+                db.add_loss_value(expid, "train", 1, 0.5 + i)
+                db.add_lr_value(expid, 0, 0.1)
+                db.add_metric_value(expid, "acc", 1, 0.5 + i)
+                db.add_hyperparam(expid, "lr", "0.1")
+                db.add_to_group(expid, group)
+            # the third has nothing logged
+
+            details = db.get_experiment_details_many(expids)
+            assert list(details) == expids[:2]
+            for expid in expids[:2]:
+                assert details[expid] == db.get_experiment_details(expid)
+
+            metrics = db.get_latest_metrics_many(expids)
+            assert metrics == {e: db.get_latest_metrics(e) for e in expids[:2]}
+            hyperparams = db.get_hyperparams_many(expids)
+            assert hyperparams == {e: db.get_hyperparams(e) for e in expids}
+            assert db.get_groups_of_many_exps(expids) == [group]
+        finally:
+            db.delete_experiments(expids)
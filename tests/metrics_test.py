@@ -0,0 +1,49 @@
+import os
+
+from mldb.database import Database
+
+
+def test_latest_metrics_follow_the_latest_epoch():
+    expid = f"metrics_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            assert db.get_latest_metrics(expid) == dict()
+
+            db.add_metric_value(expid, "acc", 1, 0.1)
+            db.add_metric_value(expid, "f1", 1, 0.2)
+            assert db.get_latest_metrics(expid)["data"] == {"acc": 0.1, "f1": 0.2}
+
+            # a later epoch replaces all the rows, an earlier one is ignored
+            db.add_metric_value(expid, "acc", 3, 0.3)
+            db.add_metric_value(expid, "acc", 2, 0.25)
+            db.add_metric_value(expid, "f1", 2, 0.25)
+            latest = db.get_latest_metrics(expid)
+            assert latest["epoch"] == 3
+            assert latest["data"] == {"acc": 0.3}
+
+            # more kinds of the same epoch, and overwritten values
+            db.add_metric_value(expid, "f1", 3, 0.4)
+            db.add_metric_values(expid, "acc", [3], [0.35], on_conflict="overwrite")
+            assert db.get_latest_metrics(expid)["data"] == {"acc": 0.35, "f1": 0.4}
+
+            # several epochs in one statement, latest first
+            db.add_metric_values(expid, "f1", [5, 4], [0.5, 0.45])
+            latest = db.get_latest_metrics(expid)
+            assert latest["epoch"] == 5
+            assert latest["data"] == {"f1": 0.5}
+
+            # the same as the rows of the latest epoch in METRICS
+            db.cursor.execute(
+                "SELECT KINDKEY, EPOCH, VALUE FROM METRICS WHERE EXPKEY=%s AND "
+                "EPOCH=(SELECT max(EPOCH) FROM METRICS WHERE EXPKEY=%s) ORDER BY 1;",
+                (db.experiment_key(expid),) * 2,
+            )
+            expected = db.cursor.fetchall()
+            db.cursor.execute(
+                "SELECT KINDKEY, EPOCH, VALUE FROM LATESTMETRICS WHERE EXPKEY=%s "
+                "ORDER BY 1;",
+                (db.experiment_key(expid),),
+            )
+            assert db.cursor.fetchall() == expected
+        finally:
+            db.delete_experiments([expid])
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+
+import pytest
+from psycopg2 import connect
+from psycopg2.errors import UniqueViolation
+from psycopg2.extras import execute_values
+
+from mldb.config import CONFIG
+from mldb.database import Database
+from mldb.database.exception import SchemaVersionError
+from mldb.database.migrations import (
+    LATEST_VERSION,
+    REQUIRED_VERSION,
+    get_version,
+    migrate,
+    rekey_table,
+)
+from mldb.database.schema import REGISTRIES, SCHEMA, SCHEMA_BY_TABLE, TABLES
+
+COMMAND_GET_COLUMNS = "SELECT table_name, column_name, data_type, is_nullable FROM information_schema.columns WHERE table_schema=current_schema();"
+COMMAND_GET_UNIQUE = "SELECT conrelid::regclass::text, array_agg(a.attname::text ORDER BY a.attname) FROM pg_constraint c JOIN pg_attribute a ON a.attrelid=c.conrelid AND a.attnum=ANY(c.conkey) WHERE c.contype='u' AND c.connamespace=current_schema()::regnamespace GROUP BY c.oid, c.conrelid;"
+
+
+@contextmanager
+def scratch_schema(name: str):
+    """A connection working in a new, empty schema, dropped afterwards."""
+    conn = connect(**CONFIG.as_dict())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE;")
+            cursor.execute(f"CREATE SCHEMA {name};")
+        conn.commit()
+        # for the rest of the session, also across transactions
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {name};")
+        conn.commit()
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE;")
+        conn.commit()
+        conn.close()
+
+
+def describe(conn) -> tuple:
+    """The columns and unique constraints of the mldb tables, by table."""
+    tables = {t.lower() for t in TABLES}
+    with conn.cursor() as cursor:
+        cursor.execute(COMMAND_GET_COLUMNS)
+        columns = {r for r in cursor.fetchall() if r[0] in tables}
+        cursor.execute(COMMAND_GET_UNIQUE)
+        unique = {(t, tuple(c)) for t, c in cursor.fetchall() if t in tables}
+    conn.commit()
+    return columns, unique
+
+
+def test_migrating_from_scratch_gives_the_current_schema():
+    with scratch_schema("mldb_migrated_test") as conn:
+        assert get_version(conn) == 0
+        assert migrate(conn) == list(range(1, LATEST_VERSION + 1))
+        assert get_version(conn) == LATEST_VERSION
+        assert migrate(conn) == []
+        migrated = describe(conn)
+
+    with scratch_schema("mldb_created_test") as conn:
+        with conn.cursor() as cursor:
+            for command in SCHEMA:
+                cursor.execute(command)
+        conn.commit()
+        assert migrated == describe(conn)
+
+
+def test_too_old_schema_is_refused():
+    with scratch_schema("mldb_old_test") as conn:
+        migrate(conn, target=REQUIRED_VERSION - 1)
+        assert get_version(conn) == REQUIRED_VERSION - 1
+
+        with Database(pooled=False) as db:
+            db.cursor.execute("SET search_path TO mldb_old_test;")
+            db.conn.commit()
+            with pytest.raises(SchemaVersionError):
+                db.ensure_schema(force=True)
+
+
+def test_rekeying_keeps_the_rows_of_a_populated_database():
+    with scratch_schema("mldb_rekey_test") as conn:
+        migrate(conn, target=3, log=lambda message: None)
+        losses = [
+            (f"exp{x}", k, e, e / 10)
+            for x in range(7)
+            for k in "ab"
+            for e in range(100)
+        ]
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor, "INSERT INTO LOSS (EXPID, KIND, EPOCH, VALUE) VALUES %s", losses
+            )
+            cursor.execute(
+                "INSERT INTO LEARNINGRATE (EXPID, EPOCH, VALUE) VALUES ('exp0', 0, '0.1');"
+            )
+            # no unique key: both rows stay
+            cursor.execute(
+                "INSERT INTO QUALITATIVERESULTS (EXPID, EPOCH, PLOTID, VALUE) "
+                "VALUES ('exp0', 0, 'p', '{}'), ('exp0', 0, 'p', '{}');"
+            )
+            cursor.execute(
+                "INSERT INTO STEPS (EXPID, KIND, STEP, VALUE) VALUES ('exp1', 'a', 5, 0.5);"
+            )
+            for registry in REGISTRIES:
+                cursor.execute(SCHEMA_BY_TABLE[registry])
+        conn.commit()
+
+        # a writer on the old layout, between two batches
+        def write_meanwhile(message):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO LOSS (EXPID, KIND, EPOCH, VALUE) "
+                    "VALUES ('late', 'c', 0, 1.0) ON CONFLICT DO NOTHING;"
+                )
+            conn.commit()
+
+        rekey_table(
+            "LOSS",
+            ["EXPERIMENTS", "KINDS"],
+            ["EXPKEY", "EPOCH", "KINDKEY"],
+            batch_pages=2,
+            log=write_meanwhile,
+        )(conn)
+        migrate(conn, log=lambda message: None)
+
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXPID, KIND, EPOCH, VALUE FROM LOSS JOIN EXPERIMENTS USING (EXPKEY) "
+                "JOIN KINDS USING (KINDKEY) ORDER BY 1, 2, 3;"
+            )
+            assert cursor.fetchall() == sorted(losses + [("late", "c", 0, 1.0)])
+            cursor.execute("SELECT EXPKEY, EPOCH, VALUE FROM LEARNINGRATE;")
+            assert cursor.fetchall() == [(1, 0, 0.1)]
+            cursor.execute(
+                "SELECT count(*) FROM QUALITATIVERESULTS JOIN PLOTS USING (PLOTKEY);"
+            )
+            assert cursor.fetchone()[0] == 2
+            cursor.execute(
+                "SELECT EXPID, KIND, STEP FROM STEPS JOIN EXPERIMENTS USING (EXPKEY) "
+                "JOIN KINDS USING (KINDKEY);"
+            )
+            assert cursor.fetchall() == [("exp1", "a", 5)]
+            with pytest.raises(UniqueViolation):
+                cursor.execute(
+                    "INSERT INTO LOSS (EXPKEY, KINDKEY, EPOCH, VALUE) "
+                    "SELECT EXPKEY, KINDKEY, EPOCH, VALUE FROM LOSS LIMIT 1;"
+                )
+        conn.rollback()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from mldb.database.exception import NoDataError
+from mldb.database.mirror import Mirror
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    with Mirror(str(tmp_path / "mirror.sqlite")) as m:
+        m.apply_rows("STATUS", [("a", "COMPLETE"), ("b", "TRAINING")])
+        m.apply_rows(
+            "LOSS", [("a", e, k, e / 10) for k in ("valid", "train") for e in range(3)]
+        )
+        m.apply_rows("LEARNINGRATE", [("a", 1, 0.01), ("a", 0, 0.1)])
+        m.apply_rows("HYPERPARAMS", [("a", "lr", "0.1"), ("b", "lr", "0.2")])
+        m.apply_rows("EXPGROUPS", [("a", "g1"), ("a", "g2"), ("b", "g1")])
+        m.apply_rows("LATESTMETRICS", [("a", 1, "acc", 0.5), ("a", 2, "f1", 0.7)])
+        yield m
+
+
+def test_mirror_reads_like_database(mirror):
+    assert mirror.get_status("a") == "COMPLETE"
+    losses = mirror.get_losses("a")
+    assert list(losses) == ["train", "valid"]
+    assert losses["train"] == dict(loss=[0.0, 0.1, 0.2], epoch=[0, 1, 2])
+    columns = mirror.get_losses("a", as_arrays=True)
+    assert columns["valid"]["epoch"].dtype == np.int32
+    assert mirror.get_lrs("a") == dict(epochs=[0, 1], lrs=[0.1, 0.01])
+    assert mirror.get_hyperparams_many(["a", "c"]) == dict(a=dict(lr="0.1"), c=dict())
+    assert mirror.get_groups_many(["a", "b"]) == dict(a=["g1", "g2"], b=["g1"])
+
+    # a row left over from an earlier epoch is ignored
+    assert mirror.get_latest_metrics("a") == dict(expid="a", epoch=2, data=dict(f1=0.7))
+    assert mirror.get_latest_metrics_many(["a", "b"]) == dict(
+        a=dict(expid="a", epoch=2, data=dict(f1=0.7))
+    )
+    assert list(mirror.get_experiment_details_many(["a", "b"])) == ["a"]
+
+
+def test_mirror_applies_updates_and_deletions(mirror):
+    mirror.apply_rows("STATUS", [("b", "COMPLETE")])
+    assert mirror.get_status("b") == "COMPLETE"
+
+    mirror.apply_deletions([("a", "g1"), ("b", None)])
+    assert mirror.get_groups_many(["a", "b"]) == dict(a=["g2"], b=[])
+    with pytest.raises(NoDataError):
+        mirror.get_status("b")
+    assert mirror.get_hyperparams("b") == dict()
+
+    mirror.cursor.execute(
+        "SELECT EXPID, STATUS FROM STATUS WHERE EXPID LIKE %s;", ["%a%"]
+    )
+    assert mirror.cursor.fetchall() == [("a", "COMPLETE")]
+
+
+def test_mirror_iter_chunks(mirror):
+    query = "SELECT EXPID, EPOCH FROM LOSS WHERE KIND=%s ORDER BY EPOCH;"
+    chunks = list(mirror.iter_chunks(query, ("train",), chunk_size=2))
+    assert chunks == [[("a", 0), ("a", 1)], [("a", 2)]]
+    assert list(mirror.iter_query(query, ("valid",))) == [("a", e) for e in range(3)]
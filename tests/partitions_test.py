@@ -0,0 +1,37 @@
+from psycopg2 import connect
+
+from mldb.config import CONFIG
+from mldb.database.partitions import get_partitions, partition_table
+
+
+def test_partition_table_copies_columns_by_name():
+    conn = connect(**CONFIG.as_dict())
+    schema = "mldb_partitions_test"
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {schema}; SET search_path TO {schema};")
+            # the columns of an older table, in another order than the schema's
+            cursor.execute(
+                "CREATE TABLE STEPS (VALUE DOUBLE PRECISION NOT NULL, "
+                "WALLTIME TIMESTAMPTZ NOT NULL DEFAULT now(), STEP INTEGER NOT NULL, "
+                "KINDKEY INTEGER NOT NULL, EXPKEY INTEGER NOT NULL);"
+            )
+            cursor.execute(
+                "INSERT INTO STEPS (EXPKEY, KINDKEY, STEP, VALUE) VALUES "
+                "(1, 2, 3, 0.5), (4, 5, 6, 1.5);"
+            )
+        conn.commit()
+
+        partition_table("STEPS", 2)(conn)
+        assert get_partitions(conn, "STEPS") == ["steps_p0", "steps_p1"]
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXPKEY, KINDKEY, STEP, VALUE FROM STEPS ORDER BY EXPKEY;"
+            )
+            assert cursor.fetchall() == [(1, 2, 3, 0.5), (4, 5, 6, 1.5)]
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+        conn.commit()
+        conn.close()
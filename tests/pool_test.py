@@ -0,0 +1,30 @@
+from psycopg2 import connect
+
+from mldb.config import CONFIG
+from mldb.database.pool import ConnectionPool
+
+
+def test_getconn_replaces_dead_connections():
+    pool = ConnectionPool(CONFIG.as_dict(), minconn=2, maxconn=2)
+    try:
+        pids = []
+        for conn in list(pool.idle):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid();")
+                pids.append(cursor.fetchone()[0])
+            conn.rollback()
+        # the server drops one of the idle connections, as on a restart
+        with connect(**CONFIG.as_dict()) as killer, killer.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s);", (pids[0],))
+        killer.close()
+
+        conns = [pool.getconn(), pool.getconn()]
+        for conn in conns:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            pool.putconn(conn)
+        stats = pool.stats()
+        assert stats["replaced"] == 1 and stats["open"] == 2
+        assert stats["connections_opened"] == 3
+    finally:
+        pool.closeall()
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from mldb.database import Database
+
+
+def test_array_encoding_round_trip():
+    output = np.linspace(0, 1, 100, dtype=np.float32)
+    target = torch.tensor([[1, 2, 3]], dtype=torch.int16)
+
+    decoded = Database.decode_arrays(
+        memoryview(
+            Database.encode_arrays(
+                output=output, target=target, xlabel="size", scale=0.5, n=3
+            )
+        )
+    )
+
+    assert decoded["output"].dtype == np.float32
+    assert np.array_equal(decoded["output"], output)
+    assert decoded["target"].shape == (1, 3)
+    assert np.array_equal(decoded["target"], target.numpy())
+    assert decoded["xlabel"] == "size" and isinstance(decoded["xlabel"], str)
+    assert decoded["scale"] == 0.5 and isinstance(decoded["scale"], float)
+    assert decoded["n"] == 3 and isinstance(decoded["n"], int)
+
+
+def test_binary_and_json_results_round_trip():
+    expid = f"qualitative_test_{os.getpid()}"
+    output = np.random.rand(4, 3).astype(np.float32)
+    target = torch.arange(4, dtype=torch.int64)
+    with Database() as db:
+        try:
+            db.add_qualitative_metadata(expid, "plot", "image")
+            db.add_qualitative_result(
+                expid, 0, "plot", output, target, encoding="binary", note="x"
+            )
+            db.add_qualitative_result(expid, 1, "plot", output, target, note="x")
+            with pytest.raises(ValueError):
+                db.add_qualitative_result(expid, 2, "plot", output, encoding="csv")
+
+            result = db.get_qualitative_result(expid, "plot")
+            assert result["kind"] == "image"
+            as_json, as_arrays = result["data"]
+            assert as_arrays["epoch"] == 0 and as_json["epoch"] == 1
+            assert as_arrays["output"].dtype == np.float32
+            assert np.array_equal(as_arrays["output"], output)
+            assert np.array_equal(as_arrays["target"], target.numpy())
+            assert as_arrays["note"] == as_json["note"] == "x"
+            assert np.allclose(as_json["output"], output)
+            assert as_json["target"] == target.tolist()
+        finally:
+            db.delete_experiments([expid])
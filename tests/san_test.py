@@ -23,3 +23,36 @@ def test_sanitisation():
 
     json.dumps(BaseDatabase.sanitise_value(torch.tensor([1, 2, 3], dtype=torch.int32)))
     json.dumps(BaseDatabase.sanitise_value(torch.tensor([[1.], [2], [3.]], dtype=torch.float64)))
+
+
+def sanitise_value_generic(v):
+    """Element-by-element sanitisation, as sanitise_value did before its array
+    fast path."""
+    if isinstance(v, (str, int, float)):
+        return v
+    elif hasattr(v, "detach") and hasattr(v, "cpu") and hasattr(v, "numpy"):
+        return sanitise_value_generic(v.detach().cpu().numpy())
+    elif isinstance(v, np.floating):
+        return float(v)
+    elif isinstance(v, np.integer):
+        return int(v)
+    elif hasattr(v, "__iter__"):
+        return [sanitise_value_generic(vi) for vi in v]
+    else:
+        raise ValueError(f"Unexpected type encountered: {type(v)}.")
+
+
+def test_sanitisation_fast_path_matches_generic():
+    values = [
+        np.random.rand(4, 5).astype(np.float32),
+        np.array([np.nan, np.inf, -np.inf, 0.5], dtype=np.float16),
+        np.arange(10, dtype=np.uint16).reshape(2, 5),
+        np.int64(3),
+        np.float32(0.25),
+        [np.zeros(3), (1, 2)],
+        torch.rand(3, 2),
+    ]
+    for v in values:
+        fast = BaseDatabase.sanitise_value(v)
+        generic = sanitise_value_generic(v)
+        assert json.dumps(fast) == json.dumps(generic)
@@ -0,0 +1,60 @@
+from psycopg2 import connect
+
+from mldb.config import CONFIG
+from mldb.database.migrations import COMMAND_IS_EXTENSION_AVAILABLE, migrate
+from mldb.database.mirror import Mirror
+from mldb.database.search import escape_like, parse, search_query
+
+
+def test_parse_and_escape():
+    assert parse("RegressExp  !PLS fold_1 !") == (["regressexp", "fold_1"], ["pls"])
+    assert escape_like("50%_a\\b") == "50\\%\\_a\\\\b"
+    query, args = search_query("a_b !c", limit=10)
+    assert query.count("%s") == len(args) == 12
+    assert args[:4] == ["a\\_b\n%", "%c%", 10, "a\\_b%"]
+
+
+def test_search_ranks_matches(tmp_path):
+    docs = dict(
+        reg="reg\ncomplete\ng1\n0.1",
+        reg_fold1="reg_fold1\ncomplete\ng1\n0.1",
+        old_reg="old_reg\nfailed\ng2",
+        other="other\ncomplete\nreg_group",
+        zz="zz\ntraining",
+    )
+    with Mirror(str(tmp_path / "mirror.sqlite")) as m:
+        m.apply_rows(
+            "SEARCHINDEX",
+            [(e, d.split("\n")[1].upper(), d) for e, d in docs.items()],
+        )
+        assert [e for e, _ in m.search("Reg")] == [
+            "reg",
+            "reg_fold1",
+            "other",
+            "old_reg",
+        ]
+        assert [e for e, _ in m.search("reg !fold g1")] == ["reg"]
+        assert [e for e, _ in m.search("reg", limit=2)] == ["reg", "reg_fold1"]
+        assert m.search("!reg") == [("zz", "TRAINING")]
+        assert len(m.search("")) == 5
+        # "_" is a character, not a wildcard
+        assert m.search("reg_g") == [("other", "COMPLETE")]
+
+
+def test_migrate_rechecks_trigram_index(capsys):
+    conn = connect(**CONFIG.as_dict())
+    try:
+        # already at the latest version: no migration runs, the check still does
+        assert migrate(conn) == []
+        with conn.cursor() as cursor:
+            cursor.execute(COMMAND_IS_EXTENSION_AVAILABLE, ("pg_trgm",))
+            available = cursor.fetchone()[0]
+            cursor.execute("SELECT to_regclass('SEARCHINDEX_DOC_TRGM') IS NOT NULL;")
+            indexed = cursor.fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+    if available:
+        assert indexed
+    else:
+        assert "pg_trgm isn't available" in capsys.readouterr().out
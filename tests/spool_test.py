@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from mldb.database import Database
+from mldb.database.spool import (
+    Journal,
+    REPLAYING,
+    SEALED,
+    claim_segment,
+    decode_call,
+    recover_orphans,
+    replay,
+)
+
+
+def test_journal_segments(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.append("add_loss_value", ("exp", "train", 1, np.float32(0.5)), {})
+    journal.append("set_exp_status", ("exp", "COMPLETE"), {})
+    assert not list(tmp_path.glob("*" + SEALED))
+
+    journal.seal()
+    (segment,) = tmp_path.glob("*" + SEALED)
+    with open(segment) as f:
+        calls = [decode_call(line) for line in f]
+    assert calls == [
+        ("add_loss_value", ("exp", "train", 1, 0.5), {}),
+        ("set_exp_status", ("exp", "COMPLETE"), {}),
+    ]
+
+    claimed = claim_segment(str(segment))
+    assert claimed is not None and os.path.exists(claimed)
+    assert claim_segment(str(segment)) is None
+
+
+def test_recover_orphans_of_dead_process(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.append("set_exp_status", ("exp", "TRAINING"), {})
+
+    # a live owner's segment is left alone
+    recover_orphans(str(tmp_path))
+    assert not list(tmp_path.glob("*" + SEALED))
+
+    # pretend the owner has gone: no process will have this pid
+    journal.file.close()
+    (open_segment,) = tmp_path.glob("*.open")
+    dead = open_segment.name.replace(f"_{os.getpid()}_", "_99999999_")
+    open_segment.rename(tmp_path / dead)
+
+    recover_orphans(str(tmp_path))
+    assert len(list(tmp_path.glob("*" + SEALED))) == 1
+
+
+# replays the segment, dying as the third qualitative result is written
+KILLED_REPLAY = """
+import os, sys
+from mldb.database import Database
+from mldb.database.spool import replay
+
+class Dying(Database):
+    n = 0
+
+    def add_qualitative_result(self, *args, **kwargs):
+        Dying.n += 1
+        if Dying.n == 3:
+            os._exit(1)
+        return super().add_qualitative_result(*args, **kwargs)
+
+with Dying() as db:
+    replay(sys.argv[1], db)
+"""
+
+
+def test_replay_resumes_after_crash_without_duplicates(tmp_path):
+    expid = f"spool_test_{os.getpid()}"
+    journal = Journal(str(tmp_path))
+    journal.append("set_exp_status", (expid, "TRAINING"), {})
+    for epoch in range(5):
+        journal.append("add_loss_value", (expid, "train", epoch, 0.5), {})
+        journal.append("add_hyperparam", (expid, f"p{epoch}", "x"), {})
+        journal.append("add_qualitative_result", (expid, epoch, "plot0", [1, 2]), {})
+    journal.append("set_exp_status", (expid, "COMPLETE"), {})
+    journal.seal()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child = subprocess.run(
+        [sys.executable, "-c", KILLED_REPLAY, str(tmp_path)],
+        cwd=root,
+        env=dict(os.environ, PYTHONPATH=root),
+    )
+    assert child.returncode == 1
+    assert list(tmp_path.glob("*" + REPLAYING))
+
+    with Database(cached=False) as db:
+        try:
+            replay(str(tmp_path), db)
+            assert not list(tmp_path.iterdir())
+            assert db.get_status(expid) == "COMPLETE"
+            assert db.get_losses(expid)["train"]["epoch"] == list(range(5))
+            assert len(db.get_hyperparams(expid)) == 5
+            db.cursor.execute(
+                "SELECT EPOCH FROM QUALITATIVERESULTS JOIN EXPERIMENTS USING (EXPKEY) "
+                "WHERE EXPID=%s ORDER BY EPOCH;",
+                (expid,),
+            )
+            assert [row[0] for row in db.cursor.fetchall()] == list(range(5))
+        finally:
+            db.delete_experiments([expid])
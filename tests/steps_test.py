@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import pytest
+
+from mldb.database import Database
+from mldb.database.exception import NoDataError
+
+
+def test_step_values_round_trip():
+    expid = f"steps_test_{os.getpid()}"
+    with Database() as db:
+        try:
+            with pytest.raises(NoDataError):
+                db.get_step_values(expid)
+
+            # one at a time, unbuffered and buffered, out of order
+            db.add_step_value(expid, "grad_norm", 2, 0.5, walltime=1000.0)
+            with db.buffered(flush_interval=1e9):
+                db.add_step_value(expid, "grad_norm", 0, 1.5, walltime=998.0)
+                db.add_step_value(expid, "grad_norm", 1, 1.0, walltime=999.0)
+            # in bulk
+            db.add_step_values(expid, "loss", [20, 10, 0], [0.2, 0.1, 0.0])
+            db.add_step_values(
+                expid, "loss", [10, 10, 30], [1.0, 2.0, 3.0], on_conflict="overwrite"
+            )
+
+            steps = db.get_step_values(expid)
+            assert list(steps) == ["grad_norm", "loss"]
+            grad_norm = steps["grad_norm"]
+            assert grad_norm["step"].dtype == np.int64
+            assert grad_norm["step"].tolist() == [0, 1, 2]
+            assert grad_norm["value"].tolist() == [1.5, 1.0, 0.5]
+            assert grad_norm["walltime"].tolist() == [998.0, 999.0, 1000.0]
+
+            loss = db.get_step_values(expid, "loss")
+            assert list(loss) == ["loss"]
+            # the last of the duplicated steps wins
+            assert loss["loss"]["step"].tolist() == [0, 10, 20, 30]
+            assert loss["loss"]["value"].tolist() == [0.0, 2.0, 0.2, 3.0]
+        finally:
+            db.delete_experiments([expid])
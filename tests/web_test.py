@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from mldb.database import Change, Database
+from mldb.server.web_app import MLDB_Handler, PooledHTTPServer
+
+
+@contextmanager
+def serving(handler, workers: int):
+    """Base URL of a PooledHTTPServer running `handler` on a free port."""
+    server = PooledHTTPServer(("localhost", 0), handler, workers)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield f"http://localhost:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test_status_page_query():
+    query, args = Database.status_page_query(limit=20)
+    assert "UNION" not in query and "WHERE TRUE" in query
+    assert args == [20, 20]
+
+    query, args = Database.status_page_query(
+        ["ERROR", "CANCELLED"], group="g", after="exp_5", newest_first=False
+    )
+    assert query.count("UNION ALL") == 1 and "EXPID > %s" in query
+    assert query.count("%s") == len(args)
+    assert args == ["ERROR", "exp_5", "g", 50, "CANCELLED", "exp_5", "g", 50, 50]
+
+
+def test_cursor_round_trip():
+    for expid in ["20220803_091702_TestModel_fold3", "ünïcode/?&="]:
+        cursor = MLDB_Handler.encode_cursor(expid)
+        assert cursor.isascii() and "/" not in cursor
+        assert MLDB_Handler.decode_cursor(cursor) == expid
+    with pytest.raises(ValueError):
+        MLDB_Handler.decode_cursor("%%%")
+
+
+def test_changes_missed_and_full_refresh(monkeypatch):
+    monkeypatch.setattr(MLDB_Handler, "versions", dict())
+    monkeypatch.setattr(MLDB_Handler, "min_version", 0)
+    handler = MLDB_Handler.__new__(MLDB_Handler)
+    handler.get_experiment_details = lambda expid: dict(kind="details")
+
+    def check(version, fetched=None):
+        query = dict(show="changes", expid="a", version=str(version))
+        if fetched is not None:
+            query["fetched"] = str(fetched)
+        return handler.get_changes(query)["kind"]
+
+    assert check(0, time.time()) == "unchanged"
+    MLDB_Handler.experiment_changed(Change("a", "LOSS", 1))
+    version = MLDB_Handler.version_of("a")
+    assert check(0, time.time()) == "details"
+    assert check(version, time.time()) == "unchanged"
+    # fetched too long ago: sent again, in case a notification was lost
+    assert check(version, time.time() - MLDB_Handler.FULL_REFRESH_PERIOD) == "details"
+
+    # the listener reconnected: any experiment may have changed
+    MLDB_Handler.changes_missed()
+    assert check(version, time.time()) == "details"
+    assert MLDB_Handler.version_of("never_seen") == MLDB_Handler.min_version > 0
+
+
+def test_details_version_read_before_data(monkeypatch):
+    monkeypatch.setattr(MLDB_Handler, "versions", dict())
+    monkeypatch.setattr(MLDB_Handler, "min_version", 0)
+
+    class ChangingDB:
+        def get_experiment_details(self, expid):
+            # notified while the page's data is being read
+            MLDB_Handler.experiment_changed(Change(expid, "LOSS", 1))
+            return dict(status="TRAINING")
+
+        def get_hyperparams(self, expid):
+            return dict()
+
+        def get_latest_metrics(self, expid):
+            return dict()
+
+    handler = MLDB_Handler.__new__(MLDB_Handler)
+    handler._db = ChangingDB()
+    query = handler.get_experiment_details("a")["refresh"]["query"]
+    assert query["version"] != MLDB_Handler.version_of("a")
+    assert handler.get_changes(query)["kind"] == "details"
+
+
+def test_server_handles_requests_on_its_workers():
+    lock = threading.Lock()
+    active = [0, 0]  # now, most at once
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.2)
+            with lock:
+                active[0] -= 1
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(threading.current_thread().name.encode())
+
+        def log_message(self, *args):
+            pass
+
+    with serving(SlowHandler, workers=3) as url:
+        with ThreadPoolExecutor(6) as clients:
+            start = time.monotonic()
+            threads = list(
+                clients.map(lambda _: urlopen(url).read().decode(), range(6))
+            )
+            elapsed = time.monotonic() - start
+    assert active[1] == 3
+    assert all(t.startswith("mldb-web") for t in threads)
+    # two rounds of three, not six one after the other
+    assert elapsed < 0.2 * 6
+
+
+def test_api_pages_through_a_table():
+    group = f"web_test_{os.getpid()}"
+    expids = [f"{group}_{i}" for i in range(5)]
+    with Database() as db:
+        try:
+            for i, expid in enumerate(expids):
+                db.set_exp_status(expid, "COMPLETE" if i % 2 else "TRAINING")
+                db.add_to_group(expid, group)
+
+            def get(url):
+                with urlopen(url) as response:
+                    return json.loads(response.read())
+
+            with serving(MLDB_Handler, workers=2) as url:
+                pages = [get(f"{url}/api/status?group={group}&limit=2")]
+                while pages[-1]["next"] is not None:
+                    pages.append(get(url + pages[-1]["next"]))
+                oldest = get(f"{url}/api/completed?group={group}&order=oldest")
+
+                with pytest.raises(HTTPError) as error:
+                    urlopen(f"{url}/api/status?group={group}&cursor=%25%25%25")
+                assert error.value.code == 400
+                assert "bad query" in json.loads(error.value.read())["why"]
+
+            assert [len(p["experiments"]) for p in pages] == [2, 2, 1]
+            listed = [e["expid"] for p in pages for e in p["experiments"]]
+            assert listed == expids[::-1]
+            assert [e["expid"] for e in oldest["experiments"]] == expids[1::2]
+            assert oldest["next"] is None
+        finally:
+            db.delete_experiments(expids)